@@ -0,0 +1,78 @@
+# FC92_Club/sessions.py
+"""
+Database sessions that only write when there is something to write.
+
+With SESSION_SAVE_EVERY_REQUEST the session middleware saves every session
+it touched, which on the stock db backend is an UPDATE of django_session
+on every page view. This store skips that save unless the data changed or
+the stored expiry has fallen more than SESSION_REFRESH_AFTER seconds
+behind the sliding SESSION_COOKIE_AGE window, so a session is rewritten at
+most once per SESSION_REFRESH_AFTER while it is only being read. The
+expiry kept in the table therefore lags the cookie by up to that much.
+
+Sessions are not cached: each request reads its row, as with the stock db
+backend. The session holds state that has to survive the next request on
+any gunicorn worker (pending bank import rows, the member import error
+report), and a per-worker cache would serve stale copies, let a stale copy
+overwrite another worker's write, and keep accepting a session that was
+ended elsewhere.
+
+purge_expired() deletes expired rows in batches; it backs both the
+purge_sessions command and Django's clearsessions.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore as DBStore
+from django.utils import timezone
+
+PURGE_BATCH_SIZE = 1000
+
+
+class SessionStore(DBStore):
+    def __init__(self, session_key=None):
+        self._stored_expiry = None  # expire_date of the row as loaded or last written
+        super().__init__(session_key)
+
+    def load(self):
+        s = self._get_session_from_db()
+        if not s:
+            return {}
+        self._stored_expiry = s.expire_date
+        return self.decode(s.session_data)
+
+    def needs_refresh(self):
+        """True when the stored expiry lags the sliding window by SESSION_REFRESH_AFTER or more."""
+        if self._stored_expiry is None:
+            return True
+        refresh_after = timedelta(seconds=getattr(settings, 'SESSION_REFRESH_AFTER', 0))
+        return self.get_expiry_date() - self._stored_expiry >= refresh_after
+
+    def save(self, must_create=False):
+        if not (must_create or self.modified or self.needs_refresh()):
+            return
+        super().save(must_create)
+        self._stored_expiry = self.get_expiry_date()
+
+    @classmethod
+    def clear_expired(cls):
+        purge_expired()
+
+
+def purge_expired(batch_size=PURGE_BATCH_SIZE, now=None):
+    """
+    Delete expired sessions, `batch_size` rows per statement through the
+    expire_date index, so a large backlog never holds one long delete.
+    Returns the number of rows deleted.
+    """
+    model = SessionStore.get_model_class()
+    now = now or timezone.now()
+    deleted = 0
+    while True:
+        keys = list(
+            model.objects.filter(expire_date__lt=now).order_by('expire_date')
+            .values_list('session_key', flat=True)[:batch_size]
+        )
+        if not keys:
+            return deleted
+        deleted += model.objects.filter(session_key__in=keys).delete()[0]
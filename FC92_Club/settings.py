@@ -224,6 +224,9 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Custom User Model
 AUTH_USER_MODEL = 'users.User'
 
+# Loads the profile with request.user so role checks cost no queries (users.roles)
+AUTHENTICATION_BACKENDS = ['users.backends.ProfileBackend']
+
 # Crispy Forms Settings
 CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 CRISPY_TEMPLATE_PACK = "bootstrap5"
@@ -263,11 +266,30 @@ else:
 
 
 # Session settings
-SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+# Database sessions that skip the per-request UPDATE unless something changed (FC92_Club/sessions.py)
+SESSION_ENGINE = 'FC92_Club.sessions'
 SESSION_COOKIE_AGE = 86400  # 24 hours
 # Ensure these are True only if your site is served over HTTPS in production
 SESSION_COOKIE_SECURE = not DEBUG # True in production, False in Debug
-SESSION_SAVE_EVERY_REQUEST = True
+SESSION_SAVE_EVERY_REQUEST = True  # Sliding expiry; the row itself is refreshed at most hourly
+SESSION_REFRESH_AFTER = 3600
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # users.lookup results. A change to a member retires them through a generation
+    # number kept in this cache; with a process-local backend only the worker that
+    # made the change sees the bump, and the others serve their old results until
+    # MEMBER_LOOKUP_CACHE_TIMEOUT. Point this at a shared backend (DatabaseCache,
+    # Redis) to retire them in every worker at once.
+    'member_lookup': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'member_lookup',
+    },
+}
+MEMBER_LOOKUP_CACHE_ALIAS = 'member_lookup'
+MEMBER_LOOKUP_CACHE_TIMEOUT = 30  # Seconds; how stale another worker's lookups can get
 
 # CSRF Settings
 # Ensure these are True only if your site is served over HTTPS in production
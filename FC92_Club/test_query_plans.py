@@ -0,0 +1,127 @@
+"""
+Query-plan regression tests.
+
+Each test renders a view against a seeded database, runs EXPLAIN on the SQL
+it issued and fails if a query reads one of the large tables with a full
+table scan instead of an index. On PostgreSQL sequential scans are disabled
+for the EXPLAIN so the planner reports whether a usable index exists even
+though the test tables are small.
+"""
+import re
+from datetime import date
+from decimal import Decimal
+
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from finances.models import Due, Payment
+from gallery.models import Event, Photo
+from pages.models import Announcement
+from users import invitations
+from users.directory import encode_cursor
+from users.models import Profile, User
+
+LARGE_TABLES = ('finances_due', 'finances_payment', 'pages_announcement', 'gallery_photo', 'users_profile', 'users_user')
+
+
+def full_scans(sql):
+    """Names of the large tables that the plan for `sql` reads with a full table scan."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute(f'EXPLAIN {sql}')
+            plan = [row[0] for row in cursor.fetchall()]
+            pattern = re.compile(r'Seq Scan on (\w+)')
+        else:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            plan = [row[-1] for row in cursor.fetchall()]
+            # "SCAN table" without "USING ... INDEX" is a full table scan
+            pattern = re.compile(r'^SCAN (\w+)(?!.*USING)')
+    return {match.group(1) for line in plan for match in [pattern.search(line)] if match} & set(LARGE_TABLES)
+
+
+class QueryPlanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('chair', 'chair@example.com', 'pass')
+        cls.admin.profile.role = 'ADM'
+        cls.admin.profile.save()
+        cls.member = User.objects.create_user('member', 'member@example.com', 'pass')
+        for n in range(30):
+            other = User.objects.create_user(f'other{n}', f'other{n}@example.com', 'pass').profile
+            Due.objects.create(member=other, amount_due=Decimal('5.00'), description='Levy', due_date=date(2025, 1, 1))
+        for month in range(1, 13):
+            Due.objects.create(member=cls.member.profile, amount_due=Decimal('10.00'), description='Subscription', due_date=date(2025, month, 1))
+            Payment.objects.create(member=cls.member.profile, amount_paid=Decimal('10.00'), payment_date=date(2025, month, 2))
+
+        for n in range(20):
+            Announcement.objects.create(title=f'Notice {n}', content='...', is_published=n % 2 == 0)
+        cls.event = Event.objects.create(
+            title='Reunion', description='...', date=timezone.now(), location='Lagos', created_by=cls.admin, is_published=True,
+        )
+        other_event = Event.objects.create(title='AGM', description='...', date=timezone.now(), location='Abuja', created_by=cls.admin)
+        for n in range(10):
+            Photo.objects.create(event=cls.event, image=f'reunion{n}.jpg', uploaded_by=cls.admin)
+            Photo.objects.create(event=other_event, image=f'agm{n}.jpg', uploaded_by=cls.admin)
+
+        invited = User.objects.create_user('invited', 'invited@example.com', is_active=False)
+        _, cls.invitation_token = invitations.issue(invited.profile)
+
+    def assertNoFullScans(self, url, user=None):
+        if user:
+            self.client.force_login(user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertLess(response.status_code, 400)
+
+        offenders = []
+        for query in queries.captured_queries:
+            sql = query['sql']
+            if not sql.lstrip().upper().startswith('SELECT') or not any(table in sql for table in LARGE_TABLES):
+                continue
+            scanned = full_scans(sql)
+            if scanned:
+                offenders.append(f"{', '.join(sorted(scanned))}: {sql}")
+        self.assertFalse(offenders, 'Full table scans in %s:\n%s' % (url, '\n'.join(offenders)))
+
+    def test_home_page(self):
+        self.assertNoFullScans(reverse('pages:home'))
+
+    def test_announcement_list(self):
+        self.assertNoFullScans(reverse('pages:announcement_list'), self.member)
+
+    def test_event_detail(self):
+        self.assertNoFullScans(reverse('gallery:event_detail', args=[self.event.pk]), self.member)
+
+    def test_profile_view(self):
+        self.assertNoFullScans(reverse('users:profile_view'), self.member)
+
+    def test_member_financial_detail(self):
+        self.assertNoFullScans(reverse('users:member_financial_detail', args=[self.member.pk]), self.admin)
+
+    def test_member_financial_status(self):
+        self.assertNoFullScans(reverse('finances:my_financial_status'), self.member)
+
+    def test_accept_invitation(self):
+        self.assertNoFullScans(reverse('users:accept_invitation', args=[self.invitation_token]))
+
+    def test_member_autocomplete(self):
+        for query in ('oth', 'other1 oth', 'Member@', '0803'):
+            caches['member_lookup'].clear()  # Lookups are cached; make the view query
+            self.assertNoFullScans(reverse('users:member_lookup') + f'?q={query}', self.admin)
+
+    def test_active_member_lookup(self):
+        sql, params = Profile.objects.filter(status='ACT').order_by().values('pk').query.sql_with_params()
+        with connection.cursor() as cursor:
+            sql = connection.ops.last_executed_query(cursor, sql, params)
+        self.assertFalse(full_scans(sql))
+
+    def test_member_directory(self):
+        url = reverse('users:member_list')
+        self.assertNoFullScans(url, self.admin)
+        # Later pages start from the keyset cursor, not an OFFSET
+        self.assertNoFullScans(f'{url}?cursor={encode_cursor(self.member.profile)}')
@@ -0,0 +1,98 @@
+"""Tests for the write-coalescing session store in FC92_Club.sessions."""
+from datetime import timedelta
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from users.models import User
+from .sessions import SessionStore
+
+
+def session_queries(queries):
+    return [query['sql'].split()[0] for query in queries if 'django_session' in query['sql']]
+
+
+class SessionStoreTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.member = User.objects.create_user('member', 'member@example.com', 'pass')
+
+    def setUp(self):
+        self.client.force_login(self.member)
+        self.url = reverse('pages:announcement_list')
+
+    def test_read_only_requests_only_read_the_session(self):
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(session_queries(queries), ['SELECT'])
+        # The cookie still slides
+        self.assertIn(settings.SESSION_COOKIE_NAME, response.cookies)
+
+    def test_changed_data_is_written(self):
+        session = self.client.session
+        session['theme'] = 'dark'
+        session.save()
+        self.assertEqual(Session.objects.get(pk=session.session_key).get_decoded()['theme'], 'dark')
+
+    def test_stale_expiry_is_refreshed(self):
+        key = self.client.session.session_key
+        stale = timezone.now() + timedelta(hours=20)
+        Session.objects.filter(pk=key).update(expire_date=stale)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url)
+        self.assertEqual(session_queries(queries), ['SELECT', 'UPDATE'])
+        self.assertGreater(Session.objects.get(pk=key).expire_date, stale + timedelta(hours=3))
+
+    def test_workers_with_separate_caches_see_each_others_writes(self):
+        key = self.client.session.session_key
+        first, second = 'worker-1', 'worker-2'
+
+        def worker(name):
+            # Each gunicorn worker has its own process-local caches
+            backend = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': name}
+            return override_settings(CACHES={alias: backend for alias in settings.CACHES})
+
+        with worker(first):
+            self.assertIn('_auth_user_id', SessionStore(key).load())
+        with worker(second):
+            session = SessionStore(key)
+            session['bank_import'] = {'rows': [1, 2]}
+            session.save()
+        with worker(first):
+            session = SessionStore(key)
+            self.assertEqual(session['bank_import'], {'rows': [1, 2]})
+            session['theme'] = 'dark'
+            session.save()
+        with worker(second):
+            self.assertEqual(SessionStore(key)['bank_import'], {'rows': [1, 2]})
+            SessionStore(key).delete()
+        with worker(first):
+            self.assertEqual(SessionStore(key).load(), {})
+
+    def test_logout_ends_the_session(self):
+        key = self.client.session.session_key
+        self.client.get(self.url)
+        self.client.post(reverse('logout'))
+        self.assertFalse(Session.objects.filter(pk=key).exists())
+        response = self.client.get(reverse('finances:my_statement'))
+        self.assertEqual(response.status_code, 302)
+
+    def test_purge_sessions_deletes_expired_rows_in_batches(self):
+        past = timezone.now() - timedelta(days=1)
+        Session.objects.bulk_create([Session(session_key=f'expired{n:04}', session_data='', expire_date=past) for n in range(25)])
+        live = Session.objects.count() - 25
+
+        with CaptureQueriesContext(connection) as queries:
+            call_command('purge_sessions', '--batch-size', '10', stdout=StringIO())
+        self.assertEqual(Session.objects.count(), live)
+        self.assertEqual(len([sql for sql in session_queries(queries) if sql == 'DELETE']), 3)
@@ -0,0 +1,161 @@
+# finances/aging.py
+"""
+Receivables aging, computed in the database.
+
+Each member's payments are allocated to their dues oldest-first: a running
+SUM() OVER (PARTITION BY member ORDER BY due_date, id) gives the dues raised
+up to and including each due, and whatever part of that running total is not
+covered by the member's payments is still unpaid. Unpaid amounts are then
+bucketed by how far past its due_date each due is on the report date.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection
+
+from users.models import Profile, User
+from .models import Due, Payment
+
+ZERO = Decimal('0.00')
+CENT = Decimal('0.01')
+
+AGING_BUCKETS = ('current', 'days_31_60', 'days_61_90', 'over_90')
+
+AGING_REPORT_HEADER = [
+    'Member Name',
+    'Email',
+    'Current (₦)',
+    '31-60 Days (₦)',
+    '61-90 Days (₦)',
+    '90+ Days (₦)',
+    'Total Outstanding (₦)',
+]
+
+
+def _money(value):
+    # SQLite hands back floats/ints for SUM over decimal columns
+    return Decimal(str(value or 0)).quantize(CENT)
+
+
+def _open_dues_sql():
+    """
+    SQL for every due raised by the report date with its unpaid amount after
+    oldest-first allocation. Parameters: as_of (payments up to this date are
+    allocated), as_of (dues up to this date are reported).
+    """
+    qn = connection.ops.quote_name
+    return f"""
+        WITH paid AS (
+            SELECT {qn('member_id')} AS member_id, SUM({qn('amount_paid')}) AS total_paid
+            FROM {qn(Payment._meta.db_table)}
+            WHERE {qn('payment_date')} <= %s
+            GROUP BY {qn('member_id')}
+        ),
+        running AS (
+            SELECT {qn('member_id')} AS member_id,
+                   {qn('due_date')} AS due_date,
+                   {qn('amount_due')} AS amount_due,
+                   SUM({qn('amount_due')}) OVER (
+                       PARTITION BY {qn('member_id')}
+                       ORDER BY {qn('due_date')}, {qn('id')}
+                       ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW
+                   ) AS raised_to_date
+            FROM {qn(Due._meta.db_table)}
+            WHERE {qn('due_date')} <= %s
+        ),
+        open_dues AS (
+            SELECT running.member_id,
+                   running.due_date,
+                   CASE
+                       WHEN running.raised_to_date - COALESCE(paid.total_paid, 0) <= 0 THEN 0
+                       WHEN running.raised_to_date - COALESCE(paid.total_paid, 0) >= running.amount_due THEN running.amount_due
+                       ELSE running.raised_to_date - COALESCE(paid.total_paid, 0)
+                   END AS unpaid
+            FROM running
+            LEFT JOIN paid ON paid.member_id = running.member_id
+        )
+    """
+
+
+def _bucket_columns():
+    """SUM(CASE ...) columns for the aging buckets. Parameters: 30/60/90-day cutoff dates."""
+    return """
+        SUM(CASE WHEN open_dues.due_date > %s THEN open_dues.unpaid ELSE 0 END) AS current,
+        SUM(CASE WHEN open_dues.due_date <= %s AND open_dues.due_date > %s THEN open_dues.unpaid ELSE 0 END) AS days_31_60,
+        SUM(CASE WHEN open_dues.due_date <= %s AND open_dues.due_date > %s THEN open_dues.unpaid ELSE 0 END) AS days_61_90,
+        SUM(CASE WHEN open_dues.due_date <= %s THEN open_dues.unpaid ELSE 0 END) AS over_90,
+        SUM(open_dues.unpaid) AS total
+    """
+
+
+def _bucket_params(as_of):
+    day_30, day_60, day_90 = (as_of - timedelta(days=days) for days in (30, 60, 90))
+    return [day_30, day_30, day_60, day_60, day_90, day_90]
+
+
+def aging_by_member(as_of, limit=None, offset=0):
+    """
+    Yield one dict per member with an outstanding balance on `as_of`:
+    profile_id, name, email, the AGING_BUCKETS amounts and total.
+    Rows are ordered by member name and fetched in chunks.
+    """
+    qn = connection.ops.quote_name
+    profile_table = qn(Profile._meta.db_table)
+    user_table = qn(User._meta.db_table)
+    sql = _open_dues_sql() + f"""
+        SELECT open_dues.member_id,
+               {user_table}.{qn('first_name')},
+               {user_table}.{qn('middle_name')},
+               {user_table}.{qn('last_name')},
+               {user_table}.{qn('email')},
+               {_bucket_columns()}
+        FROM open_dues
+        INNER JOIN {profile_table} ON {profile_table}.{qn('id')} = open_dues.member_id
+        INNER JOIN {user_table} ON {user_table}.{qn('id')} = {profile_table}.{qn('user_id')}
+        WHERE open_dues.unpaid > 0
+        GROUP BY open_dues.member_id,
+                 {user_table}.{qn('first_name')}, {user_table}.{qn('middle_name')},
+                 {user_table}.{qn('last_name')}, {user_table}.{qn('email')}
+        ORDER BY {user_table}.{qn('last_name')}, {user_table}.{qn('first_name')}, open_dues.member_id
+    """
+    params = [as_of, as_of] + _bucket_params(as_of)
+    if limit is not None:
+        sql += " LIMIT %s OFFSET %s"
+        params += [limit, offset]
+
+    with connection.chunked_cursor() as cursor:
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(2000)
+            if not rows:
+                break
+            for member_id, first_name, middle_name, last_name, email, *amounts in rows:
+                row = {
+                    'profile_id': member_id,
+                    'name': ' '.join(part for part in (first_name, middle_name, last_name) if part),
+                    'email': email,
+                }
+                row.update(zip(AGING_BUCKETS + ('total',), (_money(amount) for amount in amounts)))
+                yield row
+
+
+def aging_totals(as_of):
+    """Club-wide bucket totals and the number of members owing, in one query."""
+    sql = _open_dues_sql() + f"""
+        SELECT {_bucket_columns()}, COUNT(DISTINCT open_dues.member_id) AS members
+        FROM open_dues
+        WHERE open_dues.unpaid > 0
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [as_of, as_of] + _bucket_params(as_of))
+        *amounts, members = cursor.fetchone()
+    totals = dict(zip(AGING_BUCKETS + ('total',), (_money(amount) for amount in amounts)))
+    totals['members'] = members or 0
+    return totals
+
+
+def aging_report_rows(as_of):
+    """Yield the aging report as CSV rows, header first."""
+    yield AGING_REPORT_HEADER
+    for row in aging_by_member(as_of):
+        yield [row['name'], row['email']] + [row[bucket] for bucket in AGING_BUCKETS] + [row['total']]
@@ -0,0 +1,151 @@
+# finances/allocation.py
+"""
+Oldest-first (FIFO) allocation of payments to dues.
+
+Allocation is incremental: only payments with unallocated money and dues
+that are still open take part, so recording a payment allocates just the
+new money. A new due dated before a due that already holds money, and
+editing or deleting an entry, reallocate the member from scratch instead.
+The results are kept on PaymentAllocation rows plus the
+Due.amount_settled / Due.is_settled and Payment.amount_allocated columns,
+which makes open and settled dues plain indexed lookups.
+
+Migration 0005 carries its own copy of fifo_match() and settlement() for
+its backfill; changing them here doesn't change that migration.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, Max
+
+from .models import Due, Payment, PaymentAllocation
+
+ZERO = Decimal('0.00')
+
+
+def fifo_match(dues, payments):
+    """
+    Match money oldest-first. `dues` and `payments` are lists of
+    [id, remaining amount] in date order; returns (payment_id, due_id, amount)
+    tuples and updates the remaining amounts in place.
+    """
+    matches = []
+    due_index = 0
+    for payment in payments:
+        while payment[1] > 0 and due_index < len(dues):
+            due = dues[due_index]
+            if due[1] <= 0:
+                due_index += 1
+                continue
+            amount = min(payment[1], due[1])
+            matches.append((payment[0], due[0], amount))
+            payment[1] -= amount
+            due[1] -= amount
+    return matches
+
+
+def settlement(amount_due, remaining):
+    """(amount_settled, is_settled) of a due left with `remaining` unpaid after matching."""
+    if amount_due <= 0:
+        return ZERO, True  # Nothing to pay; never takes money
+    return amount_due - remaining, remaining <= 0
+
+
+def allocate_members(member_ids):
+    """
+    Apply the unallocated money of each member's payments to their open dues,
+    oldest first. Returns the number of allocation rows written.
+    """
+    member_ids = set(member_ids)
+    if not member_ids:
+        return 0
+
+    with transaction.atomic():
+        payments = list(
+            Payment.objects.select_for_update()
+            .filter(member_id__in=member_ids, amount_allocated__lt=F('amount_paid'))
+            .order_by('member_id', 'payment_date', 'id')
+            .only('id', 'member_id', 'amount_paid', 'amount_allocated')
+        )
+        if not payments:
+            return 0
+        credit_members = {payment.member_id for payment in payments}
+        dues = list(
+            Due.objects.select_for_update()
+            .filter(member_id__in=credit_members, is_settled=False)
+            .order_by('member_id', 'due_date', 'id')
+            .only('id', 'member_id', 'amount_due', 'amount_settled', 'is_settled')
+        )
+
+        payments_by_member = defaultdict(list)
+        for payment in payments:
+            payments_by_member[payment.member_id].append(payment)
+        dues_by_member = defaultdict(list)
+        for due in dues:
+            dues_by_member[due.member_id].append(due)
+
+        allocations = []
+        changed_dues = []
+        changed_payments = []
+        for member_id, member_payments in payments_by_member.items():
+            member_dues = dues_by_member.get(member_id, [])
+            if not member_dues:
+                continue
+            due_rows = [[due.pk, due.amount_outstanding] for due in member_dues]
+            payment_rows = [[payment.pk, payment.amount_unallocated] for payment in member_payments]
+            matches = fifo_match(due_rows, payment_rows)
+            if not matches:
+                continue
+
+            allocations.extend(
+                PaymentAllocation(payment_id=payment_id, due_id=due_id, amount=amount)
+                for payment_id, due_id, amount in matches
+            )
+            for due, (_, remaining) in zip(member_dues, due_rows):
+                if remaining != due.amount_outstanding or (remaining <= 0 and not due.is_settled):
+                    due.amount_settled, due.is_settled = settlement(due.amount_due, remaining)
+                    changed_dues.append(due)
+            for payment, (_, remaining) in zip(member_payments, payment_rows):
+                if remaining != payment.amount_unallocated:
+                    payment.amount_allocated = payment.amount_paid - remaining
+                    changed_payments.append(payment)
+
+        PaymentAllocation.objects.bulk_create(allocations, batch_size=1000)
+        Due.objects.bulk_update(changed_dues, ['amount_settled', 'is_settled'], batch_size=1000)
+        Payment.objects.bulk_update(changed_payments, ['amount_allocated'], batch_size=1000)
+    return len(allocations)
+
+
+def reallocate_members(member_ids):
+    """Throw away and redo the allocations of the given members."""
+    member_ids = set(member_ids)
+    if not member_ids:
+        return 0
+    with transaction.atomic():
+        PaymentAllocation.objects.filter(payment__member_id__in=member_ids).delete()
+        PaymentAllocation.objects.filter(due__member_id__in=member_ids).delete()
+        Due.objects.filter(member_id__in=member_ids).update(amount_settled=ZERO, is_settled=False)
+        Due.objects.filter(member_id__in=member_ids, amount_due__lte=0).update(is_settled=True)
+        Payment.objects.filter(member_id__in=member_ids).update(amount_allocated=ZERO)
+        return allocate_members(member_ids)
+
+
+def allocate_new_dues(dues):
+    """
+    Allocate credit to newly inserted dues, given as (member_id, due_date)
+    pairs. A member who already has money on a due dated after one of their
+    new dues is reallocated from scratch, so the older due is paid first;
+    everyone else just has their credit applied. Returns the allocation count.
+    """
+    earliest = {}
+    for member_id, due_date in dues:
+        earliest[member_id] = min(due_date, earliest.get(member_id, due_date))
+    if not earliest:
+        return 0
+    latest_paid = (
+        Due.objects.filter(member_id__in=earliest, amount_settled__gt=0, due_date__gt=min(earliest.values()))
+        .order_by().values_list('member_id').annotate(latest=Max('due_date'))
+    )
+    reshuffle = {member_id for member_id, latest in latest_paid if latest > earliest[member_id]}
+    return reallocate_members(reshuffle) + allocate_members(set(earliest) - reshuffle)
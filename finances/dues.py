@@ -0,0 +1,140 @@
+# finances/dues.py
+"""
+Set-based bulk dues.
+
+A bulk due is written with one INSERT ... SELECT per batch of profile ids, so
+no Due objects are built in Python. Dues are unique on (member, description,
+due_date) and conflicting rows are skipped, which makes generating the same
+due twice (a resubmitted form, a retried job) a no-op.
+
+DueSchedule rows are turned into dues by generate_scheduled_dues, which
+walks every occurrence not yet generated up to a date, so a missed cron run
+is caught up on the next one.
+"""
+import calendar
+from datetime import date
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import BooleanField, CharField, Count, DateField, DateTimeField, DecimalField, Max, Min, Value
+from django.utils import timezone
+
+from users.models import Profile
+from .allocation import allocate_new_dues
+from .ledger import apply_deltas
+from .models import Due, DueSchedule
+from .periods import ensure_open, latest_period_end
+from .rollups import record_rollup
+
+BULK_DUE_BATCH_SIZE = 5000
+
+
+def active_member_profiles():
+    """Profiles that bulk dues are charged to: active members, excluding superusers."""
+    return Profile.objects.filter(status='ACT', user__is_superuser=False)
+
+
+def _insert_batch(profiles, amount, description, due_date, created_at):
+    """INSERT ... SELECT one batch of profiles; returns the member ids that got a new due."""
+    rows = profiles.order_by().annotate(
+        bulk_amount_due=Value(amount, output_field=DecimalField(max_digits=8, decimal_places=2)),
+        bulk_description=Value(description, output_field=CharField()),
+        bulk_due_date=Value(due_date, output_field=DateField()),
+        bulk_created_at=Value(created_at, output_field=DateTimeField()),
+        bulk_amount_settled=Value(Decimal('0.00'), output_field=DecimalField(max_digits=8, decimal_places=2)),
+        bulk_is_settled=Value(amount <= 0, output_field=BooleanField()),
+    ).values_list(
+        'pk', 'bulk_amount_due', 'bulk_description', 'bulk_due_date',
+        'bulk_created_at', 'bulk_amount_settled', 'bulk_is_settled',
+    )
+    select_sql, params = rows.query.sql_with_params()
+
+    qn = connection.ops.quote_name
+    columns = ('member_id', 'amount_due', 'description', 'due_date', 'created_at', 'amount_settled', 'is_settled')
+    sql = (
+        f"INSERT INTO {qn(Due._meta.db_table)} ({', '.join(qn(column) for column in columns)}) "
+        f"{select_sql} "
+        f"ON CONFLICT ({qn('member_id')}, {qn('description')}, {qn('due_date')}) DO NOTHING "
+        f"RETURNING {qn('member_id')}"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [member_id for (member_id,) in cursor.fetchall()]
+
+
+def generate_bulk_dues(amount, description, due_date, profiles=None, batch_size=BULK_DUE_BATCH_SIZE):
+    """
+    Charge `amount` to every profile in `profiles` (default: active members)
+    unless they already have a due with this description and date.
+
+    Profiles are processed in primary-key ranges of `batch_size`, each in its
+    own transaction that also posts the new dues to MemberBalance and
+    allocates existing credit. Returns (inserted, skipped).
+    """
+    profiles = active_member_profiles() if profiles is None else profiles
+    ensure_open([due_date])
+
+    bounds = profiles.order_by().aggregate(first=Min('pk'), last=Max('pk'), total=Count('pk'))
+    total = bounds['total']
+    if not total:
+        return 0, 0
+
+    created_at = timezone.now()
+    inserted = 0
+    for start in range(bounds['first'], bounds['last'] + 1, batch_size):
+        batch = profiles.filter(pk__gte=start, pk__lt=start + batch_size)
+        with transaction.atomic():
+            member_ids = _insert_batch(batch, amount, description, due_date, created_at)
+            if member_ids:
+                apply_deltas(dues={member_id: amount for member_id in member_ids})
+                record_rollup(Due, added=[(member_id, due_date, amount) for member_id in member_ids])
+                allocate_new_dues((member_id, due_date) for member_id in member_ids)
+        inserted += len(member_ids)
+    return inserted, total - inserted
+
+
+def _add_months(start, months, day):
+    month_index = start.month - 1 + months
+    year, month = start.year + month_index // 12, month_index % 12 + 1
+    return date(year, month, min(day, calendar.monthrange(year, month)[1]))
+
+
+def schedule_occurrences(schedule, until):
+    """Due dates of `schedule` after its last generated occurrence, up to `until`."""
+    step = DueSchedule.FREQUENCY_MONTHS[schedule.frequency]
+    last_day = min(until, schedule.end_date) if schedule.end_date else until
+    occurrences = []
+    index = 0
+    while True:
+        due_date = _add_months(schedule.start_date, index * step, schedule.start_date.day)
+        if due_date > last_day:
+            return occurrences
+        if schedule.last_generated_on is None or due_date > schedule.last_generated_on:
+            occurrences.append(due_date)
+        index += 1
+
+
+def generate_scheduled_dues(schedule, until, batch_size=BULK_DUE_BATCH_SIZE):
+    """
+    Raise every outstanding occurrence of `schedule` up to `until`.
+
+    Returns a list of (due_date, inserted, skipped). Occurrences inside a
+    closed period are skipped with inserted/skipped of None. The schedule's
+    last_generated_on is moved forward after each occurrence, and the
+    uniqueness key makes a rerun harmless if a run dies part way.
+    """
+    profiles = Profile.objects.filter(status__in=schedule.status_list, user__is_superuser=False)
+    period_end = latest_period_end()
+    results = []
+    for due_date in schedule_occurrences(schedule, until):
+        if period_end and due_date <= period_end:
+            results.append((due_date, None, None))
+        else:
+            inserted, skipped = generate_bulk_dues(
+                schedule.amount, schedule.description_for(due_date), due_date,
+                profiles=profiles, batch_size=batch_size,
+            )
+            results.append((due_date, inserted, skipped))
+        schedule.last_generated_on = due_date
+        DueSchedule.objects.filter(pk=schedule.pk).update(last_generated_on=due_date)
+    return results
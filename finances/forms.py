@@ -1,13 +1,32 @@
 # finances/forms.py
+from decimal import Decimal
+
 from django import forms
+from django.utils import timezone
 from .models import Payment, Due
+from .periods import latest_period_end
+from users.lookup import member_labels
 from users.models import Profile # To populate member choices
+from users.widgets import MemberAutocompleteWidget
+
+
+def check_open_period(value, period_end):
+    """Reject `value` if it falls on or before `period_end` (the latest closed period, or None)."""
+    if value and period_end and value <= period_end:
+        raise forms.ValidationError(f"The ledger is closed up to {period_end:%Y-%m-%d}. Choose a later date.")
+    return value
+
+def validate_open_period(value):
+    """Reject dates that fall inside a closed accounting period."""
+    return check_open_period(value, latest_period_end())
 
 class PaymentForm(forms.ModelForm):
     # If FS needs to select member when recording payment
+    # The autocomplete widget never lists the queryset; validation reads just the chosen row
     member = forms.ModelChoiceField(
         queryset=Profile.objects.filter(status='ACT').select_related('user').order_by('user__username'),
-        label="Member"
+        label="Member",
+        widget=MemberAutocompleteWidget(),
     )
 
     class Meta:
@@ -17,13 +36,17 @@ class PaymentForm(forms.ModelForm):
             'payment_date': forms.DateInput(attrs={'type': 'date'}), # HTML5 date picker
         }
 
+    def clean_payment_date(self):
+        return validate_open_period(self.cleaned_data.get('payment_date'))
+
 class DueForm(forms.ModelForm):
     # Allow selecting multiple members to apply a due to? More complex.
     # Single member selection for now:
     member = forms.ModelChoiceField(
         queryset=Profile.objects.filter(status='ACT').select_related('user').order_by('user__username'),
         label="Member",
-        required=True
+        required=True,
+        widget=MemberAutocompleteWidget(),
     )
     
     class Meta:
@@ -38,8 +61,96 @@ class DueForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
         # Add any additional initialization here if needed
 
+    def clean_due_date(self):
+        return validate_open_period(self.cleaned_data.get('due_date'))
+
 # Form to apply a Due to *all* active members (e.g., annual fee)
 class BulkDueForm(forms.Form):
     amount_due = forms.DecimalField(max_digits=8, decimal_places=2)
     description = forms.CharField(max_length=255)
-    due_date = forms.DateField(widget=forms.DateInput(attrs={'type': 'date'}))
\ No newline at end of file
+    due_date = forms.DateField(widget=forms.DateInput(attrs={'type': 'date'}), validators=[validate_open_period])
+
+
+# Upload form for finances.importers (bank statement import)
+class BankStatementForm(forms.Form):
+    statement = forms.FileField(
+        label="Bank statement",
+        help_text="CSV with date and amount columns (plus reference/description, name or phone), or an OFX/QFX export.",
+    )
+
+
+# One row of the batch payment grid
+class BatchPaymentRowForm(forms.Form):
+    member = forms.IntegerField(label="Member", widget=MemberAutocompleteWidget(attrs={'class': 'form-control form-control-sm'}))
+    amount_paid = forms.DecimalField(
+        max_digits=8, decimal_places=2, min_value=Decimal('0.01'), label="Amount",
+        widget=forms.NumberInput(attrs={'step': '0.01', 'class': 'form-control form-control-sm'}),
+    )
+    payment_date = forms.DateField(
+        initial=timezone.localdate, label="Date",
+        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control form-control-sm'}),
+    )
+    notes = forms.CharField(max_length=255, required=False, widget=forms.TextInput(attrs={'class': 'form-control form-control-sm'}))
+
+    def __init__(self, *args, members=None, period_end=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.members = members or {}
+        self.fields['member'].widget.labels = self.members
+        self.period_end = period_end
+
+    def clean_member(self):
+        member_id = self.cleaned_data.get('member')
+        if member_id not in self.members:
+            raise forms.ValidationError("Choose an active member from the list.")
+        return member_id
+
+    def clean_payment_date(self):
+        return check_open_period(self.cleaned_data.get('payment_date'), self.period_end)
+
+    def as_payment_row(self):
+        """(member_id, date, amount, notes), the shape importers.import_payments takes."""
+        data = self.cleaned_data
+        return data['member'], data['payment_date'], data['amount_paid'], data['notes']
+
+
+class BaseBatchPaymentFormSet(forms.BaseFormSet):
+    """
+    The members named in the submitted rows are looked up together, and all
+    rows share one closed-period lookup, so validating a grid costs two
+    queries however many rows it has. Untouched rows are ignored; split()
+    separates the rows to save from those with errors.
+    """
+
+    def __init__(self, data=None, *args, **kwargs):
+        if not kwargs.get('form_kwargs'):
+            submitted = [value for key, value in (data or {}).items() if key.endswith('-member')]
+            kwargs['form_kwargs'] = {'members': member_labels(submitted), 'period_end': latest_period_end()}
+        super().__init__(data, *args, **kwargs)
+
+    def split(self):
+        """Return (payment rows of the valid filled-in forms, forms with errors)."""
+        rows, failed = [], []
+        for form in self.forms:
+            if not form.has_changed():
+                continue
+            if form.is_valid():
+                rows.append(form.as_payment_row())
+            else:
+                failed.append(form)
+        return rows, failed
+
+    def retry(self, forms):
+        """A bound formset holding only `forms`, as submitted, so their errors can be shown again."""
+        data = {
+            f'{self.prefix}-TOTAL_FORMS': len(forms),
+            f'{self.prefix}-INITIAL_FORMS': 0,
+        }
+        for index, form in enumerate(forms):
+            for name in form.fields:
+                data[f'{self.prefix}-{index}-{name}'] = form.data.get(form.add_prefix(name), '')
+        return type(self)(data, prefix=self.prefix, form_kwargs=self.form_kwargs)
+
+
+BatchPaymentFormSet = forms.formset_factory(
+    BatchPaymentRowForm, formset=BaseBatchPaymentFormSet, extra=10, max_num=200, validate_max=True,
+)
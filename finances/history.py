@@ -0,0 +1,92 @@
+# finances/history.py
+"""
+Keyset (cursor) pagination of a member's dues and payments.
+
+Pages are ordered newest first on (date, id) and the next page starts
+strictly after the last row shown, so every page is one index range scan on
+finances_due_member_date_idx / finances_pay_member_date_idx however long the
+member's history is. Cursors are opaque "YYYY-MM-DD_id" strings.
+"""
+from datetime import date
+
+from django.db.models import Q
+
+from .models import Due, Payment
+
+HISTORY_PAGE_SIZE = 20
+
+HISTORY_KINDS = {
+    'dues': (Due, 'due_date'),
+    'payments': (Payment, 'payment_date'),
+}
+
+
+def encode_cursor(entry_date, pk):
+    return f"{entry_date.isoformat()}_{pk}"
+
+
+def decode_cursor(cursor):
+    """Return (date, id) from a cursor string; raises ValueError if it is malformed."""
+    entry_date, _, pk = (cursor or '').partition('_')
+    return date.fromisoformat(entry_date), int(pk)
+
+
+def keyset_page(queryset, date_field, cursor=None, page_size=HISTORY_PAGE_SIZE):
+    """
+    Return (rows, next_cursor) for the page of `queryset` after `cursor`,
+    newest first. next_cursor is None on the last page.
+    """
+    queryset = queryset.order_by(f'-{date_field}', '-id')
+    if cursor:
+        after_date, after_id = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(**{f'{date_field}__lt': after_date}) | Q(**{date_field: after_date, 'id__lt': after_id})
+        )
+    rows = list(queryset[:page_size + 1])
+    if len(rows) <= page_size:
+        return rows, None
+    rows = rows[:page_size]
+    return rows, encode_cursor(getattr(rows[-1], date_field), rows[-1].pk)
+
+
+def history_page(profile, kind, cursor=None, page_size=HISTORY_PAGE_SIZE):
+    """One page of a member's 'dues' or 'payments', as (rows, next_cursor)."""
+    model, date_field = HISTORY_KINDS[kind]
+    queryset = model.objects.filter(member=profile)
+    if model is Payment:
+        queryset = queryset.select_related('recorded_by')
+    return keyset_page(queryset, date_field, cursor, page_size)
+
+
+def history_context(profile, page_size=HISTORY_PAGE_SIZE):
+    """Template context with the first page of both histories and their cursors."""
+    dues, dues_next_cursor = history_page(profile, 'dues', page_size=page_size)
+    payments, payments_next_cursor = history_page(profile, 'payments', page_size=page_size)
+    return {
+        'dues': dues,
+        'dues_next_cursor': dues_next_cursor,
+        'payments': payments,
+        'payments_next_cursor': payments_next_cursor,
+    }
+
+
+def serialize_entry(entry):
+    """JSON-friendly dict of a Due or Payment for the history endpoint."""
+    if isinstance(entry, Due):
+        return {
+            'id': entry.pk,
+            'description': entry.description,
+            'amount_due': str(entry.amount_due),
+            'due_date': entry.due_date.isoformat(),
+            'amount_outstanding': str(entry.amount_outstanding),
+            'is_settled': entry.is_settled,
+            'created_at': entry.created_at.isoformat(),
+        }
+    return {
+        'id': entry.pk,
+        'amount_paid': str(entry.amount_paid),
+        'payment_date': entry.payment_date.isoformat(),
+        'notes': entry.notes or '',
+        'recorded_by': entry.recorded_by.username if entry.recorded_by else '',
+        'recorded_at': entry.recorded_at.isoformat(),
+    }
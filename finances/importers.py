@@ -0,0 +1,284 @@
+# finances/importers.py
+"""
+Bank statement import.
+
+Statements are read one transaction at a time (CSV or OFX-style SGML) and
+matched to members through in-memory indexes built once per import, so a
+month of transactions costs a handful of queries however many rows it has.
+Confirmed rows are written with a single Payment.objects.bulk_create.
+"""
+import codecs
+import csv
+import re
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+
+from users.models import Profile
+from .models import Payment
+from .periods import latest_period_end
+
+CSV_COLUMN_ALIASES = {
+    'date': ('date', 'transaction date', 'posted date', 'value date', 'payment date'),
+    'amount': ('amount', 'credit', 'amount paid', 'deposit'),
+    'reference': ('reference', 'ref', 'description', 'narration', 'memo', 'details'),
+    'name': ('name', 'payer', 'payer name', 'account name'),
+    'phone': ('phone', 'phone number', 'mobile'),
+}
+DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%Y%m%d', '%d %b %Y')
+# Shorter usernames are too often ordinary words in a narration ("john", "levy")
+MIN_USERNAME_TOKEN_LENGTH = 6
+# Rows kept in the session between the preview and the confirmation
+MAX_PENDING_ROWS = 2000
+
+# Row statuses
+MATCHED = 'matched'
+CONFLICT = 'conflict'
+UNMATCHED = 'unmatched'
+DUPLICATE = 'duplicate'
+INVALID = 'invalid'
+IMPORTABLE = (MATCHED, CONFLICT, DUPLICATE)  # Rows the preview lets you record
+
+
+@dataclass
+class StatementRow:
+    row_number: int
+    date: date = None
+    amount: Decimal = None
+    reference: str = ''
+    name: str = ''
+    phone: str = ''
+    status: str = UNMATCHED
+    member_id: int = None
+    candidates: list = field(default_factory=list)
+    matched_by: str = ''
+    error: str = ''
+
+    @property
+    def notes(self):
+        return f"Bank import: {self.reference or self.name}".strip()
+
+    def as_session_data(self):
+        """Compact, JSON-serialisable form kept between preview and confirm."""
+        return {
+            'row': self.row_number,
+            'date': self.date.isoformat() if self.date else None,
+            'amount': str(self.amount) if self.amount is not None else None,
+            'reference': self.reference,
+            'name': self.name,
+            'status': self.status,
+            'member_id': self.member_id,
+            'candidates': self.candidates,
+        }
+
+
+def _normalise_name(value):
+    return ' '.join(re.sub(r'[^a-z0-9 ]', ' ', (value or '').lower()).split())
+
+
+def _normalise_phone(value):
+    digits = re.sub(r'\D', '', value or '')
+    return digits[-10:] if len(digits) >= 7 else ''
+
+
+def _parse_date(value):
+    value = (value or '').strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Unrecognised date '{value}'")
+
+
+def _parse_amount(value):
+    cleaned = re.sub(r'[^\d.\-]', '', value or '')
+    try:
+        return Decimal(cleaned).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise ValueError(f"Unrecognised amount '{value}'")
+
+
+def _text_lines(uploaded_file):
+    """Decode an uploaded/binary file lazily, line by line."""
+    reader = codecs.getreader('utf-8-sig')(uploaded_file, errors='replace')
+    for line in reader:
+        yield line
+
+
+def read_csv_statement(lines):
+    """Yield raw dicts with date/amount/reference/name/phone keys from a CSV statement."""
+    reader = csv.reader(lines)
+    header = [column.strip().lower() for column in next(reader, [])]
+    positions = {}
+    for key, aliases in CSV_COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias in header:
+                positions[key] = header.index(alias)
+                break
+    missing = {'date', 'amount'} - set(positions)
+    if missing:
+        raise ValueError(f"Statement is missing the column(s): {', '.join(sorted(missing))}")
+
+    for values in reader:
+        if not any(value.strip() for value in values):
+            continue
+        yield {key: values[index].strip() if index < len(values) else '' for key, index in positions.items()}
+
+
+OFX_TAG = re.compile(r'<(\w+)>([^<\r\n]*)')
+
+
+def read_ofx_statement(lines):
+    """Yield raw dicts from the <STMTTRN> blocks of an OFX/QFX (SGML or XML) statement."""
+    current = None
+    for line in lines:
+        for tag, value in OFX_TAG.findall(line):
+            tag = tag.upper()
+            if tag == 'STMTTRN':
+                current = {}
+            elif current is not None:
+                if tag == 'DTPOSTED':
+                    current['date'] = value.strip()[:8]
+                elif tag == 'TRNAMT':
+                    current['amount'] = value.strip()
+                elif tag == 'NAME':
+                    current['name'] = value.strip()
+                elif tag in ('MEMO', 'REFNUM'):
+                    current['reference'] = (current.get('reference', '') + ' ' + value.strip()).strip()
+        if current is not None and '</STMTTRN>' in line.upper():
+            yield current
+            current = None
+
+
+class MemberIndex:
+    """Lookup tables for matching statement rows to profiles, built with one query."""
+
+    def __init__(self, profiles=None):
+        profiles = profiles if profiles is not None else Profile.objects.all()
+        self.by_token = defaultdict(set)
+        self.by_name = defaultdict(set)
+        self.by_phone = defaultdict(set)
+        self.labels = {}
+        for row in profiles.order_by().values_list(
+            'pk', 'user__username', 'user__email', 'user__first_name', 'user__last_name', 'phone_number'
+        ).iterator(chunk_size=2000):
+            pk, username, email, first_name, last_name, phone = row
+            self.labels[pk] = f"{first_name} {last_name}".strip() or username
+            for token in (email, f'fc92-{pk}'):
+                if token:
+                    self.by_token[token.lower()].add(pk)
+            if username and ('@' in username or len(username) >= MIN_USERNAME_TOKEN_LENGTH):
+                self.by_token[username.lower()].add(pk)
+            if first_name and last_name:
+                self.by_name[_normalise_name(f'{first_name} {last_name}')].add(pk)
+                self.by_name[_normalise_name(f'{last_name} {first_name}')].add(pk)
+            phone = _normalise_phone(phone)
+            if phone:
+                self.by_phone[phone].add(pk)
+
+    def match(self, reference='', name='', phone=''):
+        """
+        Return (candidate profile ids, how they were matched). A reference
+        word matches only when it is a member's whole email, member code
+        (fc92-<id>) or username of at least MIN_USERNAME_TOKEN_LENGTH
+        characters; otherwise the full name and then the phone are tried.
+        """
+        tokens = {token.strip('.,;:()') for token in (reference or '').lower().split()}
+        found = set().union(*(self.by_token.get(token, set()) for token in tokens)) if tokens else set()
+        if found:
+            return found, 'reference'
+        for text in (name, reference):
+            found = self.by_name.get(_normalise_name(text), set())
+            if found:
+                return found, 'name'
+        for text in (phone, reference):
+            found = self.by_phone.get(_normalise_phone(text), set())
+            if found:
+                return found, 'phone'
+        return set(), ''
+
+
+def parse_statement(uploaded_file, filename=''):
+    """Yield StatementRows (unmatched) from a CSV or OFX statement file."""
+    lines = _text_lines(uploaded_file)
+    if filename.lower().endswith(('.ofx', '.qfx')):
+        raw_rows = read_ofx_statement(lines)
+    else:
+        raw_rows = read_csv_statement(lines)
+
+    for number, raw in enumerate(raw_rows, start=1):
+        row = StatementRow(
+            row_number=number,
+            reference=raw.get('reference', ''),
+            name=raw.get('name', ''),
+            phone=raw.get('phone', ''),
+        )
+        try:
+            row.date = _parse_date(raw.get('date'))
+            row.amount = _parse_amount(raw.get('amount'))
+            if row.amount <= 0:
+                raise ValueError("Not a credit (amount must be positive)")
+        except ValueError as e:
+            row.status = INVALID
+            row.error = str(e)
+        yield row
+
+
+def match_statement(rows, index=None):
+    """
+    Match StatementRows to members and flag duplicates of payments already
+    recorded (same member, date and amount). Returns the list of rows.
+    """
+    index = index or MemberIndex()
+    period_end = latest_period_end()
+    rows = list(rows)
+    for row in rows:
+        if row.status == INVALID:
+            continue
+        if period_end and row.date <= period_end:
+            row.status = INVALID
+            row.error = f"Dated inside the closed period ending {period_end:%Y-%m-%d}"
+            continue
+        candidates, matched_by = index.match(row.reference, row.name, row.phone)
+        row.matched_by = matched_by
+        row.candidates = sorted(candidates)
+        if len(candidates) == 1:
+            row.status = MATCHED
+            row.member_id = row.candidates[0]
+        elif candidates:
+            row.status = CONFLICT
+        else:
+            row.status = UNMATCHED
+
+    matched = [row for row in rows if row.status == MATCHED]
+    if matched:
+        existing = set(
+            Payment.objects.filter(
+                member_id__in={row.member_id for row in matched},
+                payment_date__range=(min(row.date for row in matched), max(row.date for row in matched)),
+            ).values_list('member_id', 'payment_date', 'amount_paid')
+        )
+        seen = set()
+        for row in matched:
+            key = (row.member_id, row.date, row.amount)
+            if key in existing or key in seen:
+                row.status = DUPLICATE
+            seen.add(key)
+    return rows
+
+
+def import_payments(rows, recorded_by=None):
+    """
+    Insert Payments for (member_id, date, amount, notes) tuples in one
+    transaction with a single bulk_create. Returns the created payments.
+    """
+    payments = [
+        Payment(member_id=member_id, payment_date=payment_date, amount_paid=amount, notes=notes, recorded_by=recorded_by)
+        for member_id, payment_date, amount, notes in rows
+    ]
+    with transaction.atomic():
+        return Payment.objects.bulk_create(payments, batch_size=1000)
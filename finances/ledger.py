@@ -0,0 +1,177 @@
+# finances/ledger.py
+"""
+Incremental maintenance of the MemberBalance table.
+
+Every write to Due or Payment is turned into a per-member delta and applied
+with a single UPDATE ... SET total = total + delta, inside the same
+transaction as the write. Members that don't have a balance row yet get one
+computed from their raw rows.
+
+Saves, deletes, bulk_create() and update()/bulk_update() through the Due and
+Payment managers all keep the table in step (see LedgerEntryQuerySet).
+Writes that bypass the ORM, such as raw SQL or loaddata, do not: run
+`manage.py rebuild_balances` after them.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import Due, MemberBalance, Payment
+
+ZERO = Decimal('0.00')
+BATCH_SIZE = 500
+
+
+def _chunks(items, size=BATCH_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def live_totals(member_ids=None):
+    """
+    Return {member_id: (total_dues, total_payments)} computed from the raw rows.
+
+    Dues and payments are summed in separate grouped queries so there is no
+    dues x payments fan-out. Pass member_ids=None to cover every member.
+    """
+    dues = Due.objects.all()
+    payments = Payment.objects.all()
+    if member_ids is not None:
+        dues = dues.filter(member_id__in=member_ids)
+        payments = payments.filter(member_id__in=member_ids)
+
+    totals = defaultdict(lambda: [ZERO, ZERO])
+    for row in dues.order_by().values('member_id').annotate(total=Sum('amount_due')):
+        totals[row['member_id']][0] = row['total']
+    for row in payments.order_by().values('member_id').annotate(total=Sum('amount_paid')):
+        totals[row['member_id']][1] = row['total']
+    return {member_id: tuple(pair) for member_id, pair in totals.items()}
+
+
+def _balance_row(member_id, total_dues, total_payments):
+    return MemberBalance(
+        member_id=member_id,
+        total_dues=total_dues,
+        total_payments=total_payments,
+        balance=total_dues - total_payments,
+    )
+
+
+def apply_deltas(dues=None, payments=None, create_missing=True):
+    """
+    Add {member_id: Decimal} deltas to the dues/payments totals of each member.
+
+    Members sharing the same delta (e.g. a bulk due) are updated with one
+    statement. With create_missing=False, members without a balance row are
+    left alone (used on delete, where the profile may be going away too).
+    """
+    dues = dues or {}
+    payments = payments or {}
+    member_ids = set(dues) | set(payments)
+    if not member_ids:
+        return
+
+    with transaction.atomic():
+        existing = set()
+        for chunk in _chunks(member_ids):
+            existing.update(
+                MemberBalance.objects.select_for_update()
+                .filter(member_id__in=chunk)
+                .values_list('member_id', flat=True)
+            )
+
+        missing = member_ids - existing
+        if missing and create_missing:
+            # Totals from the raw rows already include the entries being recorded
+            totals = live_totals(missing)
+            rows = [_balance_row(member_id, *totals.get(member_id, (ZERO, ZERO))) for member_id in missing]
+            try:
+                with transaction.atomic():
+                    MemberBalance.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+            except IntegrityError:
+                # A concurrent writer created some of these rows first; post our deltas to them instead
+                existing |= missing
+
+        groups = defaultdict(list)
+        for member_id in existing:
+            due_delta = dues.get(member_id, ZERO)
+            payment_delta = payments.get(member_id, ZERO)
+            if due_delta or payment_delta:
+                groups[(due_delta, payment_delta)].append(member_id)
+
+        now = timezone.now()
+        for (due_delta, payment_delta), ids in groups.items():
+            for chunk in _chunks(ids):
+                MemberBalance.objects.filter(member_id__in=chunk).update(
+                    total_dues=F('total_dues') + due_delta,
+                    total_payments=F('total_payments') + payment_delta,
+                    balance=F('balance') + (due_delta - payment_delta),
+                    updated_at=now,
+                )
+
+
+def _deltas_for(model, changes):
+    """Split (member_id, amount) changes into the dues/payments keyword for apply_deltas."""
+    deltas = defaultdict(lambda: ZERO)
+    for member_id, amount in changes:
+        deltas[member_id] += amount
+    return {'dues': deltas} if issubclass(model, Due) else {'payments': deltas}
+
+
+def record_entries(model, entries):
+    """Post newly inserted Due/Payment instances to their members' balances."""
+    apply_deltas(**_deltas_for(model, [(entry.member_id, entry.ledger_amount) for entry in entries]))
+
+
+def record_change(entry, previous):
+    """
+    Post an edit of a saved Due/Payment. `previous` is the (member_id, amount)
+    the row had when loaded, or None if that isn't known.
+    """
+    if previous is None:
+        refresh_members([entry.member_id])
+        return
+    old_member_id, old_amount = previous
+    changes = [(entry.member_id, entry.ledger_amount)]
+    changes.append((old_member_id, -old_amount))
+    apply_deltas(**_deltas_for(type(entry), changes))
+
+
+def record_removal(entry):
+    """Take a deleted Due/Payment back off its member's balance."""
+    state = getattr(entry, '_ledger_state', None) or entry.ledger_key()
+    if state is None:
+        return
+    member_id, amount = state
+    apply_deltas(**_deltas_for(type(entry), [(member_id, -amount)]), create_missing=False)
+
+
+def refresh_members(member_ids):
+    """Recompute the balance rows of the given members from their raw rows."""
+    member_ids = set(member_ids)
+    if not member_ids:
+        return
+    with transaction.atomic():
+        totals = live_totals(member_ids)
+        for chunk in _chunks(member_ids):
+            MemberBalance.objects.filter(member_id__in=chunk).delete()
+            MemberBalance.objects.bulk_create(
+                [_balance_row(member_id, *totals.get(member_id, (ZERO, ZERO))) for member_id in chunk]
+            )
+
+
+def rebuild_all(batch_size=BATCH_SIZE):
+    """
+    Recreate the whole MemberBalance table from the raw Due/Payment rows.
+    Returns the number of balance rows written.
+    """
+    with transaction.atomic():
+        totals = live_totals()
+        MemberBalance.objects.all().delete()
+        rows = [_balance_row(member_id, *pair) for member_id, pair in totals.items()]
+        MemberBalance.objects.bulk_create(rows, batch_size=batch_size)
+    return len(rows)
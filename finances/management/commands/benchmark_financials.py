@@ -0,0 +1,103 @@
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import DecimalField, F, Sum
+from django.db.models.functions import Coalesce
+
+from finances.models import Due, Payment
+from users.models import Profile, User
+from users.provisioning import bulk_create_users
+
+
+class Rollback(Exception):
+    """Raised to discard the benchmark data once timings are taken."""
+
+
+def joined_financials(queryset):
+    """The old dues/payments join annotation, kept here for comparison only."""
+    return queryset.annotate(
+        total_dues=Coalesce(Sum('dues__amount_due', distinct=True), Decimal('0.00'), output_field=DecimalField()),
+        total_payments=Coalesce(Sum('payments__amount_paid', distinct=True), Decimal('0.00'), output_field=DecimalField()),
+    ).annotate(balance=F('total_dues') - F('total_payments'))
+
+
+class Command(BaseCommand):
+    help = (
+        "Time Profile.objects.with_financials() against the old joined annotation "
+        "as the number of dues and payments per member grows. All data is created "
+        "inside a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--members', type=int, default=200, help='Number of members to create.')
+        parser.add_argument(
+            '--entries', type=int, nargs='+', default=[5, 10, 20, 40],
+            help='Dues (and payments) per member at each step.',
+        )
+        parser.add_argument('--repeat', type=int, default=3, help='Timed runs per step; the best is reported.')
+        parser.add_argument('--skip-joined', action='store_true', help="Don't time the old joined annotation.")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self._run(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def _time(self, queryset, repeat):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            rows = list(queryset.all())  # fresh clone, no result cache
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best, rows
+
+    def _run(self, options):
+        member_count = options['members']
+        profiles = bulk_create_users([
+            User(username=f'bench-{n}', email=f'bench-{n}@example.com') for n in range(member_count)
+        ])
+        profile_ids = [profile.pk for profile in profiles]
+        members = Profile.objects.filter(pk__in=profile_ids).order_by()
+
+        self.stdout.write(f"{'entries/member':>15} {'rows':>8} {'with_financials':>16} {'us/row':>8} {'joined':>10} {'us/row':>8}")
+        created = 0
+        start_date = date(2020, 1, 1)
+        for target in sorted(options['entries']):
+            # Top every member up to `target` dues and payments. Amounts repeat on
+            # purpose: the joined annotation's DISTINCT gets them wrong.
+            new = range(created, target)
+            Due.objects.bulk_create([
+                Due(member_id=pk, amount_due=Decimal('10.00'), description=f'Bench {n}', due_date=start_date + timedelta(days=n))
+                for pk in profile_ids for n in new
+            ], batch_size=1000)
+            Payment.objects.bulk_create([
+                Payment(member_id=pk, amount_paid=Decimal('5.00'), payment_date=start_date + timedelta(days=n))
+                for pk in profile_ids for n in new
+            ], batch_size=1000)
+            created = target
+
+            rows = member_count * target * 2
+            subquery_time, results = self._time(members.with_financials(), options['repeat'])
+            expected_balance = Decimal('5.00') * target
+            if any(profile.balance != expected_balance for profile in results):
+                self.stderr.write(self.style.ERROR(f"with_financials() returned a wrong balance at {target} entries/member"))
+
+            if options['skip_joined']:
+                joined_cell = f"{'-':>10} {'-':>8}"
+            else:
+                joined_time, _ = self._time(joined_financials(members), options['repeat'])
+                joined_cell = f"{joined_time * 1000:>8.1f}ms {joined_time * 1e6 / rows:>8.2f}"
+
+            self.stdout.write(
+                f"{target:>15} {rows:>8} {subquery_time * 1000:>14.1f}ms {subquery_time * 1e6 / rows:>8.2f} {joined_cell}"
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            "A flat us/row column for with_financials() means query time grows linearly with ledger size."
+        ))
@@ -0,0 +1,53 @@
+from datetime import date
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from finances import periods
+
+
+class Command(BaseCommand):
+    help = (
+        "Close the ledger for a month or year: snapshot every member's closing "
+        "dues, payments and balance and lock entries dated in the period."
+    )
+
+    def add_arguments(self, parser):
+        target = parser.add_mutually_exclusive_group()
+        target.add_argument('--month', help="Month to close as YYYY-MM (default: last full month).")
+        target.add_argument('--year', type=int, help='Calendar year to close.')
+        target.add_argument('--reopen', metavar='YYYY-MM-DD', help='Reopen every period ending on or after this date.')
+
+    def handle(self, *args, **options):
+        if options['reopen']:
+            try:
+                reopen_from = date.fromisoformat(options['reopen'])
+            except ValueError:
+                raise CommandError("--reopen expects a date as YYYY-MM-DD.")
+            count = periods.reopen_from(reopen_from)
+            self.stdout.write(self.style.SUCCESS(f"Reopened {count} period(s)."))
+            return
+
+        if options['year']:
+            frequency = 'Y'
+            period_end = periods.period_end_for('Y', options['year'])
+        else:
+            frequency = 'M'
+            if options['month']:
+                try:
+                    year, month = (int(part) for part in options['month'].split('-'))
+                    period_end = periods.period_end_for('M', year, month)
+                except ValueError:
+                    raise CommandError("--month expects YYYY-MM.")
+            else:
+                first_of_month = date.today().replace(day=1)
+                period_end = date.fromordinal(first_of_month.toordinal() - 1)
+
+        if period_end >= date.today():
+            raise CommandError(f"The period ending {period_end} hasn't finished yet.")
+
+        try:
+            count = periods.close_period(period_end, frequency=frequency)
+        except ValidationError as e:
+            raise CommandError(' '.join(e.messages))
+        self.stdout.write(self.style.SUCCESS(f"Closed the period ending {period_end}: {count} member snapshot(s) written."))
@@ -0,0 +1,36 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from finances.reports import DEFAULT_CHUNK_SIZE, financial_report_rows, report_profiles
+
+
+class Command(BaseCommand):
+    help = "Write the member financial report to a CSV file, streaming rows as they are read."
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help="Path of the CSV file to write ('-' for stdout).")
+        parser.add_argument(
+            '--status', choices=['up_to_date', 'overdue'], default='',
+            help='Only include members that are up to date or overdue.',
+        )
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Rows fetched per database round trip.')
+
+    def handle(self, *args, **options):
+        rows = financial_report_rows(report_profiles(options['status']), chunk_size=options['chunk_size'])
+
+        if options['output'] == '-':
+            self._write(self.stdout, rows)
+            return
+
+        try:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as handle:
+                self._write(handle, rows)
+        except OSError as e:
+            raise CommandError(f"Could not write {options['output']}: {e}")
+        self.stdout.write(self.style.SUCCESS(f"Financial report written to {options['output']}."))
+
+    def _write(self, handle, rows):
+        writer = csv.writer(handle)
+        for row in rows:
+            writer.writerow(row)
@@ -0,0 +1,45 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from finances.dues import BULK_DUE_BATCH_SIZE, generate_scheduled_dues, schedule_occurrences
+from finances.models import DueSchedule
+
+
+class Command(BaseCommand):
+    help = (
+        "Raise the dues of every active DueSchedule up to today, catching up on "
+        "missed periods. Safe to run repeatedly (e.g. daily from cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', metavar='YYYY-MM-DD', help='Generate occurrences due up to this date (default: today).')
+        parser.add_argument('--schedule', type=int, action='append', help='Only run the schedule with this id (repeatable).')
+        parser.add_argument('--dry-run', action='store_true', help='List the occurrences that would be generated.')
+        parser.add_argument('--batch-size', type=int, default=BULK_DUE_BATCH_SIZE, help='Profile ids covered per INSERT ... SELECT.')
+
+    def handle(self, *args, **options):
+        try:
+            until = date.fromisoformat(options['date']) if options['date'] else date.today()
+        except ValueError:
+            raise CommandError("--date expects YYYY-MM-DD.")
+
+        schedules = DueSchedule.objects.filter(is_active=True, start_date__lte=until)
+        if options['schedule']:
+            schedules = schedules.filter(pk__in=options['schedule'])
+
+        total = 0
+        for schedule in schedules:
+            if options['dry_run']:
+                for due_date in schedule_occurrences(schedule, until):
+                    self.stdout.write(f"Would raise '{schedule.description_for(due_date)}' due {due_date}.")
+                continue
+
+            for due_date, inserted, skipped in generate_scheduled_dues(schedule, until, options['batch_size']):
+                description = schedule.description_for(due_date)
+                if inserted is None:
+                    self.stdout.write(self.style.WARNING(f"Skipped '{description}' due {due_date}: the period is closed."))
+                    continue
+                total += inserted
+                self.stdout.write(f"'{description}' due {due_date}: {inserted} charged, {skipped} already charged.")
+        self.stdout.write(self.style.SUCCESS(f"Generated {total} due(s)."))
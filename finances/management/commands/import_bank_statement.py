@@ -0,0 +1,53 @@
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from finances import importers
+from users.models import Profile
+
+
+class Command(BaseCommand):
+    help = (
+        "Match a bank statement (CSV or OFX) to members and, with --commit, record "
+        "the uniquely matched rows as payments in one transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('statement', help='Path of the CSV/OFX statement file.')
+        parser.add_argument('--commit', action='store_true', help='Record the matched payments (default: preview only).')
+        parser.add_argument('--recorded-by', metavar='USERNAME', help='User to record the payments as.')
+
+    def handle(self, *args, **options):
+        recorded_by = None
+        if options['recorded_by']:
+            try:
+                recorded_by = get_user_model().objects.get(username=options['recorded_by'])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"No user called {options['recorded_by']}.")
+
+        index = importers.MemberIndex(Profile.objects.filter(user__is_superuser=False))
+        try:
+            with open(options['statement'], 'rb') as handle:
+                rows = importers.match_statement(importers.parse_statement(handle, options['statement']), index)
+        except OSError as e:
+            raise CommandError(f"Could not read {options['statement']}: {e}")
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        matched = []
+        for row in rows:
+            if row.status == importers.MATCHED:
+                matched.append((row.member_id, row.date, row.amount, row.notes))
+            else:
+                detail = row.error or ', '.join(str(index.labels.get(pk, pk)) for pk in row.candidates)
+                self.stdout.write(f"Row {row.row_number}: {row.status}{f' ({detail})' if detail else ''}")
+        self.stdout.write(f"{len(matched)} of {len(rows)} row(s) matched a single member.")
+
+        if not options['commit']:
+            self.stdout.write("Preview only; run again with --commit to record the matched payments.")
+            return
+        try:
+            created = importers.import_payments(matched, recorded_by=recorded_by)
+        except ValidationError as e:
+            raise CommandError(' '.join(e.messages))
+        self.stdout.write(self.style.SUCCESS(f"Recorded {len(created)} payment(s)."))
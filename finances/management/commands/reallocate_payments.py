@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from finances.allocation import reallocate_members
+from users.models import Profile
+
+
+class Command(BaseCommand):
+    help = "Redo the oldest-first payment-to-due allocation for some or all members."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--member', type=int, action='append', dest='member_ids',
+            help='Only reallocate the given profile id (may be repeated).',
+        )
+        parser.add_argument('--batch-size', type=int, default=500, help='Members reallocated per transaction.')
+
+    def handle(self, *args, **options):
+        member_ids = options.get('member_ids') or list(Profile.objects.order_by('pk').values_list('pk', flat=True))
+        batch_size = options['batch_size']
+
+        allocations = 0
+        for start in range(0, len(member_ids), batch_size):
+            allocations += reallocate_members(member_ids[start:start + batch_size])
+        self.stdout.write(self.style.SUCCESS(
+            f"Reallocated {len(set(member_ids))} member(s): {allocations} allocation(s) written."
+        ))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from finances import ledger
+
+
+class Command(BaseCommand):
+    help = "Recompute the MemberBalance table from the raw Due and Payment rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--member', type=int, action='append', dest='member_ids',
+            help='Only rebuild the given profile id (may be repeated).',
+        )
+
+    def handle(self, *args, **options):
+        member_ids = options.get('member_ids')
+        if member_ids:
+            ledger.refresh_members(member_ids)
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt balances for {len(set(member_ids))} member(s)."))
+            return
+
+        count = ledger.rebuild_all()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} member balance(s)."))
@@ -0,0 +1,23 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from finances import rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute the DailyRollup table (dashboard KPIs) from the raw Due and Payment rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', metavar='YYYY-MM-DD', help='Only rebuild days on or after this date.')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = date.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError("--since expects a date as YYYY-MM-DD.")
+
+        count = rollups.rebuild_from(since)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} daily rollup(s)."))
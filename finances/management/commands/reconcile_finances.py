@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand
+
+from finances import reconcile
+
+
+class Command(BaseCommand):
+    help = (
+        "Check MemberBalance, the payment allocations and the daily rollups against the "
+        "raw Due and Payment rows, shard by shard, and optionally repair any drift."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shard-size', type=int, default=reconcile.DEFAULT_SHARD_SIZE, help='Profile ids per shard.')
+        parser.add_argument('--workers', type=int, default=1, help='Worker processes checking shards in parallel (1 = in this process).')
+        parser.add_argument('--repair', action='store_true', help='Rebuild the balances, allocations and rollups that drifted.')
+        parser.add_argument('--skip-rollups', action='store_true', help="Don't check the daily rollups.")
+
+    def handle(self, *args, **options):
+        verbosity = options['verbosity']
+
+        def progress(bounds, found):
+            if verbosity > 1 or found:
+                self.stdout.write(f"Shard {bounds[0]}-{bounds[1]}: {len(found)} issue(s).")
+
+        drift = reconcile.check_all(options['shard_size'], options['workers'], on_shard=progress)
+        if drift:
+            # Drop anything that was only a write in flight during the first pass
+            drift = reconcile.confirm(drift)
+        for item in drift:
+            self.stdout.write(
+                f"Member {item['member_id']}: {item['kind']} #{item['object_id']} "
+                f"expected {item['expected']}, found {item['actual']}"
+            )
+
+        mismatches = [] if options['skip_rollups'] else reconcile.check_rollups()
+        for day, expected, actual in mismatches:
+            self.stdout.write(f"Rollup {day}: expected {self._rollup(expected)}, found {self._rollup(actual) if actual else 'no row'}")
+
+        if not drift and not mismatches:
+            self.stdout.write(self.style.SUCCESS("Ledger is consistent."))
+            return
+
+        members = len({item['member_id'] for item in drift})
+        summary = f"{len(drift)} issue(s) across {members} member(s), {len(mismatches)} rollup day(s) out of step."
+        if not options['repair']:
+            self.stdout.write(self.style.WARNING(summary + " Run with --repair to fix."))
+            return
+
+        repaired = reconcile.repair(drift)
+        rewritten = reconcile.repair_rollups(mismatches)
+        self.stdout.write(self.style.SUCCESS(f"{summary} Repaired {repaired} member(s) and rewrote {rewritten} rollup day(s)."))
+
+    @staticmethod
+    def _rollup(values):
+        dues, payments, payers, outstanding = values
+        return f"dues {dues:.2f}, payments {payments:.2f}, payers {payers}, outstanding {outstanding:.2f}"
@@ -0,0 +1,51 @@
+# Generated by Django 5.2 on 2026-10-18 12:28
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def backfill_balances(apps, schema_editor):
+    Due = apps.get_model('finances', 'Due')
+    Payment = apps.get_model('finances', 'Payment')
+    MemberBalance = apps.get_model('finances', 'MemberBalance')
+
+    totals = {}
+    for row in Due.objects.order_by().values('member_id').annotate(total=Sum('amount_due')):
+        totals.setdefault(row['member_id'], [Decimal('0.00'), Decimal('0.00')])[0] = row['total']
+    for row in Payment.objects.order_by().values('member_id').annotate(total=Sum('amount_paid')):
+        totals.setdefault(row['member_id'], [Decimal('0.00'), Decimal('0.00')])[1] = row['total']
+
+    MemberBalance.objects.bulk_create(
+        [
+            MemberBalance(member_id=member_id, total_dues=dues, total_payments=paid, balance=dues - paid)
+            for member_id, (dues, paid) in totals.items()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finances', '0002_initial'),
+        ('users', '0003_rename_phone_profile_phone_number_alter_profile_role'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MemberBalance',
+            fields=[
+                ('member', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ledger_balance', serialize=False, to='users.profile')),
+                ('total_dues', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('total_payments', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('balance', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['balance'], name='finances_balance_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_balances, migrations.RunPython.noop),
+    ]
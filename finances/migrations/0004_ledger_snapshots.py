@@ -0,0 +1,46 @@
+# Generated by Django 5.2 on 2026-10-18 12:32
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finances', '0003_memberbalance'),
+        ('users', '0003_rename_phone_profile_phone_number_alter_profile_role'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClosedPeriod',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_end', models.DateField(unique=True)),
+                ('frequency', models.CharField(choices=[('M', 'Monthly'), ('Y', 'Yearly')], default='M', max_length=1)),
+                ('closed_at', models.DateTimeField(auto_now_add=True)),
+                ('closed_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='closed_periods', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-period_end'],
+            },
+        ),
+        migrations.CreateModel(
+            name='LedgerSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_end', models.DateField()),
+                ('closing_dues', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('closing_payments', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('closing_balance', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('member', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_snapshots', to='users.profile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['period_end'], name='finances_snapshot_period_idx')],
+                'constraints': [models.UniqueConstraint(fields=('member', 'period_end'), name='finances_snapshot_member_period_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,118 @@
+# Generated by Django 5.2 on 2026-10-18 12:34
+
+import django.db.models.deletion
+from decimal import Decimal
+from collections import defaultdict
+
+from django.db import migrations, models
+
+ZERO = Decimal('0.00')
+
+
+# A frozen copy of finances.allocation.fifo_match / settlement as of this
+# migration, so later changes to the engine don't change this backfill
+def fifo_match(dues, payments):
+    matches = []
+    due_index = 0
+    for payment in payments:
+        while payment[1] > 0 and due_index < len(dues):
+            due = dues[due_index]
+            if due[1] <= 0:
+                due_index += 1
+                continue
+            amount = min(payment[1], due[1])
+            matches.append((payment[0], due[0], amount))
+            payment[1] -= amount
+            due[1] -= amount
+    return matches
+
+
+def settlement(amount_due, remaining):
+    if amount_due <= 0:
+        return ZERO, True
+    return amount_due - remaining, remaining <= 0
+
+
+def allocate_existing_payments(apps, schema_editor):
+    Profile = apps.get_model('users', 'Profile')
+    Due = apps.get_model('finances', 'Due')
+    Payment = apps.get_model('finances', 'Payment')
+    PaymentAllocation = apps.get_model('finances', 'PaymentAllocation')
+
+    member_ids = list(Profile.objects.order_by('pk').values_list('pk', flat=True))
+    for start in range(0, len(member_ids), 500):
+        chunk = member_ids[start:start + 500]
+        dues = defaultdict(list)
+        for due in Due.objects.filter(member_id__in=chunk).order_by('member_id', 'due_date', 'id'):
+            dues[due.member_id].append(due)
+        payments = defaultdict(list)
+        for payment in Payment.objects.filter(member_id__in=chunk).order_by('member_id', 'payment_date', 'id'):
+            payments[payment.member_id].append(payment)
+
+        allocations = []
+        for member_id, member_dues in dues.items():
+            due_rows = [[due.pk, due.amount_due] for due in member_dues]
+            payment_rows = [[payment.pk, payment.amount_paid] for payment in payments.get(member_id, [])]
+            for payment_id, due_id, amount in fifo_match(due_rows, payment_rows):
+                allocations.append(PaymentAllocation(payment_id=payment_id, due_id=due_id, amount=amount))
+            for due, (_, remaining) in zip(member_dues, due_rows):
+                due.amount_settled, due.is_settled = settlement(due.amount_due, remaining)
+            for payment, (_, remaining) in zip(payments.get(member_id, []), payment_rows):
+                payment.amount_allocated = payment.amount_paid - remaining
+
+        PaymentAllocation.objects.bulk_create(allocations, batch_size=1000)
+        Due.objects.bulk_update([due for rows in dues.values() for due in rows], ['amount_settled', 'is_settled'], batch_size=1000)
+        Payment.objects.bulk_update([payment for rows in payments.values() for payment in rows], ['amount_allocated'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finances', '0004_ledger_snapshots'),
+        ('users', '0003_rename_phone_profile_phone_number_alter_profile_role'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentAllocation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=8)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='due',
+            name='amount_settled',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=8),
+        ),
+        migrations.AddField(
+            model_name='due',
+            name='is_settled',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='amount_allocated',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=8),
+        ),
+        migrations.AddIndex(
+            model_name='due',
+            index=models.Index(fields=['member', 'is_settled', 'due_date'], name='finances_due_open_idx'),
+        ),
+        migrations.AddField(
+            model_name='paymentallocation',
+            name='due',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='allocations', to='finances.due'),
+        ),
+        migrations.AddField(
+            model_name='paymentallocation',
+            name='payment',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='allocations', to='finances.payment'),
+        ),
+        migrations.AddConstraint(
+            model_name='paymentallocation',
+            constraint=models.UniqueConstraint(fields=('payment', 'due'), name='finances_allocation_payment_due_uniq'),
+        ),
+        migrations.RunPython(allocate_existing_payments, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2 on 2026-10-18 12:38
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+# Makes (member, description, due_date) unique across every Due, manual or bulk,
+# which is what lets finances.dues skip members that were already charged.
+#
+# THIS CHANGES EXISTING DATA. Earlier bulk submissions could charge a member
+# twice, and such rows would block the constraint. No row is deleted (each is
+# a real charge on the ledger, so amounts and balances don't move), but every
+# copy after the first (lowest id) of a (member, description, due_date) group
+# has " (duplicate #<id>)" appended to its description, trimmed to fit. Find
+# them afterwards with
+#     Due.objects.filter(description__contains=' (duplicate #')
+# and delete the ones that were charged by mistake. Reversing the migration
+# drops the constraint but leaves the descriptions as they are.
+
+
+def mark_duplicate_dues(apps, schema_editor):
+    Due = apps.get_model('finances', 'Due')
+    groups = (
+        Due.objects.values('member_id', 'description', 'due_date')
+        .annotate(copies=Count('id')).filter(copies__gt=1)
+    )
+    for group in groups:
+        duplicates = Due.objects.filter(
+            member_id=group['member_id'], description=group['description'], due_date=group['due_date'],
+        ).order_by('id')[1:]
+        for due in duplicates:
+            suffix = f" (duplicate #{due.pk})"
+            due.description = due.description[:255 - len(suffix)] + suffix
+            due.save(update_fields=['description'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finances', '0005_payment_allocation'),
+        ('users', '0003_rename_phone_profile_phone_number_alter_profile_role'),
+    ]
+
+    operations = [
+        migrations.RunPython(mark_duplicate_dues, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='due',
+            constraint=models.UniqueConstraint(fields=('member', 'description', 'due_date'), name='finances_due_member_description_date_uniq'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2 on 2026-10-18 12:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finances', '0006_due_unique_charge'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DueSchedule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=8)),
+                ('description_template', models.CharField(help_text="e.g. 'Monthly subscription - {period}'. {period}, {month} and {year} are filled in.", max_length=200)),
+                ('frequency', models.CharField(choices=[('M', 'Monthly'), ('Q', 'Quarterly'), ('Y', 'Yearly')], default='M', max_length=1)),
+                ('start_date', models.DateField(help_text='Due date of the first occurrence; later ones fall on the same day of the month.')),
+                ('end_date', models.DateField(blank=True, null=True)),
+                ('target_statuses', models.CharField(default='ACT', help_text='Comma-separated member statuses to charge, e.g. ACT or ACT,SUS.', max_length=20)),
+                ('is_active', models.BooleanField(default=True)),
+                ('last_generated_on', models.DateField(blank=True, editable=False, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['start_date'],
+            },
+        ),
+    ]
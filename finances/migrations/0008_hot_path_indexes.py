@@ -0,0 +1,24 @@
+# Generated by Django 5.2 on 2026-10-18 12:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finances', '0007_due_schedule'),
+        ('users', '0004_hot_path_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='due',
+            index=models.Index(fields=['member', '-due_date', '-id'], name='finances_due_member_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['member', '-payment_date', '-id'], name='finances_pay_member_date_idx'),
+        ),
+    ]
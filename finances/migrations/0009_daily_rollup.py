@@ -0,0 +1,57 @@
+# Generated by Django 5.2 on 2026-10-18 12:46
+
+from decimal import Decimal
+from collections import defaultdict
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_rollups(apps, schema_editor):
+    # Frozen copy of finances.rollups.rebuild_from(None)
+    Due = apps.get_model('finances', 'Due')
+    Payment = apps.get_model('finances', 'Payment')
+    DailyRollup = apps.get_model('finances', 'DailyRollup')
+
+    totals = defaultdict(lambda: [Decimal('0.00'), Decimal('0.00'), 0])
+    for day, total in Due.objects.order_by().values_list('due_date').annotate(total=Sum('amount_due')):
+        totals[day][0] = total
+    for day, total, payers in Payment.objects.order_by().values_list('payment_date').annotate(total=Sum('amount_paid'), payers=Count('member_id', distinct=True)):
+        totals[day][1] = total
+        totals[day][2] = payers
+
+    outstanding = Decimal('0.00')
+    rows = []
+    for day in sorted(totals):
+        dues_raised, payments_received, payer_count = totals[day]
+        outstanding += dues_raised - payments_received
+        rows.append(DailyRollup(
+            day=day, dues_raised=dues_raised, payments_received=payments_received,
+            payer_count=payer_count, outstanding_total=outstanding,
+        ))
+    DailyRollup.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finances', '0008_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True)),
+                ('dues_raised', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('payments_received', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('payer_count', models.IntegerField(default=0)),
+                ('outstanding_total', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['day'],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
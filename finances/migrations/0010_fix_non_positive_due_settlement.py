@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-18 15:02
+
+from decimal import Decimal
+
+from django.db import migrations
+
+
+def fix_non_positive_dues(apps, schema_editor):
+    # 0005's backfill gave dues of zero or less amount_settled = amount_due; the
+    # allocation engine leaves them at zero (and settled), as finances.allocation.settlement
+    Due = apps.get_model('finances', 'Due')
+    Due.objects.filter(amount_due__lte=0).update(amount_settled=Decimal('0.00'), is_settled=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finances', '0009_daily_rollup'),
+    ]
+
+    operations = [
+        migrations.RunPython(fix_non_positive_dues, migrations.RunPython.noop),
+    ]
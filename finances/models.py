@@ -1,27 +1,355 @@
 # Create your models here.
 # finances/models.py
-from django.db import models
+from django.db import models, router, transaction
 from django.conf import settings
 from users.models import Profile # Import Profile
 from decimal import Decimal
 
-class Due(models.Model):
+
+class LedgerEntryQuerySet(models.QuerySet):
+    """
+    QuerySet for Due/Payment that keeps balances, allocations and rollups in
+    step with bulk inserts and with update()/bulk_update() of the member,
+    amount or date. Those updates send no signals, so the members and days
+    they touch are recomputed from the raw rows; saving instances is cheaper.
+    """
+
+    def bulk_create(self, objs, *args, **kwargs):
+        from .allocation import allocate_members, allocate_new_dues  # Avoid circular import
+        from .ledger import record_entries, refresh_members
+        from .periods import ensure_open
+        from .rollups import entry_state, rebuild_from, record_rollup
+
+        objs = list(objs)
+        ensure_open(obj.entry_date for obj in objs)
+        with transaction.atomic(using=self.db):
+            created = super().bulk_create(objs, *args, **kwargs)
+            if kwargs.get('ignore_conflicts') or kwargs.get('update_conflicts'):
+                # We can't tell which rows were written, so recompute the touched members and days
+                refresh_members({obj.member_id for obj in created})
+                if created:
+                    rebuild_from(min(obj.entry_date for obj in created))
+            else:
+                record_entries(self.model, created)
+                record_rollup(self.model, added=[entry_state(obj) for obj in created])
+            if issubclass(self.model, Due):
+                allocate_new_dues((obj.member_id, obj.due_date) for obj in created)
+            else:
+                allocate_members({obj.member_id for obj in created})
+        return created
+
+    def _ledger_fields(self):
+        return {'member', 'member_id', self.model.amount_field, self.model.date_field}
+
+    def _repost(self, pks, write):
+        """
+        Run `write`, an update of ledger columns on the rows `pks`, then
+        recompute the balances and allocations of every member involved and
+        the rollups from the earliest date involved, before or after.
+        """
+        from .allocation import reallocate_members  # Avoid circular import
+        from .ledger import refresh_members
+        from .periods import ensure_open
+        from .rollups import rebuild_from
+
+        rows = self.model._base_manager.using(self.db).filter(pk__in=pks)
+        with transaction.atomic(using=self.db):
+            before = list(rows.values_list('member_id', self.model.date_field))
+            ensure_open(day for _, day in before)
+            result = write()
+            after = list(rows.values_list('member_id', self.model.date_field))
+            ensure_open(day for _, day in after)
+            touched = before + after
+            if touched:
+                member_ids = {member_id for member_id, _ in touched}
+                refresh_members(member_ids)
+                rebuild_from(min(day for _, day in touched))
+                reallocate_members(member_ids)
+        return result
+
+    def update(self, **kwargs):
+        if self._ledger_fields().isdisjoint(kwargs):
+            return super().update(**kwargs)
+        pks = list(self.values_list('pk', flat=True))
+        return self._repost(pks, lambda: super(LedgerEntryQuerySet, self).update(**kwargs))
+
+    def bulk_update(self, objs, fields, batch_size=None):
+        if self._ledger_fields().isdisjoint(fields):
+            return super().bulk_update(objs, fields, batch_size=batch_size)
+        objs = list(objs)
+        return self._repost(
+            [obj.pk for obj in objs],
+            lambda: super(LedgerEntryQuerySet, self).bulk_update(objs, fields, batch_size=batch_size),
+        )
+
+
+class LedgerEntry(models.Model):
+    """Common behaviour for rows that move a member's balance (dues and payments)."""
+
+    amount_field = None  # Name of the amount column on the concrete model
+    date_field = None  # Name of the date column that decides the accounting period
+
+    objects = LedgerEntryQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what the row looked like when loaded so edits can post a delta
+        instance._ledger_state = instance.ledger_key()
+        instance._loaded_entry_date = instance.__dict__.get(cls.date_field)
+        return instance
+
+    def save(self, *args, **kwargs):
+        # The post_save receivers post to the ledger, allocations and rollups;
+        # commit (or roll back) them together with the row itself
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using):
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using):
+            return super().delete(*args, **kwargs)
+
+    @property
+    def entry_date(self):
+        return getattr(self, self.date_field)
+
+    @property
+    def ledger_amount(self):
+        return getattr(self, self.amount_field)
+
+    def ledger_key(self):
+        """(member_id, amount) as currently held on the instance, or None if not loaded."""
+        loaded = self.__dict__
+        if 'member_id' not in loaded or self.amount_field not in loaded:
+            return None
+        return (self.member_id, self.ledger_amount)
+
+
+class Due(LedgerEntry):
     member = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='dues')
     amount_due = models.DecimalField(max_digits=8, decimal_places=2)
     description = models.CharField(max_length=255)
     due_date = models.DateField()
     created_at = models.DateTimeField(auto_now_add=True)
+    # Maintained by finances.allocation from PaymentAllocation rows
+    amount_settled = models.DecimalField(max_digits=8, decimal_places=2, default=Decimal('0.00'))
+    is_settled = models.BooleanField(default=False)
+
+    amount_field = 'amount_due'
+    date_field = 'due_date'
+
+    class Meta:
+        constraints = [
+            # Lets bulk dues skip members that were already charged (see finances.dues)
+            models.UniqueConstraint(fields=['member', 'description', 'due_date'], name='finances_due_member_description_date_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['member', 'is_settled', 'due_date'], name='finances_due_open_idx'),
+            # Member statements list a member's dues newest first
+            models.Index(fields=['member', '-due_date', '-id'], name='finances_due_member_date_idx'),
+        ]
 
     def __str__(self):
         return f"{self.description} for {self.member.user.username} due {self.due_date}"
 
-class Payment(models.Model):
+    @property
+    def amount_outstanding(self):
+        return self.amount_due - self.amount_settled
+
+class Payment(LedgerEntry):
     member = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='payments')
     amount_paid = models.DecimalField(max_digits=8, decimal_places=2)
     payment_date = models.DateField()
     notes = models.TextField(blank=True, null=True)
     recorded_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='recorded_payments')
     recorded_at = models.DateTimeField(auto_now_add=True)
+    # Maintained by finances.allocation; the rest of amount_paid is member credit
+    amount_allocated = models.DecimalField(max_digits=8, decimal_places=2, default=Decimal('0.00'))
+
+    amount_field = 'amount_paid'
+    date_field = 'payment_date'
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['member', '-payment_date', '-id'], name='finances_pay_member_date_idx'),
+        ]
 
     def __str__(self):
         return f"Payment of {self.amount_paid} by {self.member.user.username} on {self.payment_date}"
+
+    @property
+    def amount_unallocated(self):
+        return self.amount_paid - self.amount_allocated
+
+
+class PaymentAllocation(models.Model):
+    """The part of a payment applied to a due, assigned oldest-first by finances.allocation."""
+    payment = models.ForeignKey(Payment, on_delete=models.CASCADE, related_name='allocations')
+    due = models.ForeignKey(Due, on_delete=models.CASCADE, related_name='allocations')
+    amount = models.DecimalField(max_digits=8, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['payment', 'due'], name='finances_allocation_payment_due_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.amount} of payment #{self.payment_id} to due #{self.due_id}"
+
+
+class DueSchedule(models.Model):
+    """
+    A recurring charge (monthly subscription, annual levy, ...) raised by
+    `manage.py generate_dues`.
+
+    The description template may use {period}, {month} and {year}; each
+    occurrence's rendered description is part of the Due uniqueness key, so
+    generating an occurrence twice never charges a member twice.
+    """
+    FREQUENCY_CHOICES = (
+        ('M', 'Monthly'),
+        ('Q', 'Quarterly'),
+        ('Y', 'Yearly'),
+    )
+    FREQUENCY_MONTHS = {'M': 1, 'Q': 3, 'Y': 12}
+
+    amount = models.DecimalField(max_digits=8, decimal_places=2)
+    description_template = models.CharField(max_length=200, help_text="e.g. 'Monthly subscription - {period}'. {period}, {month} and {year} are filled in.")
+    frequency = models.CharField(max_length=1, choices=FREQUENCY_CHOICES, default='M')
+    start_date = models.DateField(help_text="Due date of the first occurrence; later ones fall on the same day of the month.")
+    end_date = models.DateField(null=True, blank=True)
+    target_statuses = models.CharField(max_length=20, default='ACT', help_text="Comma-separated member statuses to charge, e.g. ACT or ACT,SUS.")
+    is_active = models.BooleanField(default=True)
+    last_generated_on = models.DateField(null=True, blank=True, editable=False) # Due date of the latest occurrence generated
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['start_date']
+
+    def __str__(self):
+        return f"{self.get_frequency_display()} {self.description_template} (₦{self.amount})"
+
+    @property
+    def status_list(self):
+        return [status.strip() for status in self.target_statuses.split(',') if status.strip()]
+
+    def clean(self):
+        from django.core.exceptions import ValidationError
+        errors = {}
+        valid_statuses = {code for code, _ in Profile.STATUS_CHOICES}
+        if not self.status_list or set(self.status_list) - valid_statuses:
+            errors['target_statuses'] = f"Use a comma-separated list of: {', '.join(sorted(valid_statuses))}."
+        if self.end_date and self.start_date and self.end_date < self.start_date:
+            errors['end_date'] = "The end date can't be before the start date."
+        if self.start_date:
+            try:
+                self.description_for(self.start_date)
+            except (KeyError, IndexError, ValueError):
+                errors['description_template'] = "Only {period}, {month} and {year} can be used as placeholders."
+        if errors:
+            raise ValidationError(errors)
+
+    def description_for(self, due_date):
+        if self.frequency == 'Y':
+            period = f"{due_date:%Y}"
+        elif self.frequency == 'Q':
+            period = f"Q{(due_date.month - 1) // 3 + 1} {due_date:%Y}"
+        else:
+            period = f"{due_date:%B %Y}"
+        return self.description_template.format(period=period, month=f"{due_date:%B}", year=due_date.year)[:255]
+
+
+class MemberBalance(models.Model):
+    """
+    Running dues/payments totals for one member.
+
+    Maintained incrementally by finances.ledger whenever a Due or Payment is
+    written, so member lists can read balances without scanning the ledger.
+    Rebuild from the raw rows with `manage.py rebuild_balances`.
+    """
+    member = models.OneToOneField(Profile, on_delete=models.CASCADE, primary_key=True, related_name='ledger_balance')
+    total_dues = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    total_payments = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    balance = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00')) # Dues - Payments (Positive = Owed)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['balance'], name='finances_balance_idx'),
+        ]
+
+    def __str__(self):
+        return f"Balance of {self.balance} for member #{self.member_id}"
+
+
+class DailyRollup(models.Model):
+    """
+    Club-wide ledger totals for one day, for dashboard KPIs.
+
+    Maintained incrementally by finances.rollups alongside MemberBalance.
+    outstanding_total is cumulative (all dues minus all payments up to the end
+    of the day); the other columns only count that day's entries. Rebuild from
+    the raw rows with `manage.py rebuild_rollups`.
+    """
+    day = models.DateField(unique=True)
+    dues_raised = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    payments_received = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    payer_count = models.IntegerField(default=0) # Members with at least one payment dated this day
+    outstanding_total = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['day']
+
+    def __str__(self):
+        return f"Rollup for {self.day}"
+
+
+class ClosedPeriod(models.Model):
+    """
+    A month or year whose ledger has been closed with `manage.py close_period`.
+
+    Dues and payments dated on or before the latest period_end are locked, and
+    balances are read from that period's LedgerSnapshot rows plus later entries.
+    """
+    FREQUENCY_CHOICES = (
+        ('M', 'Monthly'),
+        ('Y', 'Yearly'),
+    )
+
+    period_end = models.DateField(unique=True)
+    frequency = models.CharField(max_length=1, choices=FREQUENCY_CHOICES, default='M')
+    closed_at = models.DateTimeField(auto_now_add=True)
+    closed_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='closed_periods')
+
+    class Meta:
+        ordering = ['-period_end']
+
+    def __str__(self):
+        return f"{self.get_frequency_display()} period ending {self.period_end}"
+
+
+class LedgerSnapshot(models.Model):
+    """A member's cumulative dues, payments and balance at the end of a closed period."""
+    member = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='ledger_snapshots')
+    period_end = models.DateField()
+    closing_dues = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    closing_payments = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    closing_balance = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00')) # Dues - Payments
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['member', 'period_end'], name='finances_snapshot_member_period_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['period_end'], name='finances_snapshot_period_idx'),
+        ]
+
+    def __str__(self):
+        return f"Closing balance of {self.closing_balance} for member #{self.member_id} at {self.period_end}"
@@ -0,0 +1,112 @@
+# finances/periods.py
+"""
+Closing accounting periods.
+
+Closing a period writes one LedgerSnapshot per member holding their
+cumulative dues, payments and balance at the period end. Balance queries
+then start from the latest snapshot and only add the entries dated after it,
+so their cost depends on recent activity rather than on the club's age.
+Entries dated inside a closed period are locked against changes.
+"""
+import calendar
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Sum
+
+from .models import ClosedPeriod, Due, LedgerSnapshot, Payment
+
+ZERO = Decimal('0.00')
+
+
+def latest_period_end():
+    """End date of the most recent closed period, or None if nothing is closed."""
+    return ClosedPeriod.objects.order_by('-period_end').values_list('period_end', flat=True).first()
+
+
+def is_locked(entry_date, period_end=None):
+    period_end = period_end if period_end is not None else latest_period_end()
+    return period_end is not None and entry_date is not None and entry_date <= period_end
+
+
+def ensure_open(dates):
+    """Raise ValidationError if any of `dates` falls inside a closed period."""
+    dates = [d for d in dates if d is not None]
+    if not dates:
+        return
+    period_end = latest_period_end()
+    if period_end is not None and min(dates) <= period_end:
+        raise ValidationError(
+            f"The ledger is closed up to {period_end:%Y-%m-%d}; entries on or before that date can't be changed."
+        )
+
+
+def period_end_for(frequency, year, month=None):
+    """Last day of the given month ('M') or year ('Y')."""
+    if frequency == 'Y':
+        return date(year, 12, 31)
+    return date(year, month, calendar.monthrange(year, month)[1])
+
+
+def _grouped_totals(queryset, amount_field):
+    return {
+        row['member_id']: row['total']
+        for row in queryset.order_by().values('member_id').annotate(total=Sum(amount_field))
+    }
+
+
+def close_period(period_end, frequency='M', closed_by=None):
+    """
+    Close the ledger through `period_end` and return the number of snapshots written.
+
+    Each member's closing totals are their previous snapshot plus the entries
+    dated in (previous period end, period_end], so only the new period is read.
+    """
+    with transaction.atomic():
+        # Serialise closes so two runs can't snapshot the same window
+        previous_end = ClosedPeriod.objects.select_for_update() \
+            .order_by('-period_end').values_list('period_end', flat=True).first()
+        if previous_end is not None and period_end <= previous_end:
+            raise ValidationError(f"Periods up to {previous_end:%Y-%m-%d} are already closed.")
+
+        totals = defaultdict(lambda: [ZERO, ZERO])
+        if previous_end is not None:
+            for snapshot in LedgerSnapshot.objects.filter(period_end=previous_end).iterator():
+                totals[snapshot.member_id] = [snapshot.closing_dues, snapshot.closing_payments]
+
+        dues = Due.objects.filter(due_date__lte=period_end)
+        payments = Payment.objects.filter(payment_date__lte=period_end)
+        if previous_end is not None:
+            dues = dues.filter(due_date__gt=previous_end)
+            payments = payments.filter(payment_date__gt=previous_end)
+        for member_id, amount in _grouped_totals(dues, 'amount_due').items():
+            totals[member_id][0] += amount
+        for member_id, amount in _grouped_totals(payments, 'amount_paid').items():
+            totals[member_id][1] += amount
+
+        LedgerSnapshot.objects.bulk_create(
+            [
+                LedgerSnapshot(
+                    member_id=member_id,
+                    period_end=period_end,
+                    closing_dues=closing_dues,
+                    closing_payments=closing_payments,
+                    closing_balance=closing_dues - closing_payments,
+                )
+                for member_id, (closing_dues, closing_payments) in totals.items()
+            ],
+            batch_size=1000,
+        )
+        ClosedPeriod.objects.create(period_end=period_end, frequency=frequency, closed_by=closed_by)
+    return len(totals)
+
+
+def reopen_from(period_end):
+    """Reopen every period ending on or after `period_end`; returns how many were reopened."""
+    with transaction.atomic():
+        LedgerSnapshot.objects.filter(period_end__gte=period_end).delete()
+        count, _ = ClosedPeriod.objects.filter(period_end__gte=period_end).delete()
+    return count
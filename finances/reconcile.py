@@ -0,0 +1,203 @@
+# finances/reconcile.py
+"""
+Reconciliation of the derived finance tables against the raw ledger.
+
+Members are split into profile-id ranges ("shards"). Each shard is checked
+with a handful of grouped, read-only queries: MemberBalance totals against
+the Due/Payment sums, and the allocation columns on Due/Payment against
+their PaymentAllocation rows. Nothing is locked while checking; on
+PostgreSQL each shard reads one REPEATABLE READ snapshot so concurrent
+writes can't show up as half-applied drift. Shards can be checked in
+parallel worker processes; the daily rollups are club-wide and are checked
+once in the calling process.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from decimal import Decimal
+import multiprocessing
+
+from django.db import connection, connections, transaction
+from django.db.models import Count, DecimalField, F, Max, Min, Q, Sum
+from django.db.models.functions import Coalesce
+
+from users.models import Profile
+from . import allocation, ledger, reconcile_worker, rollups
+from .models import DailyRollup, Due, MemberBalance, Payment
+
+ZERO = Decimal('0.00')
+CENT = Decimal('0.01')
+DEFAULT_SHARD_SIZE = 5000
+
+
+def shard_ranges(shard_size=DEFAULT_SHARD_SIZE):
+    """[(first_id, last_id), ...] covering every profile id."""
+    bounds = Profile.objects.order_by().aggregate(first=Min('pk'), last=Max('pk'))
+    if bounds['first'] is None:
+        return []
+    return [
+        (start, min(start + shard_size - 1, bounds['last']))
+        for start in range(bounds['first'], bounds['last'] + 1, shard_size)
+    ]
+
+
+@contextmanager
+def _snapshot():
+    """
+    A transaction that reads one read-only snapshot where the database
+    supports it. SET TRANSACTION must be the transaction's first statement,
+    so the connection (and its setup queries) is opened before the
+    transaction begins. Inside a transaction that is already open, the check
+    joins it and reads what it reads.
+    """
+    opening = connection.get_autocommit()  # Connects if need be
+    with transaction.atomic():
+        if opening and connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY')
+        yield
+
+
+def _totals(dues, payments, balance):
+    return f"dues {dues.quantize(CENT)}, payments {payments.quantize(CENT)}, balance {balance.quantize(CENT)}"
+
+
+def _allocated(related):
+    return Coalesce(Sum(related), ZERO, output_field=DecimalField(max_digits=12, decimal_places=2))
+
+
+def check_shard(first_id, last_id):
+    """
+    Return the drift found for members with profile ids in [first_id, last_id]
+    as a list of dicts with member_id, kind ('balance', 'due_allocation' or
+    'payment_allocation'), object_id, expected and actual.
+    """
+    in_shard = {'member_id__gte': first_id, 'member_id__lte': last_id}
+    drift = []
+    with _snapshot():
+        expected = {}
+        for member_id, total in Due.objects.filter(**in_shard).order_by().values_list('member_id').annotate(total=Sum('amount_due')):
+            expected[member_id] = (total, ZERO)
+        for member_id, total in Payment.objects.filter(**in_shard).order_by().values_list('member_id').annotate(total=Sum('amount_paid')):
+            expected[member_id] = (expected.get(member_id, (ZERO, ZERO))[0], total)
+
+        cached = {
+            member_id: (total_dues, total_payments, balance)
+            for member_id, total_dues, total_payments, balance in MemberBalance.objects.filter(**in_shard)
+            .values_list('member_id', 'total_dues', 'total_payments', 'balance')
+        }
+        for member_id in set(expected) | set(cached):
+            dues, payments = expected.get(member_id, (ZERO, ZERO))
+            actual = cached.get(member_id)
+            if actual is None:
+                if dues or payments:
+                    drift.append({'member_id': member_id, 'kind': 'balance', 'object_id': member_id,
+                                  'expected': _totals(dues, payments, dues - payments), 'actual': None})
+            elif actual != (dues, payments, dues - payments):
+                drift.append({'member_id': member_id, 'kind': 'balance', 'object_id': member_id,
+                              'expected': _totals(dues, payments, dues - payments), 'actual': _totals(*actual)})
+
+        dues = (
+            Due.objects.filter(**in_shard).annotate(allocated=_allocated('allocations__amount'))
+            .filter(~Q(amount_settled=F('allocated')) | Q(is_settled=True, amount_settled__lt=F('amount_due'))
+                    | Q(is_settled=False, amount_settled__gte=F('amount_due'), amount_due__gt=0))
+            .values_list('member_id', 'pk', 'allocated', 'amount_settled')
+        )
+        for member_id, pk, allocated, settled in dues:
+            drift.append({'member_id': member_id, 'kind': 'due_allocation', 'object_id': pk,
+                          'expected': str(allocated.quantize(CENT)), 'actual': str(settled)})
+
+        payments = (
+            Payment.objects.filter(**in_shard).annotate(allocated=_allocated('allocations__amount'))
+            .exclude(amount_allocated=F('allocated'))
+            .values_list('member_id', 'pk', 'allocated', 'amount_allocated')
+        )
+        for member_id, pk, allocated, amount_allocated in payments:
+            drift.append({'member_id': member_id, 'kind': 'payment_allocation', 'object_id': pk,
+                          'expected': str(allocated.quantize(CENT)), 'actual': str(amount_allocated)})
+    return drift
+
+
+def check_rollups():
+    """
+    Days whose DailyRollup row disagrees with the raw rows, as (day, expected,
+    actual) tuples; expected and actual are (dues_raised, payments_received,
+    payer_count, outstanding_total), actual is None for a missing row.
+    """
+    expected = {}
+    for day, total in Due.objects.order_by().values_list('due_date').annotate(total=Sum('amount_due')):
+        expected[day] = [total, ZERO, 0]
+    payments = (
+        Payment.objects.order_by().values_list('payment_date')
+        .annotate(total=Sum('amount_paid'), payers=Count('member_id', distinct=True))
+    )
+    for day, total, payers in payments:
+        expected.setdefault(day, [ZERO, ZERO, 0])[1:] = [total, payers]
+
+    actual = {
+        day: tuple(rest)
+        for day, *rest in DailyRollup.objects.order_by('day')
+        .values_list('day', 'dues_raised', 'payments_received', 'payer_count', 'outstanding_total')
+    }
+    mismatches = []
+    outstanding = ZERO
+    for day in sorted(set(expected) | set(actual)):
+        dues, payments, payers = expected.get(day, (ZERO, ZERO, 0))
+        outstanding += dues - payments
+        row = actual.get(day)
+        if row is None and not (dues or payments):
+            continue
+        if row != (dues, payments, payers, outstanding):
+            mismatches.append((day, (dues, payments, payers, outstanding), row))
+    return mismatches
+
+
+def check_all(shard_size=DEFAULT_SHARD_SIZE, workers=1, on_shard=None):
+    """
+    Check every shard, in `workers` processes (in this process when 1).
+    `on_shard(bounds, drift)` is called as each shard finishes. Returns all drift.
+    """
+    shards = shard_ranges(shard_size)
+    drift = []
+    if workers <= 1:
+        for bounds in shards:
+            found = check_shard(*bounds)
+            drift.extend(found)
+            if on_shard:
+                on_shard(bounds, found)
+        return drift
+
+    connections.close_all()  # Never hand an open connection to a worker
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=reconcile_worker.init) as pool:
+        for bounds, found in zip(shards, pool.map(reconcile_worker.check_shard, shards)):
+            drift.extend(found)
+            if on_shard:
+                on_shard(bounds, found)
+    return drift
+
+
+def confirm(drift):
+    """Re-check the members in `drift` and keep only what is still wrong (filters out in-flight writes)."""
+    confirmed = []
+    for member_id in sorted({item['member_id'] for item in drift}):
+        confirmed.extend(check_shard(member_id, member_id))
+    return confirmed
+
+
+def repair(drift):
+    """Rebuild the balances and allocations of the members in `drift`. Returns the member count."""
+    balance_ids = sorted({item['member_id'] for item in drift if item['kind'] == 'balance'})
+    allocation_ids = sorted({item['member_id'] for item in drift if item['kind'] != 'balance'})
+    # Small transactions, so only a few members are locked at a time
+    for start in range(0, len(balance_ids), ledger.BATCH_SIZE):
+        ledger.refresh_members(balance_ids[start:start + ledger.BATCH_SIZE])
+    for start in range(0, len(allocation_ids), ledger.BATCH_SIZE):
+        allocation.reallocate_members(allocation_ids[start:start + ledger.BATCH_SIZE])
+    return len(set(balance_ids) | set(allocation_ids))
+
+
+def repair_rollups(mismatches):
+    """Rebuild the rollups from the earliest mismatched day. Returns the rows rewritten."""
+    if not mismatches:
+        return 0
+    return rollups.rebuild_from(min(day for day, _, _ in mismatches))
@@ -0,0 +1,20 @@
+# finances/reconcile_worker.py
+"""
+Entry points for reconcile_finances worker processes. This module imports
+no models, so a freshly spawned worker can unpickle these functions before
+Django is set up.
+"""
+import django
+from django.db import connections
+
+
+def init():
+    django.setup()
+
+
+def check_shard(bounds):
+    from .reconcile import check_shard as check
+    try:
+        return check(*bounds)
+    finally:
+        connections.close_all()
@@ -0,0 +1,132 @@
+# finances/reports.py
+"""
+Report builders shared by the views and management commands.
+
+Rows are produced by generators that walk querysets with .iterator(), so a
+report can be streamed to the browser or a file without ever holding the
+whole membership in memory.
+"""
+import csv
+from dataclasses import dataclass
+from decimal import Decimal
+
+from django.db.models import Count, DecimalField, Q, Sum, Value
+from django.db.models.functions import Coalesce
+
+from users.models import Profile
+
+ZERO = Decimal('0.00')
+DEFAULT_CHUNK_SIZE = 2000
+
+FINANCIAL_REPORT_HEADER = [
+    'Member Name',
+    'Total Dues (₦)',
+    'Total Payments (₦)',
+    'Balance (₦)',
+    'Status',
+    'Financial Status',
+]
+
+
+class Echo:
+    """Pseudo-buffer whose write() hands the value back, for csv.writer streaming."""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows):
+    """Yield each row of `rows` as a CSV-formatted string (str, line terminator included)."""
+    writer = csv.writer(Echo())
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def report_profiles(filter_status=''):
+    """Members included in the financial report, with balances, in report order."""
+    profiles = Profile.objects.filter(
+        user__is_superuser=False,
+        user__is_staff=False
+    ).select_related('user').with_balances().order_by('user__last_name', 'user__first_name')
+
+    # Apply filter if specified
+    if filter_status == 'up_to_date':
+        profiles = profiles.settled()  # Balance <= 0 means up to date
+    elif filter_status == 'overdue':
+        profiles = profiles.owing()  # Balance > 0 means overdue
+    return profiles
+
+
+@dataclass
+class ReportSummary:
+    """Totals shown at the top of the financial report and the end of its CSV."""
+    total_dues: Decimal = ZERO
+    total_payments: Decimal = ZERO
+    up_to_date_count: int = 0
+    overdue_count: int = 0
+    total_members: int = 0
+
+    @property
+    def total_balance(self):
+        """Outstanding balance across the members (dues - payments)."""
+        return self.total_dues - self.total_payments
+
+    @classmethod
+    def for_profiles(cls, profiles):
+        """
+        Summarise a with_balances() queryset in one conditional-aggregation
+        query instead of separate sums and counts.
+        """
+        zero = Value(ZERO)
+        totals = profiles.order_by().aggregate(
+            total_dues=Coalesce(Sum('total_dues'), zero, output_field=DecimalField()),
+            total_payments=Coalesce(Sum('total_payments'), zero, output_field=DecimalField()),
+            up_to_date_count=Count('pk', filter=Q(balance__lte=0)),
+            overdue_count=Count('pk', filter=Q(balance__gt=0)),
+            total_members=Count('pk'),
+        )
+        return cls(**totals)
+
+    def add(self, profile):
+        """Fold one annotated profile into the totals (for single-pass exports)."""
+        self.total_dues += profile.total_dues
+        self.total_payments += profile.total_payments
+        if profile.balance <= 0:
+            self.up_to_date_count += 1
+        else:
+            self.overdue_count += 1
+        self.total_members += 1
+
+    def as_rows(self):
+        return [
+            ['Summary'],
+            ['Total Dues:', self.total_dues],
+            ['Total Payments:', self.total_payments],
+            ['Total Balance:', self.total_balance],
+            ['Up to Date Members:', f'{self.up_to_date_count}/{self.total_members}'],
+        ]
+
+
+def financial_report_rows(profiles, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yield the financial report as lists: header, one row per member, then the
+    summary block. The summary totals are gathered during the same pass over
+    `profiles`, so the report costs a single query.
+    """
+    summary = ReportSummary()
+
+    yield FINANCIAL_REPORT_HEADER
+    for profile in profiles.iterator(chunk_size=chunk_size):
+        summary.add(profile)
+        yield [
+            profile.user.get_full_name(),
+            profile.total_dues,
+            profile.total_payments,
+            profile.balance,
+            profile.get_status_display(),
+            'Up to Date' if profile.balance <= 0 else 'Overdue'
+        ]
+
+    # Write summary
+    yield []
+    yield from summary.as_rows()
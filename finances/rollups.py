@@ -0,0 +1,231 @@
+# finances/rollups.py
+"""
+Daily KPI rollups.
+
+Every Due/Payment write is posted to the DailyRollup row of its date: the
+day's dues and payments move by the amount, outstanding_total moves for
+that day and every later day (one ranged UPDATE), and payer_count changes
+when a member gets their first payment of the day or loses their last. The
+dashboard reads only these rows, so its cost depends on the number of days
+shown, not on the size of the ledger.
+
+Rollup writers are serialised (see _lock_rollups): a missing day copies
+outstanding_total from the day before it, and a concurrent back-dated write
+that hasn't committed yet would otherwise never reach the copied row.
+"""
+from collections import Counter, defaultdict
+from datetime import date
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import DailyRollup, Due, Payment
+
+ZERO = Decimal('0.00')
+BATCH_SIZE = 1000
+ROLLUP_LOCK_ID = 0x46433932  # pg_advisory_xact_lock key, 'FC92'
+
+
+def _lock_rollups():
+    """
+    Hold the rollup lock until the current transaction ends. PostgreSQL only:
+    SQLite already lets a single writer in at a time.
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [ROLLUP_LOCK_ID])
+
+
+def _ensure_days(days):
+    """
+    Create missing rollup rows, carrying the previous day's outstanding_total
+    forward. Call with the rollup lock held, so that total is final.
+    """
+    existing = set(DailyRollup.objects.filter(day__in=days).values_list('day', flat=True))
+    for day in sorted(set(days) - existing):
+        outstanding = (
+            DailyRollup.objects.filter(day__lt=day).order_by('-day')
+            .values_list('outstanding_total', flat=True).first()
+        ) or ZERO
+        DailyRollup.objects.bulk_create([DailyRollup(day=day, outstanding_total=outstanding)], ignore_conflicts=True)
+
+
+def _payer_deltas(added, removed):
+    """
+    Change in payer_count per day. `added` are (member_id, day) pairs of
+    payments now in the table, `removed` pairs of payments no longer there.
+    """
+    added = Counter(added)
+    removed = set(removed) - set(added)
+    pairs = set(added) | removed
+    if not pairs:
+        return {}
+
+    counts = Counter()
+    rows = (
+        Payment.objects.filter(member_id__in={member_id for member_id, _ in pairs}, payment_date__in={day for _, day in pairs})
+        .order_by().values_list('member_id', 'payment_date').annotate(n=Count('id'))
+    )
+    for member_id, day, n in rows:
+        counts[(member_id, day)] = n
+
+    deltas = defaultdict(int)
+    for pair, n_added in added.items():
+        if counts[pair] == n_added:  # No other payment by this member that day
+            deltas[pair[1]] += 1
+    for pair in removed:
+        if counts[pair] == 0:
+            deltas[pair[1]] -= 1
+    return deltas
+
+
+def record_rollup(model, added=(), removed=()):
+    """
+    Post Due/Payment changes to the daily rollups. `added` and `removed` are
+    (member_id, day, amount) tuples for rows written to or taken off the table.
+    """
+    added = [entry for entry in added if entry[1] is not None]
+    removed = [entry for entry in removed if entry[1] is not None]
+    amounts = defaultdict(lambda: ZERO)
+    for _, day, amount in added:
+        amounts[day] += amount
+    for _, day, amount in removed:
+        amounts[day] -= amount
+
+    payers = {}
+    if issubclass(model, Payment):
+        payers = _payer_deltas([(m, d) for m, d, _ in added], [(m, d) for m, d, _ in removed])
+
+    days = {day for day, amount in amounts.items() if amount} | {day for day, delta in payers.items() if delta}
+    if not days:
+        return
+
+    column = 'payments_received' if issubclass(model, Payment) else 'dues_raised'
+    sign = -1 if issubclass(model, Payment) else 1
+    now = timezone.now()
+    with transaction.atomic():
+        _lock_rollups()
+        _ensure_days(days)
+        for day in sorted(days):
+            amount = amounts.get(day, ZERO)
+            DailyRollup.objects.filter(day=day).update(
+                **{column: F(column) + amount},
+                payer_count=F('payer_count') + payers.get(day, 0),
+                updated_at=now,
+            )
+            if amount:
+                DailyRollup.objects.filter(day__gte=day).update(outstanding_total=F('outstanding_total') + sign * amount)
+
+
+def entry_state(entry):
+    """(member_id, day, amount) of a Due/Payment as currently held on the instance."""
+    return (entry.member_id, entry.entry_date, entry.ledger_amount)
+
+
+def loaded_state(entry):
+    """(member_id, day, amount) of a Due/Payment as it was loaded, or None if unknown."""
+    previous = getattr(entry, '_ledger_state', None)
+    loaded_date = getattr(entry, '_loaded_entry_date', None)
+    if previous is None or loaded_date is None:
+        return None
+    return (previous[0], loaded_date, previous[1])
+
+
+def rebuild_from(since=None, batch_size=BATCH_SIZE):
+    """
+    Recompute the rollup rows from `since` onwards (every day when None)
+    from the raw Due/Payment rows. Returns the number of rows written.
+    """
+    with transaction.atomic():
+        # Read the raw totals only once the lock is held, so a record_rollup
+        # that committed just before is counted rather than overwritten
+        _lock_rollups()
+        dues = Due.objects.order_by()
+        payments = Payment.objects.order_by()
+        if since is not None:
+            dues = dues.filter(due_date__gte=since)
+            payments = payments.filter(payment_date__gte=since)
+
+        totals = defaultdict(lambda: [ZERO, ZERO, 0])
+        for day, total in dues.values_list('due_date').annotate(total=Sum('amount_due')):
+            totals[day][0] = total
+        for day, total, payers in payments.values_list('payment_date').annotate(total=Sum('amount_paid'), payers=Count('member_id', distinct=True)):
+            totals[day][1] = total
+            totals[day][2] = payers
+
+        stale = DailyRollup.objects.all()
+        outstanding = ZERO
+        if since is not None:
+            stale = stale.filter(day__gte=since)
+            outstanding = (
+                DailyRollup.objects.filter(day__lt=since).order_by('-day')
+                .values_list('outstanding_total', flat=True).first()
+            ) or ZERO
+        stale.delete()
+
+        rows = []
+        for day in sorted(totals):
+            dues_raised, payments_received, payer_count = totals[day]
+            outstanding += dues_raised - payments_received
+            rows.append(DailyRollup(
+                day=day, dues_raised=dues_raised, payments_received=payments_received,
+                payer_count=payer_count, outstanding_total=outstanding,
+            ))
+        DailyRollup.objects.bulk_create(rows, batch_size=batch_size)
+    return len(rows)
+
+
+def _month_start(day, months_back=0):
+    month_index = day.year * 12 + day.month - 1 - months_back
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def dashboard_kpis(today=None, months=12):
+    """
+    KPIs for the financial dashboard, read from the rollups only:
+    outstanding, month-to-date receipts, the collection rate over the
+    trend window and a per-month trend (dues, payments, rate, month-end
+    outstanding), oldest month first.
+    """
+    today = today or timezone.now().date()
+    window_start = _month_start(today, months - 1)
+    month_start = _month_start(today)
+
+    opening = (
+        DailyRollup.objects.filter(day__lt=window_start).order_by('-day')
+        .values_list('outstanding_total', flat=True).first()
+    ) or ZERO
+    by_month = {
+        row['month']: row for row in
+        DailyRollup.objects.filter(day__gte=window_start, day__lte=today)
+        .annotate(month=TruncMonth('day')).order_by().values('month')
+        .annotate(dues=Sum('dues_raised'), payments=Sum('payments_received'))
+    }
+
+    trend = []
+    outstanding = opening
+    for offset in range(months - 1, -1, -1):
+        month = _month_start(today, offset)
+        row = by_month.get(month, {})
+        dues, payments = row.get('dues') or ZERO, row.get('payments') or ZERO
+        outstanding += dues - payments
+        trend.append({
+            'month': month,
+            'dues': dues,
+            'payments': payments,
+            'collection_rate': round(payments / dues * 100, 1) if dues else None,
+            'outstanding': outstanding,
+        })
+
+    window_dues = sum((month['dues'] for month in trend), ZERO)
+    window_payments = sum((month['payments'] for month in trend), ZERO)
+    current = by_month.get(month_start, {})
+    return {
+        'outstanding_total': outstanding,
+        'month_to_date_receipts': current.get('payments') or ZERO,
+        'collection_rate': round(window_payments / window_dues * 100, 1) if window_dues else None,
+        'trend': trend,
+    }
@@ -0,0 +1,115 @@
+from django.db.models import QuerySet
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+from .models import Due, Payment
+from . import allocation, ledger, rollups
+from .periods import ensure_open
+
+
+@receiver(pre_save, sender=Due)
+@receiver(pre_save, sender=Payment)
+def load_stored_state(sender, instance, raw=False, **kwargs):
+    """
+    Read the stored member, amount and date of a row that is being saved
+    without having been loaded whole (built by hand, or with deferred
+    fields), so the receivers below can post a delta from it.
+    """
+    if raw or instance.pk is None or rollups.loaded_state(instance) is not None:
+        return
+    stored = sender.objects.filter(pk=instance.pk) \
+        .values_list('member_id', sender.amount_field, sender.date_field).first()
+    if stored is not None:
+        member_id, amount, entry_date = stored
+        instance._ledger_state = (member_id, amount)
+        instance._loaded_entry_date = entry_date
+
+
+@receiver(pre_save, sender=Due)
+@receiver(pre_save, sender=Payment)
+def block_closed_period_saves(sender, instance, raw=False, **kwargs):
+    """Refuse to write entries dated in a closed period (old or new date)."""
+    if raw:
+        return
+    ensure_open([instance.entry_date, getattr(instance, '_loaded_entry_date', None)])
+
+
+def _is_direct_delete(origin):
+    """True unless the entry is going because its member (or user) is being deleted."""
+    return isinstance(origin, (Due, Payment)) or (isinstance(origin, QuerySet) and issubclass(origin.model, (Due, Payment)))
+
+
+@receiver(pre_delete, sender=Due)
+@receiver(pre_delete, sender=Payment)
+def block_closed_period_deletes(sender, instance, origin=None, **kwargs):
+    # Deleting a whole member cascades through their history; only guard direct deletes
+    if _is_direct_delete(origin):
+        ensure_open([instance.entry_date])
+
+
+@receiver(post_save, sender=Due)
+@receiver(post_save, sender=Payment)
+def post_entry_to_ledger(sender, instance, created, raw=False, **kwargs):
+    """Keep MemberBalance in step with every saved Due/Payment."""
+    if raw:  # loaddata; run rebuild_balances afterwards
+        return
+    if created:
+        ledger.record_entries(sender, [instance])
+    else:
+        ledger.record_change(instance, getattr(instance, '_ledger_state', None))
+
+
+@receiver(post_save, sender=Due)
+@receiver(post_save, sender=Payment)
+def allocate_entry(sender, instance, created, raw=False, **kwargs):
+    """Allocate new money oldest-first; an edit reallocates the affected member(s)."""
+    if raw:
+        return
+    if created and sender is Due:
+        allocation.allocate_new_dues([(instance.member_id, instance.due_date)])
+    elif created:
+        allocation.allocate_members([instance.member_id])
+    else:
+        previous = getattr(instance, '_ledger_state', None)
+        moved = previous != instance.ledger_key() or getattr(instance, '_loaded_entry_date', None) != instance.entry_date
+        if moved:
+            member_ids = {instance.member_id}
+            if previous:
+                member_ids.add(previous[0])
+            allocation.reallocate_members(member_ids)
+
+
+@receiver(post_save, sender=Due)
+@receiver(post_save, sender=Payment)
+def post_entry_to_rollups(sender, instance, created, raw=False, **kwargs):
+    """Keep the daily KPI rollups in step with every saved Due/Payment."""
+    if raw:  # loaddata; run rebuild_rollups afterwards
+        return
+    current = rollups.entry_state(instance)
+    if created:
+        rollups.record_rollup(sender, added=[current])
+        return
+    previous = rollups.loaded_state(instance)  # Filled in by load_stored_state when not loaded
+    if previous != current:
+        rollups.record_rollup(sender, added=[current], removed=[previous] if previous else [])
+
+
+@receiver(post_save, sender=Due)
+@receiver(post_save, sender=Payment)
+def remember_saved_state(sender, instance, raw=False, **kwargs):
+    # Registered last, so the receivers above still see the state as loaded
+    instance._ledger_state = instance.ledger_key()
+    instance._loaded_entry_date = instance.entry_date
+
+
+@receiver(post_delete, sender=Due)
+@receiver(post_delete, sender=Payment)
+def remove_entry_from_ledger(sender, instance, origin=None, **kwargs):
+    ledger.record_removal(instance)
+    if _is_direct_delete(origin):
+        allocation.reallocate_members([instance.member_id])
+
+
+@receiver(post_delete, sender=Due)
+@receiver(post_delete, sender=Payment)
+def remove_entry_from_rollups(sender, instance, **kwargs):
+    rollups.record_rollup(sender, removed=[rollups.loaded_state(instance) or rollups.entry_state(instance)])
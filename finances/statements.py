@@ -0,0 +1,146 @@
+# finances/statements.py
+"""
+Member statements: dues and payments merged into one dated ledger with a
+running balance, computed by the database.
+
+One query does the work. Dues (debits) and payments (credits) are combined
+with UNION ALL and a SUM() OVER (ORDER BY date, dues first, id) window gives
+the running balance. The window starts from the latest LedgerSnapshot
+before the statement period, so viewing one period of a long history only
+reads the entries since the last closed period. The opening balance comes
+back as the first row.
+"""
+from datetime import date
+from decimal import Decimal
+
+from django.db import connection
+from django.utils.dateparse import parse_date
+
+from .models import Due, LedgerSnapshot, Payment
+
+ZERO = Decimal('0.00')
+CENT = Decimal('0.01')
+
+STATEMENT_HEADER = ['Date', 'Description', 'Charges (₦)', 'Payments (₦)', 'Balance (₦)']
+
+
+def _money(value):
+    # SQLite hands back floats/ints for SUM over decimal columns
+    return Decimal(str(value or 0)).quantize(CENT)
+
+
+def _date(value):
+    return parse_date(value) if isinstance(value, str) else value
+
+
+def _statement_sql():
+    """
+    Parameters: member (snapshot), start (snapshot), member (due), start (due
+    snapshot bound), end, member (payment), start (payment snapshot bound),
+    end, start (opening), start (lines).
+    """
+    qn = connection.ops.quote_name
+    snapshot = qn(LedgerSnapshot._meta.db_table)
+    # Latest closed-period snapshot strictly before the statement starts
+    base_filter = f"""
+        FROM {snapshot}
+        WHERE {snapshot}.{qn('member_id')} = %s AND {snapshot}.{qn('period_end')} < %s
+        ORDER BY {snapshot}.{qn('period_end')} DESC
+    """
+    since_base = f"""
+        > COALESCE((SELECT {snapshot}.{qn('period_end')} FROM {snapshot}
+                    WHERE {snapshot}.{qn('member_id')} = %s AND {snapshot}.{qn('period_end')} < %s
+                    ORDER BY {snapshot}.{qn('period_end')} DESC LIMIT 1), %s)
+    """
+    return f"""
+        WITH base AS (
+            SELECT {snapshot}.{qn('closing_balance')} AS balance {base_filter} LIMIT 1
+        ),
+        entries AS (
+            SELECT {qn('due_date')} AS entry_date, 0 AS kind_order, {qn('id')} AS entry_id,
+                   {qn('description')} AS description,
+                   {qn('amount_due')} AS debit, 0 AS credit
+            FROM {qn(Due._meta.db_table)}
+            WHERE {qn('member_id')} = %s AND {qn('due_date')} {since_base} AND {qn('due_date')} <= %s
+            UNION ALL
+            SELECT {qn('payment_date')}, 1, {qn('id')},
+                   COALESCE({qn('notes')}, ''),
+                   0, {qn('amount_paid')}
+            FROM {qn(Payment._meta.db_table)}
+            WHERE {qn('member_id')} = %s AND {qn('payment_date')} {since_base} AND {qn('payment_date')} <= %s
+        ),
+        ledger AS (
+            SELECT entries.*,
+                   COALESCE((SELECT balance FROM base), 0) + SUM(debit - credit) OVER (
+                       ORDER BY entry_date, kind_order, entry_id
+                       ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW
+                   ) AS running_balance
+            FROM entries
+        )
+        SELECT 0 AS row_order, NULL AS entry_date, NULL AS kind_order, NULL AS entry_id,
+               'Opening balance' AS description, 0 AS debit, 0 AS credit,
+               COALESCE((SELECT balance FROM base), 0)
+                 + COALESCE((SELECT SUM(debit - credit) FROM entries WHERE entry_date < %s), 0) AS running_balance
+        UNION ALL
+        SELECT 1, entry_date, kind_order, entry_id, description, debit, credit, running_balance
+        FROM ledger
+        WHERE entry_date >= %s
+        ORDER BY row_order, entry_date, kind_order, entry_id
+    """
+
+
+def member_statement(profile, start=None, end=None):
+    """
+    Statement of `profile` between `start` and `end` (inclusive; open-ended
+    when None). Returns a dict with opening_balance, lines, total_charges,
+    total_payments and closing_balance. Each line has date, kind ('due' or
+    'payment'), id, description, charge, payment and balance. Balances are
+    dues minus payments (positive = owed).
+    """
+    start = start or date.min
+    end = end or date.max
+    member_id = profile.pk
+    params = [
+        member_id, start,
+        member_id, member_id, start, date.min, end,
+        member_id, member_id, start, date.min, end,
+        start, start,
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(_statement_sql(), params)
+        rows = cursor.fetchall()
+
+    opening_balance = _money(rows[0][7])
+    lines = []
+    for _, entry_date, kind_order, entry_id, description, debit, credit, running_balance in rows[1:]:
+        lines.append({
+            'date': _date(entry_date),
+            'kind': 'due' if kind_order == 0 else 'payment',
+            'id': entry_id,
+            'description': description,
+            'charge': _money(debit),
+            'payment': _money(credit),
+            'balance': _money(running_balance),
+        })
+    return {
+        'opening_balance': opening_balance,
+        'lines': lines,
+        'total_charges': sum((line['charge'] for line in lines), ZERO),
+        'total_payments': sum((line['payment'] for line in lines), ZERO),
+        'closing_balance': lines[-1]['balance'] if lines else opening_balance,
+    }
+
+
+def statement_rows(statement):
+    """Yield a statement as CSV rows, header first."""
+    yield STATEMENT_HEADER
+    yield ['', 'Opening balance', '', '', statement['opening_balance']]
+    for line in statement['lines']:
+        yield [
+            line['date'].isoformat(),
+            line['description'] or ('Payment' if line['kind'] == 'payment' else ''),
+            line['charge'] or '',
+            line['payment'] or '',
+            line['balance'],
+        ]
+    yield ['', 'Closing balance', statement['total_charges'], statement['total_payments'], statement['closing_balance']]
@@ -1,3 +1,951 @@
+import csv
+import os
+import tempfile
+from datetime import date
+from decimal import Decimal
+from importlib import import_module
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.apps import apps
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from users.models import Profile, User
+from . import allocation, importers, ledger, reconcile, rollups
+from .dues import generate_bulk_dues, schedule_occurrences
+from .history import history_page
+from .statements import member_statement
+from .aging import aging_by_member, aging_totals
+from .models import ClosedPeriod, DailyRollup, Due, DueSchedule, LedgerSnapshot, MemberBalance, Payment, PaymentAllocation
+
+
+class AdminChangelistQueryTests(TestCase):
+    """The ledger changelists cost the same number of queries however many rows a page shows."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('treasurer', 'treasurer@example.com', 'pass')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def seed(self, count):
+        start = User.objects.count()
+        for n in range(start, start + count):
+            member = User.objects.create_user(f'member{n}', f'member{n}@example.com').profile
+            Due.objects.create(member=member, amount_due=Decimal('10.00'), description='Subscription', due_date=date(2025, 1, 1))
+            Payment.objects.create(member=member, amount_paid=Decimal('4.00'), payment_date=date(2025, 1, 2), recorded_by=self.admin)
+
+    def changelist_queries(self, url, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params or {})
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        urls = [
+            reverse('admin:finances_due_changelist'),
+            reverse('admin:finances_payment_changelist'),
+            reverse('admin:users_profile_changelist'),
+            reverse('admin:users_user_changelist'),
+        ]
+        self.seed(3)
+        few = [self.changelist_queries(url) for url in urls]
+        self.seed(40)
+        many = [self.changelist_queries(url) for url in urls]
+        self.assertEqual(few, many)
+
+    def test_member_filter(self):
+        self.seed(5)
+        url = reverse('admin:finances_payment_changelist')
+        response = self.client.get(url, {'member': 'member2'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['cl'].result_list), list(Payment.objects.filter(member__user__username='member2')))
+        # The sidebar is an input box, not a list of every member
+        self.assertNotContains(response, '?member=member3')
+
+    def test_export_action(self):
+        self.seed(3)
+        response = self.client.post(reverse('admin:finances_due_changelist'), {
+            'action': 'export_as_csv',
+            '_selected_action': list(Due.objects.values_list('pk', flat=True)),
+        })
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'ID,Member,Description,Amount Due,Due Date,Amount Settled,Settled')
+        self.assertEqual(len(lines), 4)
+
+    def test_recalculate_action(self):
+        self.seed(2)
+        member = Due.objects.first().member
+        member.ledger_balance.delete()
+        self.client.post(reverse('admin:finances_due_changelist'), {
+            'action': 'recalculate_members',
+            '_selected_action': list(Due.objects.filter(member=member).values_list('pk', flat=True)),
+        })
+        member.refresh_from_db()
+        self.assertEqual(member.ledger_balance.balance, Decimal('6.00'))
+
+
+class AgingReportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.ada = User.objects.create_user('ada', 'ada@example.com', first_name='Ada', last_name='Adams').profile
+        cls.bayo = User.objects.create_user('bayo', 'bayo@example.com', first_name='Bayo', last_name='Bello').profile
+        for member, amount, due_date in [
+            (cls.ada, '100.00', date(2025, 1, 1)),
+            (cls.ada, '50.00', date(2025, 3, 1)),
+            (cls.ada, '30.00', date(2025, 4, 10)),
+            (cls.ada, '40.00', date(2025, 5, 1)),  # Not yet raised on 2025-04-15
+            (cls.bayo, '20.00', date(2024, 12, 1)),
+        ]:
+            Due.objects.create(member=member, amount_due=Decimal(amount), description=f'Levy {due_date}', due_date=due_date)
+        Payment.objects.create(member=cls.ada, amount_paid=Decimal('120.00'), payment_date=date(2025, 3, 15))
+
+    def buckets(self, row):
+        return [row[bucket] for bucket in ('current', 'days_31_60', 'days_61_90', 'over_90', 'total')]
+
+    def test_buckets(self):
+        rows = list(aging_by_member(date(2025, 4, 15)))
+        self.assertEqual([row['name'] for row in rows], ['Ada Adams', 'Bayo Bello'])
+        # The payment clears the January due and 70.00 of March's, oldest first
+        self.assertEqual(self.buckets(rows[0]), [Decimal('30.00'), Decimal('30.00'), Decimal('0.00'), Decimal('0.00'), Decimal('60.00')])
+        self.assertEqual(self.buckets(rows[1]), [Decimal('0.00'), Decimal('0.00'), Decimal('0.00'), Decimal('20.00'), Decimal('20.00')])
+
+        totals = aging_totals(date(2025, 4, 15))
+        self.assertEqual(totals['members'], 2)
+        self.assertEqual(totals['total'], Decimal('80.00'))
+        self.assertEqual(totals['current'], Decimal('30.00'))
+
+    def test_past_report_date_ignores_later_dues_and_payments(self):
+        rows = list(aging_by_member(date(2025, 2, 1)))
+        self.assertEqual(self.buckets(rows[0]), [Decimal('0.00'), Decimal('100.00'), Decimal('0.00'), Decimal('0.00'), Decimal('100.00')])
+        self.assertEqual(aging_totals(date(2025, 2, 1))['total'], Decimal('120.00'))
+
+        # Before anything was raised nobody owes anything
+        self.assertEqual(list(aging_by_member(date(2024, 11, 30))), [])
+        self.assertEqual(aging_totals(date(2024, 11, 30))['members'], 0)
+
+    def test_settled_member_is_left_out(self):
+        Payment.objects.create(member=self.bayo, amount_paid=Decimal('20.00'), payment_date=date(2025, 1, 5))
+        self.assertEqual([row['name'] for row in aging_by_member(date(2025, 4, 15))], ['Ada Adams'])
+
+
+class DailyRollupTests(TestCase):
+    """Every write posts a delta; the rows always match a rebuild from the raw ledger."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ada = User.objects.create_user('ada', 'ada@example.com').profile
+        cls.bayo = User.objects.create_user('bayo', 'bayo@example.com').profile
+
+    def assertRollupsMatchLedger(self):
+        self.assertEqual(reconcile.check_rollups(), [])
+
+    def rollup(self, day):
+        return DailyRollup.objects.values_list('dues_raised', 'payments_received', 'payer_count', 'outstanding_total').get(day=day)
+
+    def test_back_dated_entries_carry_outstanding_forward(self):
+        Due.objects.create(member=self.ada, amount_due=Decimal('100.00'), description='Levy', due_date=date(2025, 1, 10))
+        Payment.objects.create(member=self.ada, amount_paid=Decimal('30.00'), payment_date=date(2025, 1, 20))
+        # Into the gap between two days, then before the first one
+        Due.objects.create(member=self.bayo, amount_due=Decimal('50.00'), description='Levy', due_date=date(2025, 1, 15))
+        Payment.objects.create(member=self.bayo, amount_paid=Decimal('5.00'), payment_date=date(2025, 1, 1))
+
+        self.assertEqual(self.rollup(date(2025, 1, 1)), (Decimal('0.00'), Decimal('5.00'), 1, Decimal('-5.00')))
+        self.assertEqual(self.rollup(date(2025, 1, 10)), (Decimal('100.00'), Decimal('0.00'), 0, Decimal('95.00')))
+        self.assertEqual(self.rollup(date(2025, 1, 15)), (Decimal('50.00'), Decimal('0.00'), 0, Decimal('145.00')))
+        self.assertEqual(self.rollup(date(2025, 1, 20)), (Decimal('0.00'), Decimal('30.00'), 1, Decimal('115.00')))
+        self.assertRollupsMatchLedger()
+
+    def test_edits_and_deletes(self):
+        due = Due.objects.create(member=self.ada, amount_due=Decimal('100.00'), description='Levy', due_date=date(2025, 1, 10))
+        first = Payment.objects.create(member=self.ada, amount_paid=Decimal('30.00'), payment_date=date(2025, 1, 20))
+        second = Payment.objects.create(member=self.bayo, amount_paid=Decimal('10.00'), payment_date=date(2025, 1, 20))
+        self.assertEqual(self.rollup(date(2025, 1, 20))[2], 2)
+
+        due.amount_due = Decimal('80.00')
+        due.save()
+        self.assertRollupsMatchLedger()
+        due.due_date = date(2025, 1, 25)
+        due.save()
+        self.assertRollupsMatchLedger()
+        second.member = self.ada  # Ada now paid twice that day, Bayo not at all
+        second.save()
+        self.assertEqual(self.rollup(date(2025, 1, 20))[2], 1)
+        self.assertRollupsMatchLedger()
+        first.payment_date = date(2025, 1, 21)
+        first.save()
+        self.assertRollupsMatchLedger()
+        second.delete()
+        self.assertEqual(self.rollup(date(2025, 1, 20))[2], 0)
+        self.assertRollupsMatchLedger()
+
+    def test_rebuild_counts_a_write_committed_while_it_waited_for_the_lock(self):
+        Due.objects.create(member=self.ada, amount_due=Decimal('100.00'), description='Levy', due_date=date(2025, 1, 10))
+        lock = rollups._lock_rollups
+        waited = []
+
+        def lock_after_a_concurrent_write():
+            if not waited:
+                waited.append(True)  # Another request commits a payment while we wait
+                Payment.objects.create(member=self.bayo, amount_paid=Decimal('30.00'), payment_date=date(2025, 1, 12))
+            lock()
+
+        with mock.patch.object(rollups, '_lock_rollups', side_effect=lock_after_a_concurrent_write):
+            rollups.rebuild_from(date(2025, 1, 1))
+        self.assertEqual(self.rollup(date(2025, 1, 12)), (Decimal('0.00'), Decimal('30.00'), 1, Decimal('70.00')))
+        self.assertRollupsMatchLedger()
+
+    def test_saving_a_row_that_was_not_loaded_posts_a_delta(self):
+        due = Due.objects.create(member=self.ada, amount_due=Decimal('100.00'), description='Levy', due_date=date(2025, 1, 10))
+        Payment.objects.create(member=self.ada, amount_paid=Decimal('30.00'), payment_date=date(2025, 1, 20))
+
+        rebuilt = Due(pk=due.pk, member=self.ada, amount_due=Decimal('60.00'), description='Levy',
+                      due_date=date(2025, 1, 5), created_at=due.created_at)
+        with CaptureQueriesContext(connection) as queries:
+            rebuilt.save()
+        rollup_deletes = [q['sql'] for q in queries if q['sql'].startswith('DELETE') and 'dailyrollup' in q['sql']]
+        self.assertEqual(rollup_deletes, [])
+        self.assertRollupsMatchLedger()
+        self.ada.ledger_balance.refresh_from_db()
+        self.assertEqual(self.ada.ledger_balance.balance, Decimal('30.00'))
+
+        deferred = Due.objects.only('id', 'description').get(pk=due.pk)
+        deferred.due_date = date(2025, 1, 25)
+        deferred.save()
+        self.assertFalse(DailyRollup.objects.filter(day=date(2025, 1, 5), dues_raised__gt=0).exists())
+        self.assertRollupsMatchLedger()
+
+
+class AllocationTests(TestCase):
+    """Payments settle dues oldest-first, and incremental allocation agrees with a full reallocation."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.member = User.objects.create_user('ada', 'ada@example.com').profile
+
+    def due(self, amount, due_date, description='Levy'):
+        return Due.objects.create(member=self.member, amount_due=Decimal(amount), description=f'{description} {due_date}', due_date=due_date)
+
+    def pay(self, amount, payment_date):
+        return Payment.objects.create(member=self.member, amount_paid=Decimal(amount), payment_date=payment_date)
+
+    def state(self):
+        dues = list(Due.objects.order_by('due_date', 'id').values_list('amount_settled', 'is_settled'))
+        payments = list(Payment.objects.order_by('payment_date', 'id').values_list('amount_allocated', flat=True))
+        allocations = sorted(PaymentAllocation.objects.values_list('payment_id', 'due_id', 'amount'))
+        return dues, payments, allocations
+
+    def assertMatchesReallocation(self):
+        incremental = self.state()
+        allocation.reallocate_members([self.member.pk])
+        self.assertEqual(self.state(), incremental)
+        self.assertEqual(reconcile.check_shard(self.member.pk, self.member.pk), [])
+
+    def test_partial_payments_fill_the_oldest_due_first(self):
+        self.due('100.00', date(2025, 1, 1))
+        self.due('50.00', date(2025, 2, 1))
+        self.pay('60.00', date(2025, 2, 5))
+        self.pay('60.00', date(2025, 2, 6))
+        dues, payments, _ = self.state()
+        self.assertEqual(dues, [(Decimal('100.00'), True), (Decimal('20.00'), False)])
+        self.assertEqual(payments, [Decimal('60.00'), Decimal('60.00')])
+        self.assertMatchesReallocation()
+
+    def test_overpayment_is_kept_as_credit_for_later_dues(self):
+        self.due('30.00', date(2025, 1, 1))
+        payment = self.pay('100.00', date(2025, 1, 2))
+        payment.refresh_from_db()
+        self.assertEqual(payment.amount_unallocated, Decimal('70.00'))
+
+        later = self.due('50.00', date(2025, 2, 1))
+        later.refresh_from_db()
+        self.assertTrue(later.is_settled)
+        payment.refresh_from_db()
+        self.assertEqual(payment.amount_unallocated, Decimal('20.00'))
+        self.assertMatchesReallocation()
+
+    def test_back_dated_due_takes_the_money_first(self):
+        later = self.due('50.00', date(2025, 3, 1))
+        self.pay('50.00', date(2025, 3, 2))
+        earlier = self.due('50.00', date(2025, 1, 1))
+        earlier.refresh_from_db()
+        later.refresh_from_db()
+        self.assertTrue(earlier.is_settled)
+        self.assertFalse(later.is_settled)
+        self.assertEqual(later.amount_settled, Decimal('0.00'))
+        self.assertMatchesReallocation()
+
+    def test_back_dated_bulk_due_takes_the_money_first(self):
+        self.due('50.00', date(2025, 3, 1))
+        self.pay('50.00', date(2025, 3, 2))
+        Due.objects.bulk_create([Due(member=self.member, amount_due=Decimal('50.00'), description='Old levy', due_date=date(2025, 1, 1))])
+        self.assertEqual(self.state()[0], [(Decimal('50.00'), True), (Decimal('0.00'), False)])
+        self.assertMatchesReallocation()
+
+    def test_deletes_reallocate(self):
+        first = self.due('40.00', date(2025, 1, 1))
+        self.due('40.00', date(2025, 2, 1))
+        payment = self.pay('60.00', date(2025, 2, 2))
+        first.delete()
+        self.assertEqual(self.state()[0], [(Decimal('40.00'), True)])
+        self.assertMatchesReallocation()
+
+        payment.delete()
+        self.assertEqual(self.state(), ([(Decimal('0.00'), False)], [], []))
+        self.assertMatchesReallocation()
+
+    def test_non_positive_dues_are_settled_and_take_no_money(self):
+        self.due('-10.00', date(2025, 1, 1), 'Refund')
+        self.due('0.00', date(2025, 1, 2), 'Waiver')
+        self.due('25.00', date(2025, 1, 3))
+        self.pay('25.00', date(2025, 1, 4))
+        self.assertEqual(self.state()[0], [(Decimal('0.00'), True), (Decimal('0.00'), True), (Decimal('25.00'), True)])
+        self.assertMatchesReallocation()
+
+    def test_migration_backfill_matches_the_engine(self):
+        self.due('-10.00', date(2025, 1, 1), 'Refund')
+        self.due('100.00', date(2025, 1, 5))
+        self.due('50.00', date(2025, 2, 1))
+        self.pay('30.00', date(2025, 1, 10))
+        self.pay('150.00', date(2025, 2, 10))
+        allocation.reallocate_members([self.member.pk])
+        engine = self.state()
+
+        PaymentAllocation.objects.all().delete()
+        Due.objects.update(amount_settled=Decimal('0.00'), is_settled=False)
+        Payment.objects.update(amount_allocated=Decimal('0.00'))
+        migration = import_module('finances.migrations.0005_payment_allocation')
+        # The migration's matching is a frozen copy; changing the engine doesn't reach it
+        self.assertIsNot(migration.fifo_match, allocation.fifo_match)
+        self.assertIsNot(migration.settlement, allocation.settlement)
+        migration.allocate_existing_payments(apps, None)
+        self.assertEqual(self.state(), engine)
+
+
+class PeriodCloseTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.ada = User.objects.create_user('ada', 'ada@example.com').profile
+        cls.bayo = User.objects.create_user('bayo', 'bayo@example.com').profile
+        cls.january_due = Due.objects.create(member=cls.ada, amount_due=Decimal('100.00'), description='Levy', due_date=date(2025, 1, 10))
+        cls.january_payment = Payment.objects.create(member=cls.ada, amount_paid=Decimal('40.00'), payment_date=date(2025, 1, 20))
+        Due.objects.create(member=cls.bayo, amount_due=Decimal('20.00'), description='Levy', due_date=date(2025, 1, 31))
+
+    def close(self, month):
+        call_command('close_period', '--month', month, stdout=StringIO())
+
+    def assertBalancesMatchRawRows(self):
+        live = ledger.live_totals()
+        for profile in Profile.objects.with_financials():
+            dues, payments = live.get(profile.pk, (Decimal('0.00'), Decimal('0.00')))
+            self.assertEqual((profile.total_dues, profile.total_payments, profile.balance), (dues, payments, dues - payments))
+
+    def test_entries_in_a_closed_month_are_locked(self):
+        self.close('2025-01')
+        february = Due.objects.create(member=self.ada, amount_due=Decimal('10.00'), description='Levy', due_date=date(2025, 2, 1))
+
+        due = Due.objects.get(pk=self.january_due.pk)
+        due.amount_due = Decimal('90.00')
+        february.due_date = date(2025, 1, 31)  # Moving an entry into the closed month
+        refused = [
+            due.save,
+            february.save,
+            Payment.objects.get(pk=self.january_payment.pk).delete,
+            Payment.objects.filter(pk=self.january_payment.pk).delete,
+            lambda: Due.objects.create(member=self.bayo, amount_due=Decimal('5.00'), description='Late levy', due_date=date(2025, 1, 15)),
+            lambda: Payment.objects.bulk_create([Payment(member=self.bayo, amount_paid=Decimal('5.00'), payment_date=date(2025, 1, 15))]),
+        ]
+        for write in refused:
+            # Deletes run the guard inside their own atomic block
+            with self.assertRaises(ValidationError), transaction.atomic():
+                write()
+
+        self.assertEqual(Due.objects.get(pk=self.january_due.pk).amount_due, Decimal('100.00'))
+        self.assertTrue(Payment.objects.filter(pk=self.january_payment.pk).exists())
+        # Deleting a whole member still takes their closed history with them
+        self.bayo.user.delete()
+        self.assertFalse(Due.objects.filter(member_id=self.bayo.pk).exists())
+
+    def test_reopening_unlocks_the_period(self):
+        self.close('2025-01')
+        call_command('close_period', '--reopen', '2025-01-31', stdout=StringIO())
+        self.assertFalse(ClosedPeriod.objects.exists())
+        self.assertFalse(LedgerSnapshot.objects.exists())
+
+        due = Due.objects.get(pk=self.january_due.pk)
+        due.amount_due = Decimal('90.00')
+        due.save()
+        Payment.objects.get(pk=self.january_payment.pk).delete()
+        self.ada.ledger_balance.refresh_from_db()
+        self.assertEqual(self.ada.ledger_balance.balance, Decimal('90.00'))
+
+    def test_snapshot_balances_match_a_full_recompute(self):
+        self.close('2025-01')
+        self.assertEqual(
+            set(LedgerSnapshot.objects.values_list('member_id', 'closing_dues', 'closing_payments', 'closing_balance')),
+            {(self.ada.pk, Decimal('100.00'), Decimal('40.00'), Decimal('60.00')), (self.bayo.pk, Decimal('20.00'), Decimal('0.00'), Decimal('20.00'))},
+        )
+        Payment.objects.create(member=self.ada, amount_paid=Decimal('15.00'), payment_date=date(2025, 2, 3))
+        Due.objects.create(member=self.bayo, amount_due=Decimal('20.00'), description='Levy', due_date=date(2025, 2, 28))
+        self.assertBalancesMatchRawRows()
+
+        # The next close starts from this snapshot and adds February only
+        self.close('2025-02')
+        Due.objects.create(member=self.ada, amount_due=Decimal('7.50'), description='Levy', due_date=date(2025, 3, 1))
+        self.assertEqual(LedgerSnapshot.objects.get(member=self.bayo, period_end=date(2025, 2, 28)).closing_dues, Decimal('40.00'))
+        self.assertBalancesMatchRawRows()
+
+    def test_closing_an_earlier_period_is_refused(self):
+        self.close('2025-02')
+        with self.assertRaises(CommandError):
+            self.close('2025-01')
+
+
+class BulkDueTests(TestCase):
+    """generate_bulk_dues: one INSERT ... SELECT ... ON CONFLICT DO NOTHING RETURNING per batch."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('treasurer', 'treasurer@example.com', 'pass')
+        cls.members = [User.objects.create_user(f'member{n}', f'member{n}@example.com').profile for n in range(5)]
+        cls.suspended = User.objects.create_user('suspended', 'suspended@example.com').profile
+        cls.suspended.status = 'SUS'
+        cls.suspended.save()
+        # Credit waiting to be allocated, and a member charged by hand already
+        Payment.objects.create(member=cls.members[0], amount_paid=Decimal('25.00'), payment_date=date(2025, 1, 2))
+        Due.objects.create(member=cls.members[1], amount_due=Decimal('25.00'), description='Levy 2025', due_date=date(2025, 3, 1))
+
+    def test_new_rows_are_posted_and_a_rerun_inserts_nothing(self):
+        inserted, skipped = generate_bulk_dues(Decimal('25.00'), 'Levy 2025', date(2025, 3, 1), batch_size=2)
+        self.assertEqual((inserted, skipped), (4, 1))
+        self.assertEqual(Due.objects.filter(description='Levy 2025').count(), 5)
+        self.assertFalse(Due.objects.filter(member=self.suspended).exists())
+        self.assertFalse(Due.objects.filter(member__user=self.admin).exists())
+
+        # The returned ids reach the balances, the allocator and the rollups
+        balances = dict(Profile.objects.with_balances().values_list('pk', 'balance'))
+        self.assertEqual(balances[self.members[0].pk], Decimal('0.00'))
+        self.assertEqual(balances[self.members[1].pk], Decimal('25.00'))
+        self.assertEqual(balances[self.members[4].pk], Decimal('25.00'))
+        self.assertTrue(Due.objects.get(member=self.members[0]).is_settled)
+        self.assertEqual(DailyRollup.objects.get(day=date(2025, 3, 1)).dues_raised, Decimal('125.00'))
+
+        before = (list(Due.objects.order_by('pk').values_list('pk', 'amount_settled')), balances,
+                  list(DailyRollup.objects.values_list('day', 'dues_raised', 'outstanding_total')))
+        self.assertEqual(generate_bulk_dues(Decimal('25.00'), 'Levy 2025', date(2025, 3, 1), batch_size=2), (0, 5))
+        after = (list(Due.objects.order_by('pk').values_list('pk', 'amount_settled')),
+                 dict(Profile.objects.with_balances().values_list('pk', 'balance')),
+                 list(DailyRollup.objects.values_list('day', 'dues_raised', 'outstanding_total')))
+        self.assertEqual(after, before)
+        self.assertEqual(reconcile.check_all(shard_size=2), [])
+        self.assertEqual(reconcile.check_rollups(), [])
+
+    def test_resubmitted_form_skips_members_already_charged(self):
+        self.client.force_login(self.admin)
+        data = {'submit_bulk': 'submit_bulk', 'bulk-amount_due': '10.00', 'bulk-description': 'Party', 'bulk-due_date': '2025-04-01'}
+        self.client.post(reverse('finances:manage_dues'), data)
+        response = self.client.post(reverse('finances:manage_dues'), data, follow=True)
+        self.assertContains(response, 'Skipped 5 member(s)')
+        self.assertEqual(Due.objects.filter(description='Party').count(), 5)
+
+
+class BatchPaymentTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('treasurer', 'treasurer@example.com', 'pass')
+        cls.ada = User.objects.create_user('ada', 'ada@example.com').profile
+        cls.bayo = User.objects.create_user('bayo', 'bayo@example.com').profile
+        cls.removed = User.objects.create_user('removed', 'removed@example.com').profile
+        cls.removed.status = 'REM'
+        cls.removed.save()
+
+    def post(self, rows):
+        data = {'form-TOTAL_FORMS': len(rows), 'form-INITIAL_FORMS': 0}
+        for index, row in enumerate(rows):
+            data.update({f'form-{index}-{name}': value for name, value in row.items()})
+        self.client.force_login(self.admin)
+        return self.client.post(reverse('finances:batch_payments'), data)
+
+    def test_valid_rows_are_saved_and_invalid_rows_come_back_with_their_errors(self):
+        today = timezone.localdate().isoformat()
+        response = self.post([
+            {'member': self.ada.pk, 'amount_paid': '10.00', 'payment_date': '2025-01-05', 'notes': 'Cash'},
+            {'member': self.removed.pk, 'amount_paid': '5.00', 'payment_date': '2025-01-05', 'notes': ''},
+            {'member': self.bayo.pk, 'amount_paid': '20.00', 'payment_date': '2025-01-06', 'notes': ''},
+            {'member': self.bayo.pk, 'amount_paid': '-3.00', 'payment_date': '2025-01-06', 'notes': 'Typo'},
+            {'member': '', 'amount_paid': '', 'payment_date': today, 'notes': ''},  # Untouched
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            sorted(Payment.objects.values_list('member_id', 'amount_paid', 'notes', 'recorded_by')),
+            sorted([(self.ada.pk, Decimal('10.00'), 'Cash', self.admin.pk), (self.bayo.pk, Decimal('20.00'), '', self.admin.pk)]),
+        )
+
+        # Only the two failed rows are shown again, as submitted, each with its own error
+        forms = response.context['formset'].forms
+        self.assertEqual([form.data[form.add_prefix('notes')] for form in forms], ['', 'Typo'])
+        self.assertEqual(list(forms[0].errors), ['member'])
+        self.assertEqual(list(forms[1].errors), ['amount_paid'])
+        self.assertContains(response, '2 row(s) were not saved')
+
+    def test_closed_period_rows_are_refused(self):
+        Due.objects.create(member=self.ada, amount_due=Decimal('1.00'), description='Levy', due_date=date(2025, 1, 1))
+        call_command('close_period', '--month', '2025-01', stdout=StringIO())
+        response = self.post([
+            {'member': self.ada.pk, 'amount_paid': '10.00', 'payment_date': '2025-01-31', 'notes': ''},
+            {'member': self.ada.pk, 'amount_paid': '10.00', 'payment_date': '2025-02-01', 'notes': ''},
+        ])
+        self.assertEqual(list(Payment.objects.values_list('payment_date', flat=True)), [date(2025, 2, 1)])
+        self.assertEqual(list(response.context['formset'].forms[0].errors), ['payment_date'])
+
+
+class MemberStatementTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('ada', 'ada@example.com', 'pass')
+        cls.member = cls.user.profile
+        Due.objects.create(member=cls.member, amount_due=Decimal('100.00'), description='January levy', due_date=date(2025, 1, 10))
+        Payment.objects.create(member=cls.member, amount_paid=Decimal('40.00'), payment_date=date(2025, 1, 20))
+        call_command('close_period', '--month', '2025-01', stdout=StringIO())
+        # After the snapshot but before the statement starts
+        Payment.objects.create(member=cls.member, amount_paid=Decimal('5.00'), payment_date=date(2025, 2, 2))
+        # Same day: dues come before payments, then id order
+        Payment.objects.create(member=cls.member, amount_paid=Decimal('50.00'), payment_date=date(2025, 2, 5))
+        Due.objects.create(member=cls.member, amount_due=Decimal('30.00'), description='February levy', due_date=date(2025, 2, 5))
+        Due.objects.create(member=cls.member, amount_due=Decimal('10.00'), description='Party', due_date=date(2025, 2, 5))
+        Due.objects.create(member=cls.member, amount_due=Decimal('99.00'), description='March levy', due_date=date(2025, 3, 1))
+
+    def test_running_balance_starts_from_the_snapshot(self):
+        statement = member_statement(self.member, date(2025, 2, 3), date(2025, 2, 28))
+        self.assertEqual(statement['opening_balance'], Decimal('55.00'))
+        self.assertEqual(
+            [(line['kind'], line['description'], line['charge'], line['payment'], line['balance']) for line in statement['lines']],
+            [
+                ('due', 'February levy', Decimal('30.00'), Decimal('0.00'), Decimal('85.00')),
+                ('due', 'Party', Decimal('10.00'), Decimal('0.00'), Decimal('95.00')),
+                ('payment', '', Decimal('0.00'), Decimal('50.00'), Decimal('45.00')),
+            ],
+        )
+        self.assertEqual((statement['total_charges'], statement['total_payments']), (Decimal('40.00'), Decimal('50.00')))
+        self.assertEqual(statement['closing_balance'], Decimal('45.00'))
+
+        # The same figures without a snapshot to start from
+        whole = member_statement(self.member, date(2025, 1, 1), date(2025, 2, 28))
+        self.assertEqual(whole['opening_balance'], Decimal('0.00'))
+        self.assertEqual(whole['closing_balance'], Decimal('45.00'))
+
+    def test_csv_download(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('finances:my_statement'), {'start': '2025-02-03', 'end': '2025-02-28', 'download': '1'})
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('statement_ada_2025-02-03_2025-02-28.csv', response['Content-Disposition'])
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines, [
+            'Date,Description,Charges (₦),Payments (₦),Balance (₦)',
+            ',Opening balance,,,55.00',
+            '2025-02-05,February levy,30.00,,85.00',
+            '2025-02-05,Party,10.00,,95.00',
+            '2025-02-05,Payment,,50.00,45.00',
+            ',Closing balance,40.00,50.00,45.00',
+        ])
+
+
+class ReconcileCommandTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.members = [User.objects.create_user(f'member{n}', f'member{n}@example.com').profile for n in range(5)]
+        for member in cls.members:
+            Due.objects.create(member=member, amount_due=Decimal('50.00'), description='Levy', due_date=date(2025, 1, 1))
+            Payment.objects.create(member=member, amount_paid=Decimal('20.00'), payment_date=date(2025, 1, 2))
+
+    def reconcile(self, *args):
+        out = StringIO()
+        call_command('reconcile_finances', '--shard-size', '2', *args, stdout=out)
+        return out.getvalue()
+
+    def test_reports_and_repairs_known_drift(self):
+        self.assertIn('Ledger is consistent.', self.reconcile())
+
+        # Writes that skip the signals: a balance, an allocation column and a rollup
+        MemberBalance.objects.filter(member=self.members[1]).update(total_dues=Decimal('0.00'))
+        Due.objects.filter(member=self.members[3]).update(amount_settled=Decimal('0.00'))
+        DailyRollup.objects.filter(day=date(2025, 1, 2)).update(payments_received=Decimal('1.00'))
+
+        output = self.reconcile()
+        self.assertIn(f"Member {self.members[1].pk}: balance #{self.members[1].pk}", output)
+        self.assertIn(f"Member {self.members[3].pk}: due_allocation", output)
+        self.assertIn("Rollup 2025-01-02: expected dues 0.00, payments 100.00", output)
+        self.assertIn("2 issue(s) across 2 member(s), 1 rollup day(s) out of step. Run with --repair to fix.", output)
+        self.assertEqual(MemberBalance.objects.get(member=self.members[1]).total_dues, Decimal('0.00'))
+
+        self.assertIn("Repaired 2 member(s) and rewrote 1 rollup day(s).", self.reconcile('--repair'))
+        self.assertIn('Ledger is consistent.', self.reconcile())
+        self.assertEqual(MemberBalance.objects.get(member=self.members[1]).balance, Decimal('30.00'))
+
+    def test_skip_rollups(self):
+        DailyRollup.objects.update(dues_raised=Decimal('0.00'))
+        self.assertIn('Ledger is consistent.', self.reconcile('--skip-rollups'))
+
+
+class BankStatementImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('treasurer', 'treasurer@example.com', 'pass')
+        cls.ade = User.objects.create_user('ade', 'ade@example.com', first_name='Ade', last_name='Bello').profile
+        cls.chioma = User.objects.create_user('chiomao', 'chioma@example.com', first_name='Chioma', last_name='Okafor').profile
+        cls.chioma.phone_number = '+234 803 555 0101'
+        cls.chioma.save()
+        cls.twin = User.objects.create_user('ngozi1', 'ngozi1@example.com', first_name='Ngozi', last_name='Eze').profile
+        User.objects.create_user('ngozi2', 'ngozi2@example.com', first_name='Ngozi', last_name='Eze')
+
+    def parse(self, text, filename='statement.csv'):
+        return list(importers.parse_statement(BytesIO(text.encode('utf-8')), filename))
+
+    def test_csv_columns_dates_and_invalid_rows(self):
+        rows = self.parse(
+            "Value Date,Credit,Narration,Payer Name\n"
+            "05/02/2025,\"1,500.00\",Dues ade@example.com,\n"
+            "2025-02-06,20,Levy,\n"
+            "\n"
+            "someday,10,Bad date,\n"
+            "2025-02-07,-5.00,Bank charge,\n"
+        )
+        self.assertEqual([(row.row_number, row.date, row.amount) for row in rows[:2]], [
+            (1, date(2025, 2, 5), Decimal('1500.00')),
+            (2, date(2025, 2, 6), Decimal('20.00')),
+        ])
+        self.assertEqual([row.status for row in rows[2:]], [importers.INVALID, importers.INVALID])
+        self.assertIn('someday', rows[2].error)
+        with self.assertRaises(ValueError):
+            self.parse("Narration,Payer\nDues,Ade\n")
+
+    def test_ofx(self):
+        rows = self.parse(
+            "<OFX><BANKTRANLIST>\n<STMTTRN>\n<TRNTYPE>CREDIT\n<DTPOSTED>20250210120000\n<TRNAMT>25.00\n"
+            "<NAME>CHIOMA OKAFOR\n<MEMO>March dues\n</STMTTRN>\n</BANKTRANLIST></OFX>\n",
+            'statement.ofx',
+        )
+        self.assertEqual([(row.date, row.amount, row.name, row.reference) for row in rows],
+                         [(date(2025, 2, 10), Decimal('25.00'), 'CHIOMA OKAFOR', 'March dues')])
+
+    def test_matching(self):
+        index = importers.MemberIndex()
+        cases = [
+            ({'reference': 'Dues (ADE@EXAMPLE.COM).'}, {self.ade.pk}, 'reference'),
+            ({'reference': f'FC92-{self.ade.pk} levy'}, {self.ade.pk}, 'reference'),
+            ({'reference': 'transfer chiomao'}, {self.chioma.pk}, 'reference'),
+            # A short username is an ordinary word; the name is used instead
+            ({'reference': 'paid ade', 'name': 'Bello Ade'}, {self.ade.pk}, 'name'),
+            ({'reference': 'paid ade'}, set(), ''),
+            ({'reference': 'Transfer', 'phone': '08035550101'}, {self.chioma.pk}, 'phone'),
+            ({'name': 'Ngozi Eze'}, {self.twin.pk, self.twin.pk + 1}, 'name'),
+        ]
+        for fields, expected, matched_by in cases:
+            with self.subTest(**fields):
+                self.assertEqual(index.match(**fields), (expected, matched_by))
+
+    def test_statuses(self):
+        Payment.objects.create(member=self.ade, amount_paid=Decimal('10.00'), payment_date=date(2025, 2, 5))
+        Due.objects.create(member=self.ade, amount_due=Decimal('1.00'), description='Levy', due_date=date(2025, 1, 1))
+        call_command('close_period', '--month', '2025-01', stdout=StringIO())
+        rows = importers.match_statement(self.parse(
+            "date,amount,reference,name\n"
+            "2025-02-05,10.00,ade@example.com,\n"  # Already recorded
+            "2025-02-06,10.00,chioma@example.com,\n"
+            "2025-02-06,10.00,chioma@example.com,\n"  # Same row twice in the file
+            "2025-02-06,10.00,,Ngozi Eze\n"
+            "2025-02-06,10.00,unknown,\n"
+            "2025-01-31,10.00,ade@example.com,\n"
+        ))
+        self.assertEqual([row.status for row in rows], [
+            importers.DUPLICATE, importers.MATCHED, importers.DUPLICATE,
+            importers.CONFLICT, importers.UNMATCHED, importers.INVALID,
+        ])
+        self.assertEqual(rows[1].member_id, self.chioma.pk)
+
+    def test_session_keeps_only_importable_rows(self):
+        self.client.force_login(self.admin)
+        statement = b"date,amount,reference\n2025-02-06,10.00,chioma@example.com\n2025-02-06,5.00,unknown\n2025-02-06,oops,x\n"
+        self.client.post(reverse('finances:bank_import'), {'statement': SimpleUploadedFile('s.csv', statement)})
+        pending = self.client.session['finances_bank_import']['rows']
+        self.assertEqual([row['row'] for row in pending], [1])
+
+        self.client.post(reverse('finances:bank_import'), {'confirm': '1', 'rows': ['1']})
+        self.assertEqual(list(Payment.objects.values_list('member_id', 'amount_paid')), [(self.chioma.pk, Decimal('10.00'))])
+
+        with mock.patch.object(importers, 'MAX_PENDING_ROWS', 1):
+            statement = b"date,amount,reference\n2025-02-07,10.00,chioma@example.com\n2025-02-08,10.00,chioma@example.com\n"
+            response = self.client.post(reverse('finances:bank_import'), {'statement': SimpleUploadedFile('s.csv', statement)})
+        self.assertContains(response, 'at most 1 can be imported at once')
+        self.assertNotIn('finances_bank_import', self.client.session)
+
+
+class DueScheduleTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.members = [User.objects.create_user(f'member{n}', f'member{n}@example.com').profile for n in range(3)]
+        cls.members[2].status = 'SUS'
+        cls.members[2].save()
+
+    def schedule(self, **fields):
+        fields = {'amount': Decimal('10.00'), 'description_template': 'Subscription - {period}',
+                  'frequency': 'M', 'start_date': date(2025, 1, 31), **fields}
+        return DueSchedule.objects.create(**fields)
+
+    def generate(self, until):
+        out = StringIO()
+        call_command('generate_dues', '--date', until, stdout=out)
+        return out.getvalue()
+
+    def test_occurrences(self):
+        monthly = self.schedule()
+        # The day of the month is clamped to short months and restored after them
+        self.assertEqual(schedule_occurrences(monthly, date(2025, 4, 30)),
+                         [date(2025, 1, 31), date(2025, 2, 28), date(2025, 3, 31), date(2025, 4, 30)])
+        monthly.last_generated_on = date(2025, 2, 28)
+        self.assertEqual(schedule_occurrences(monthly, date(2025, 4, 29)), [date(2025, 3, 31)])
+
+        quarterly = self.schedule(frequency='Q', start_date=date(2025, 1, 15), end_date=date(2025, 10, 14))
+        self.assertEqual(schedule_occurrences(quarterly, date(2026, 1, 1)), [date(2025, 1, 15), date(2025, 4, 15), date(2025, 7, 15)])
+        yearly = self.schedule(frequency='Y', start_date=date(2024, 2, 29))
+        self.assertEqual(schedule_occurrences(yearly, date(2026, 3, 1)), [date(2024, 2, 29), date(2025, 2, 28), date(2026, 2, 28)])
+        self.assertEqual(schedule_occurrences(yearly, date(2024, 2, 28)), [])
+
+        self.assertEqual(monthly.description_for(date(2025, 3, 31)), 'Subscription - March 2025')
+        self.assertEqual(quarterly.description_for(date(2025, 7, 15)), 'Subscription - Q3 2025')
+
+    def test_generate_catches_up_and_a_rerun_charges_nobody_twice(self):
+        schedule = self.schedule(target_statuses='ACT')
+        output = self.generate('2025-03-31')
+        self.assertIn("'Subscription - January 2025' due 2025-01-31: 2 charged, 0 already charged.", output)
+        self.assertIn('Generated 6 due(s).', output)
+        self.assertEqual(Due.objects.count(), 6)
+        self.assertFalse(Due.objects.filter(member=self.members[2]).exists())
+        schedule.refresh_from_db()
+        self.assertEqual(schedule.last_generated_on, date(2025, 3, 31))
+
+        self.assertIn('Generated 0 due(s).', self.generate('2025-03-31'))
+        # A run that died before moving last_generated_on forward is harmless too
+        DueSchedule.objects.filter(pk=schedule.pk).update(last_generated_on=None)
+        output = self.generate('2025-03-31')
+        self.assertIn("'Subscription - March 2025' due 2025-03-31: 0 charged, 2 already charged.", output)
+        self.assertEqual(Due.objects.count(), 6)
+        self.assertEqual(reconcile.check_all(), [])
+
+    def test_occurrences_in_a_closed_period_are_skipped(self):
+        Due.objects.create(member=self.members[0], amount_due=Decimal('1.00'), description='Levy', due_date=date(2025, 1, 1))
+        call_command('close_period', '--month', '2025-02', stdout=StringIO())
+        schedule = self.schedule()
+        output = self.generate('2025-03-31')
+        self.assertIn("Skipped 'Subscription - January 2025' due 2025-01-31: the period is closed.", output)
+        self.assertIn("Skipped 'Subscription - February 2025' due 2025-02-28: the period is closed.", output)
+        self.assertEqual(list(Due.objects.filter(description__startswith='Subscription').values_list('due_date', flat=True).distinct()),
+                         [date(2025, 3, 31)])
+        schedule.refresh_from_db()
+        self.assertEqual(schedule.last_generated_on, date(2025, 3, 31))
+
+
+class MemberHistoryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('ada', 'ada@example.com', 'pass')
+        cls.member = cls.user.profile
+        cls.other = User.objects.create_user('bayo', 'bayo@example.com', 'pass').profile
+        # Five dues on one day between two others, so pages split inside a run of equal dates
+        cls.dues = [Due.objects.create(member=cls.member, amount_due=Decimal('1.00'), description='Late', due_date=date(2025, 3, 1))]
+        cls.dues += [
+            Due.objects.create(member=cls.member, amount_due=Decimal('1.00'), description=f'Levy {n}', due_date=date(2025, 2, 1))
+            for n in range(5)
+        ]
+        cls.dues.append(Due.objects.create(member=cls.member, amount_due=Decimal('1.00'), description='Early', due_date=date(2025, 1, 1)))
+        Due.objects.create(member=cls.other, amount_due=Decimal('1.00'), description='Levy', due_date=date(2025, 2, 1))
+
+    def test_pages_walk_equal_dates_without_gaps_or_repeats(self):
+        seen, cursor = [], None
+        while True:
+            rows, cursor = history_page(self.member, 'dues', cursor, page_size=2)
+            seen.extend(row.pk for row in rows)
+            if cursor is None:
+                break
+        expected = [self.dues[0].pk] + sorted((due.pk for due in self.dues[1:6]), reverse=True) + [self.dues[6].pk]
+        self.assertEqual(seen, expected)
+
+    def test_endpoint(self):
+        self.client.force_login(self.user)
+        url = reverse('finances:member_history', args=[self.member.pk, 'dues'])
+        first = self.client.get(url).json()
+        self.assertEqual(len(first['results']), 7)
+        self.assertIsNone(first['next_cursor'])
+
+        for cursor in ('garbage', '2025-02-01', '2025-13-01_5', '2025-02-01_x'):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(url, {'cursor': cursor})
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {'error': 'Invalid cursor.'})
+
+        self.assertEqual(self.client.get(reverse('finances:member_history', args=[self.member.pk, 'bogus'])).status_code, 404)
+
+    def test_other_members_history_is_forbidden(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('finances:member_history', args=[self.other.pk, 'payments']))
+        self.assertEqual(response.status_code, 403)
+
+        secretary = User.objects.create_user('secretary', 'secretary@example.com', role='FS')
+        self.client.force_login(secretary)
+        response = self.client.get(reverse('finances:member_history', args=[self.other.pk, 'dues']))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['description'] for row in response.json()['results']], ['Levy'])
+
+
+class MemberBalanceTests(TestCase):
+    """MemberBalance follows every ORM write path, and rebuild_balances restores it from the raw rows."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ada = User.objects.create_user('ada', 'ada@example.com').profile
+        cls.bayo = User.objects.create_user('bayo', 'bayo@example.com').profile
+
+    def balance(self, member):
+        return MemberBalance.objects.values_list('total_dues', 'total_payments', 'balance').get(member=member)
+
+    def assertLedgerConsistent(self):
+        first, last = min(self.ada.pk, self.bayo.pk), max(self.ada.pk, self.bayo.pk)
+        self.assertEqual(reconcile.check_shard(first, last), [])
+        self.assertEqual(reconcile.check_rollups(), [])
+
+    def test_create_edit_delete(self):
+        due = Due.objects.create(member=self.ada, amount_due=Decimal('100.00'), description='Levy', due_date=date(2025, 1, 1))
+        payment = Payment.objects.create(member=self.ada, amount_paid=Decimal('40.00'), payment_date=date(2025, 1, 5))
+        self.assertEqual(self.balance(self.ada), (Decimal('100.00'), Decimal('40.00'), Decimal('60.00')))
+
+        due.amount_due = Decimal('80.00')
+        due.save()
+        payment.member = self.bayo
+        payment.save()
+        self.assertEqual(self.balance(self.ada), (Decimal('80.00'), Decimal('0.00'), Decimal('80.00')))
+        self.assertEqual(self.balance(self.bayo), (Decimal('0.00'), Decimal('40.00'), Decimal('-40.00')))
+
+        due.delete()
+        self.assertEqual(self.balance(self.ada), (Decimal('0.00'), Decimal('0.00'), Decimal('0.00')))
+        self.assertLedgerConsistent()
+
+    def test_a_failing_receiver_rolls_back_the_row(self):
+        with mock.patch.object(ledger, 'apply_deltas', side_effect=RuntimeError('ledger down')):
+            with self.assertRaises(RuntimeError):
+                Due.objects.create(member=self.ada, amount_due=Decimal('100.00'), description='Levy', due_date=date(2025, 1, 1))
+        self.assertFalse(Due.objects.exists())
+        self.assertFalse(MemberBalance.objects.filter(member=self.ada).exists())
+
+        payment = Payment.objects.create(member=self.ada, amount_paid=Decimal('40.00'), payment_date=date(2025, 1, 5))
+        payment.amount_paid = Decimal('10.00')
+        with mock.patch.object(allocation, 'allocate_members', side_effect=RuntimeError('allocation down')), \
+                mock.patch.object(allocation, 'reallocate_members', side_effect=RuntimeError('allocation down')):
+            with self.assertRaises(RuntimeError):
+                payment.save()
+        self.assertEqual(Payment.objects.get().amount_paid, Decimal('40.00'))
+        self.assertEqual(self.balance(self.ada), (Decimal('0.00'), Decimal('40.00'), Decimal('-40.00')))
+
+    def test_queryset_update(self):
+        Due.objects.create(member=self.ada, amount_due=Decimal('100.00'), description='Levy', due_date=date(2025, 1, 1))
+        Due.objects.create(member=self.ada, amount_due=Decimal('50.00'), description='Kit', due_date=date(2025, 2, 1))
+        Payment.objects.create(member=self.ada, amount_paid=Decimal('120.00'), payment_date=date(2025, 2, 5))
+
+        self.assertEqual(Due.objects.filter(description='Levy').update(amount_due=Decimal('70.00')), 1)
+        self.assertEqual(self.balance(self.ada), (Decimal('120.00'), Decimal('120.00'), Decimal('0.00')))
+        Due.objects.filter(description='Kit').update(member=self.bayo, due_date=date(2024, 12, 1))
+        self.assertEqual(self.balance(self.ada), (Decimal('70.00'), Decimal('120.00'), Decimal('-50.00')))
+        self.assertEqual(self.balance(self.bayo), (Decimal('50.00'), Decimal('0.00'), Decimal('50.00')))
+        self.assertLedgerConsistent()
+
+        # Columns the ledger doesn't read pass straight through
+        with CaptureQueriesContext(connection) as queries:
+            Due.objects.filter(description='Levy').update(description='Annual levy')
+        self.assertEqual(len(queries), 1)
+
+    def test_bulk_update(self):
+        payments = [
+            Payment.objects.create(member=self.ada, amount_paid=Decimal('10.00'), payment_date=date(2025, 1, 5)),
+            Payment.objects.create(member=self.ada, amount_paid=Decimal('20.00'), payment_date=date(2025, 1, 6)),
+        ]
+        Due.objects.create(member=self.bayo, amount_due=Decimal('25.00'), description='Levy', due_date=date(2025, 1, 1))
+        for payment in payments:
+            payment.member = self.bayo
+            payment.amount_paid += Decimal('5.00')
+        Payment.objects.bulk_update(payments, ['member', 'amount_paid'])
+
+        self.assertEqual(self.balance(self.ada), (Decimal('0.00'), Decimal('0.00'), Decimal('0.00')))
+        self.assertEqual(self.balance(self.bayo), (Decimal('25.00'), Decimal('40.00'), Decimal('-15.00')))
+        self.assertLedgerConsistent()
+
+    def test_update_into_a_closed_period_is_refused(self):
+        Due.objects.create(member=self.ada, amount_due=Decimal('100.00'), description='Levy', due_date=date(2025, 3, 1))
+        call_command('close_period', '--month', '2025-01', stdout=StringIO())
+        with self.assertRaises(ValidationError), transaction.atomic():
+            Due.objects.update(due_date=date(2025, 1, 15))
+        self.assertEqual(Due.objects.get().due_date, date(2025, 3, 1))
+
+    def test_rebuild_balances_command(self):
+        Due.objects.create(member=self.ada, amount_due=Decimal('100.00'), description='Levy', due_date=date(2025, 1, 1))
+        Payment.objects.create(member=self.bayo, amount_paid=Decimal('30.00'), payment_date=date(2025, 1, 5))
+        MemberBalance.objects.all().delete()  # As after a raw SQL load
+        MemberBalance.objects.create(member=self.bayo, total_dues=Decimal('9.00'), total_payments=Decimal('0.00'), balance=Decimal('9.00'))
+
+        call_command('rebuild_balances', stdout=StringIO())
+        self.assertEqual(self.balance(self.ada), (Decimal('100.00'), Decimal('0.00'), Decimal('100.00')))
+        self.assertEqual(self.balance(self.bayo), (Decimal('0.00'), Decimal('30.00'), Decimal('-30.00')))
+        self.assertLedgerConsistent()
+
+
+class ExportFinancialReportCommandTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.ada = User.objects.create_user('ada', 'ada@example.com', first_name='Ada', last_name='Adams').profile
+        cls.bayo = User.objects.create_user('bayo', 'bayo@example.com', first_name='Bayo', last_name='Bello').profile
+        User.objects.create_superuser('treasurer', 'treasurer@example.com', 'pass')  # Not in the report
+        Due.objects.create(member=cls.ada, amount_due=Decimal('100.00'), description='Levy', due_date=date(2025, 1, 1))
+        Payment.objects.create(member=cls.ada, amount_paid=Decimal('40.00'), payment_date=date(2025, 1, 5))
+        Payment.objects.create(member=cls.bayo, amount_paid=Decimal('10.00'), payment_date=date(2025, 1, 5))
+
+    def export(self, *args):
+        out = StringIO()
+        call_command('export_financial_report', *args, stdout=out)
+        return out.getvalue()
+
+    def test_writes_rows_and_summary_to_stdout(self):
+        rows = list(csv.reader(StringIO(self.export('-', '--chunk-size', '1'))))
+        self.assertEqual(rows[0], ['Member Name', 'Total Dues (₦)', 'Total Payments (₦)', 'Balance (₦)', 'Status', 'Financial Status'])
+        members = [[row[0], *map(Decimal, row[1:4]), *row[4:]] for row in rows[1:3]]
+        self.assertEqual(members, [
+            ['Ada Adams', Decimal('100'), Decimal('40'), Decimal('60'), 'Active', 'Overdue'],
+            ['Bayo Bello', Decimal('0'), Decimal('10'), Decimal('-10'), 'Active', 'Up to Date'],
+        ])
+        self.assertEqual(rows[3:], [
+            [],
+            ['Summary'],
+            ['Total Dues:', '100.00'],
+            ['Total Payments:', '50.00'],
+            ['Total Balance:', '50.00'],
+            ['Up to Date Members:', '1/2'],
+        ])
+
+    def test_status_filter_and_file_output(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'report.csv')
+            self.assertIn('Financial report written to', self.export(path, '--status', 'overdue'))
+            with open(path, encoding='utf-8', newline='') as handle:
+                rows = list(csv.reader(handle))
+        self.assertEqual([row[0] for row in rows[1:rows.index([])]], ['Ada Adams'])
+        self.assertIn(['Up to Date Members:', '0/1'], rows)
 
-# Create your tests here.
+    def test_unwritable_path(self):
+        with self.assertRaises(CommandError):
+            self.export('/nonexistent/report.csv')
@@ -7,11 +7,17 @@ app_name = 'finances'
 urlpatterns = [
     path('dashboard/', views.financial_dashboard, name='financial_dashboard'),
     path('record-payment/', views.record_payment, name='record_payment'),
+    path('record-payments/', views.batch_payments, name='batch_payments'),
     path('manage-dues/', views.manage_dues, name='manage_dues'),
+    path('aging/', views.aging_report, name='aging_report'),
+    path('bank-import/', views.bank_import, name='bank_import'),
 
     # Financial Status Views
     path('my-status/', views.member_financial_status, name='my_financial_status'), # For logged-in user's own status
     path('member-status/<int:profile_id>/', views.member_financial_status, name='member_financial_status'), # For FS/Admin viewing specific member
+    path('member-status/<int:profile_id>/<str:kind>/', views.member_history, name='member_history'), # JSON: older dues/payments
+    path('my-statement/', views.member_statement, name='my_statement'),
+    path('statement/<int:profile_id>/', views.member_statement, name='member_statement'),
 
     # Add paths for editing/deleting payments/dues if needed
 ]
\ No newline at end of file
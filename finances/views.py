@@ -5,26 +5,30 @@ from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
 from django.db.models import Sum, F, DecimalField # Removed Coalesce from here
 from django.db.models.functions import Coalesce # Import Coalesce from here
-from django.http import Http404, HttpResponseForbidden # Import for errors
+from django.http import Http404, HttpResponseForbidden, JsonResponse, StreamingHttpResponse # Import for errors
 from decimal import Decimal # Import Decimal for calculations
-from .forms import PaymentForm, DueForm, BulkDueForm
+from .forms import PaymentForm, DueForm, BulkDueForm, BankStatementForm, BatchPaymentFormSet
 from .models import Payment, Due
 from users.models import Profile
+from users.roles import is_financial_secretary_or_admin  # Answered from request.user.role, no query
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django.db.models import DecimalField # Import DecimalField for annotations
-
-# --- Permission Helper ---
-def is_financial_secretary_or_admin(user):
-    # Avoid circular import if defined elsewhere, else define here
-    return user.is_authenticated and hasattr(user, 'profile') and user.profile.is_financial_secretary
+from .aging import aging_by_member, aging_totals, aging_report_rows
+from .reports import stream_csv
+from . import importers
+from .dues import generate_bulk_dues
+from .history import HISTORY_KINDS, history_context, history_page, serialize_entry
+from .rollups import dashboard_kpis
+from .statements import member_statement as build_statement, statement_rows
 
 # --- Financial Secretary Views ---
 
 @user_passes_test(is_financial_secretary_or_admin)
 def financial_dashboard(request):
-    # Overview for FS - maybe list members needing attention?
-    # For now, just links to actions
-    return render(request, 'finances/financial_dashboard.html')
+    # KPIs come from the daily rollups only, never from the raw ledger
+    context = {'kpis': dashboard_kpis()}
+    return render(request, 'finances/financial_dashboard.html', context)
 
 @user_passes_test(is_financial_secretary_or_admin)
 def record_payment(request):
@@ -49,6 +53,36 @@ def record_payment(request):
     context = {'form': form}
     return render(request, 'finances/record_payment_form.html', context)
 
+@user_passes_test(is_financial_secretary_or_admin)
+def batch_payments(request):
+    """Record a grid of payments in one submission: valid rows are saved together, the rest come back with their errors."""
+    if request.method != 'POST':
+        formset = BatchPaymentFormSet()
+        return render(request, 'finances/batch_payments.html', {'formset': formset})
+
+    formset = BatchPaymentFormSet(request.POST)
+    if formset.non_form_errors():
+        for error in formset.non_form_errors():
+            messages.error(request, error)
+        return render(request, 'finances/batch_payments.html', {'formset': formset})
+
+    rows, failed = formset.split()
+    if rows:
+        try:
+            created = importers.import_payments(rows, recorded_by=request.user)
+        except Exception as e:
+            messages.error(request, f"Error recording payments: {str(e)}")
+            return render(request, 'finances/batch_payments.html', {'formset': formset})
+        total = sum((payment.amount_paid for payment in created), Decimal('0.00'))
+        messages.success(request, f"Recorded {len(created)} payment(s) totalling ₦{total:,.2f}.")
+    if not failed:
+        if not rows:
+            messages.info(request, "No payments were entered.")
+        return redirect('finances:batch_payments')
+
+    messages.error(request, f"{len(failed)} row(s) were not saved. Correct them below and submit again.")
+    return render(request, 'finances/batch_payments.html', {'formset': formset.retry(failed)})
+
 @user_passes_test(is_financial_secretary_or_admin)
 def manage_dues(request):
     """View to add individual or bulk dues"""
@@ -94,24 +128,19 @@ def manage_dues(request):
                 description = bulk_due_form.cleaned_data['description']
                 due_date = bulk_due_form.cleaned_data['due_date']
 
-                # Get active members excluding superusers
-                active_members = Profile.objects.filter(
-                    status='ACT',
-                    user__is_superuser=False
-                )
-                dues_to_create = []
-                for profile in active_members:
-                    dues_to_create.append(
-                        Due(member=profile, amount_due=amount, description=description, due_date=due_date)
-                    )
-
-                if dues_to_create:
-                    try:
-                        Due.objects.bulk_create(dues_to_create)
-                        messages.success(request, f"Added dues of ₦{amount} to {len(dues_to_create)} active members.")
-                        return redirect('finances:manage_dues')
-                    except Exception as e:
-                        messages.error(request, f"Error creating bulk dues: {str(e)}")
+                # One INSERT ... SELECT over active members; members already charged are skipped
+                try:
+                    inserted, skipped = generate_bulk_dues(amount, description, due_date)
+                except Exception as e:
+                    messages.error(request, f"Error creating bulk dues: {str(e)}")
+                else:
+                    if inserted:
+                        messages.success(request, f"Added dues of ₦{amount} to {inserted} active members.")
+                    if skipped:
+                        messages.info(request, f"Skipped {skipped} member(s) who already have '{description}' due on {due_date:%Y-%m-%d}.")
+                    if not inserted and not skipped:
+                        messages.warning(request, "There are no active members to charge.")
+                    return redirect('finances:manage_dues')
             else:
                 messages.error(request, 'Error in bulk due form. Please check the details entered.')
                 individual_due_form = DueForm(prefix="individual")
@@ -129,7 +158,7 @@ def manage_dues(request):
 def member_financial_status(request, profile_id=None):
     """Display financial status for a member using annotations for consistency."""
     target_profile_pk = None
-    can_view_others = request.user.profile.is_financial_secretary or request.user.profile.is_admin
+    can_view_others = request.user.role.can_manage_members
 
     if profile_id:
         if not can_view_others:
@@ -145,38 +174,173 @@ def member_financial_status(request, profile_id=None):
     # Fetch the specific profile with annotated financial totals
     try:
         profile_with_totals = Profile.objects.select_related('user') \
-            .annotate(
-                total_dues=Coalesce(
-                    Sum('dues__amount_due', distinct=True),
-                    Decimal('0.00'),
-                    output_field=DecimalField()
-                ),
-                total_payments=Coalesce(
-                    Sum('payments__amount_paid', distinct=True),
-                    Decimal('0.00'),
-                    output_field=DecimalField()
-                )
-            ) \
-            .annotate(
-                balance=F('total_dues') - F('total_payments') # Dues - Payments
-            ) \
+            .with_financials() \
             .get(pk=target_profile_pk)
     except Profile.DoesNotExist:
         messages.error(request, "Member profile not found.")
-        return redirect('users:member_list_admin' if can_view_others else 'pages:home')
-
-    # Fetch detailed dues and payments separately for display
-    dues = Due.objects.filter(member=profile_with_totals).order_by('-due_date', '-created_at')
-    payments = Payment.objects.filter(member=profile_with_totals).order_by('-payment_date', '-recorded_at')
+        return redirect('users:member_list' if can_view_others else 'pages:home')
 
     context = {
         'target_profile': profile_with_totals, # Profile now includes annotated totals
-        'dues': dues, # Detailed list for display
-        'payments': payments, # Detailed list for display
         'dues_total': profile_with_totals.total_dues, # From annotation
         'payments_total': profile_with_totals.total_payments, # From annotation
         'balance': profile_with_totals.balance, # From annotation
         'can_view_others': can_view_others,
     }
+    # Newest dues and payments; older pages are lazy-loaded from member_history
+    context.update(history_context(profile_with_totals))
 
     return render(request, 'finances/member_financial_status.html', context)
+
+
+@login_required
+def member_history(request, profile_id, kind):
+    """JSON page of a member's dues or payments after ?cursor=, newest first."""
+    profile = request.user.profile
+    if profile.pk != profile_id and not request.user.role.can_manage_members:
+        return HttpResponseForbidden("You do not have permission to view this member's financial history.")
+    if kind not in HISTORY_KINDS:
+        raise Http404("Unknown history.")
+    member = get_object_or_404(Profile, pk=profile_id)
+
+    try:
+        rows, next_cursor = history_page(member, kind, cursor=request.GET.get('cursor') or None)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid cursor.'}, status=400)
+    return JsonResponse({
+        'results': [serialize_entry(row) for row in rows],
+        'next_cursor': next_cursor,
+    })
+
+
+@login_required
+def member_statement(request, profile_id=None):
+    """Chronological statement with a running balance for ?start= to ?end=; ?download=1 gives CSV."""
+    can_view_others = request.user.role.can_manage_members
+    if profile_id and profile_id != request.user.profile.pk and not can_view_others:
+        return HttpResponseForbidden("You do not have permission to view this member's statement.")
+    profile = get_object_or_404(Profile.objects.select_related('user'), pk=profile_id or request.user.profile.pk)
+
+    today = timezone.now().date()
+    start = parse_date(request.GET.get('start', '') or '') or today.replace(month=1, day=1)
+    end = parse_date(request.GET.get('end', '') or '') or today
+    if end < start:
+        messages.error(request, "The end date can't be before the start date.")
+        end = start
+    statement = build_statement(profile, start, end)
+
+    if request.GET.get('download'):
+        response = StreamingHttpResponse(stream_csv(statement_rows(statement)), content_type='text/csv')
+        response['Content-Disposition'] = (
+            f'attachment; filename="statement_{profile.user.username}_{start:%Y-%m-%d}_{end:%Y-%m-%d}.csv"'
+        )
+        return response
+
+    context = {
+        'target_profile': profile,
+        'statement': statement,
+        'start': start,
+        'end': end,
+        'can_view_others': can_view_others,
+    }
+    return render(request, 'finances/member_statement.html', context)
+
+
+# --- Receivables Aging ---
+
+AGING_PAGE_SIZE = 50
+
+@user_passes_test(is_financial_secretary_or_admin)
+def aging_report(request):
+    """Outstanding dues per member, split into current / 31-60 / 61-90 / 90+ day buckets."""
+    as_of = parse_date(request.GET.get('as_of', '') or '') or timezone.now().date()
+
+    if request.GET.get('download'):
+        response = StreamingHttpResponse(stream_csv(aging_report_rows(as_of)), content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="aging_report_{as_of:%Y-%m-%d}.csv"'
+        return response
+
+    totals = aging_totals(as_of)
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        page = 1
+    page_count = max((totals['members'] + AGING_PAGE_SIZE - 1) // AGING_PAGE_SIZE, 1)
+    page = min(page, page_count)
+    rows = list(aging_by_member(as_of, limit=AGING_PAGE_SIZE, offset=(page - 1) * AGING_PAGE_SIZE))
+
+    context = {
+        'as_of': as_of,
+        'totals': totals,
+        'rows': rows,
+        'page': page,
+        'page_count': page_count,
+    }
+    return render(request, 'finances/aging_report.html', context)
+
+
+BANK_IMPORT_SESSION_KEY = 'finances_bank_import'
+
+@user_passes_test(is_financial_secretary_or_admin)
+def bank_import(request):
+    """Upload a bank statement, preview how its rows match members, then record the confirmed payments."""
+    if request.method == 'POST' and 'confirm' in request.POST:
+        pending = request.session.get(BANK_IMPORT_SESSION_KEY)
+        if not pending:
+            messages.error(request, "There is no statement waiting to be imported. Please upload it again.")
+            return redirect('finances:bank_import')
+
+        selected = set(request.POST.getlist('rows'))
+        to_create = []
+        for row in pending['rows']:
+            if str(row['row']) not in selected:
+                continue
+            member_id = row['member_id']
+            if row['status'] == importers.CONFLICT:
+                choice = request.POST.get(f"member_{row['row']}", '')
+                member_id = int(choice) if choice.isdigit() and int(choice) in row['candidates'] else None
+            if member_id is None or row['status'] in (importers.INVALID, importers.UNMATCHED):
+                continue
+            notes = f"Bank import: {row['reference'] or row['name']}".strip()
+            to_create.append((member_id, parse_date(row['date']), Decimal(row['amount']), notes))
+
+        try:
+            created = importers.import_payments(to_create, recorded_by=request.user)
+        except Exception as e:
+            messages.error(request, f"Error importing payments: {str(e)}")
+            return redirect('finances:bank_import')
+        del request.session[BANK_IMPORT_SESSION_KEY]
+        messages.success(request, f"Recorded {len(created)} payment(s) from {pending['filename']}.")
+        return redirect('finances:bank_import')
+
+    form = BankStatementForm()
+    context = {'form': form}
+    if request.method == 'POST':
+        form = BankStatementForm(request.POST, request.FILES)
+        context['form'] = form
+        if form.is_valid():
+            statement = form.cleaned_data['statement']
+            try:
+                index = importers.MemberIndex(Profile.objects.filter(user__is_superuser=False))
+                rows = importers.match_statement(importers.parse_statement(statement, statement.name), index)
+            except ValueError as e:
+                messages.error(request, f"Could not read the statement: {str(e)}")
+            else:
+                # Only what the confirmation can record goes into the session, and only so much of it
+                pending = [row.as_session_data() for row in rows if row.status in importers.IMPORTABLE]
+                if len(pending) > importers.MAX_PENDING_ROWS:
+                    messages.error(
+                        request,
+                        f"The statement has {len(pending)} rows to record; at most {importers.MAX_PENDING_ROWS} "
+                        "can be imported at once. Split it, or use the import_bank_statement command.",
+                    )
+                    return render(request, 'finances/bank_import.html', context)
+                request.session[BANK_IMPORT_SESSION_KEY] = {'filename': statement.name, 'rows': pending}
+                for row in rows:
+                    row.candidate_choices = [(pk, index.labels.get(pk, pk)) for pk in row.candidates]
+                    row.member_label = index.labels.get(row.member_id, '')
+                counts = {status: 0 for status in (importers.MATCHED, importers.CONFLICT, importers.DUPLICATE, importers.UNMATCHED, importers.INVALID)}
+                for row in rows:
+                    counts[row.status] += 1
+                context.update({'rows': rows, 'counts': counts, 'filename': statement.name})
+    return render(request, 'finances/bank_import.html', context)
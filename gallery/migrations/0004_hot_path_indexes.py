@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-18 12:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gallery', '0003_alter_photo_image'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='photo',
+            index=models.Index(fields=['event', '-uploaded_at'], name='gallery_photo_event_upload_idx'),
+        ),
+    ]
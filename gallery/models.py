@@ -47,6 +47,9 @@ class Photo(models.Model):
 
     class Meta:
         ordering = ['-uploaded_at']
+        indexes = [
+            models.Index(fields=['event', '-uploaded_at'], name='gallery_photo_event_upload_idx'),
+        ]
         verbose_name = 'Photo'
         verbose_name_plural = 'Photos'
 
@@ -19,4 +19,8 @@ class Announcement(models.Model):
         return self.title
 
     class Meta:
-        ordering = ['-publish_date'] # Show newest first
\ No newline at end of file
+        ordering = ['-publish_date'] # Show newest first
+        indexes = [
+            # Only published announcements are ever listed, newest first
+            models.Index(fields=['-publish_date'], condition=models.Q(is_published=True), name='pages_announcement_live_idx'),
+        ]
@@ -6,6 +6,7 @@ from django.contrib import messages
 from django.utils import timezone
 from .models import Announcement
 from .forms import AnnouncementForm
+from users.roles import is_admin
 
 def home_page(request):
     announcements = Announcement.objects.filter(
@@ -19,7 +20,7 @@ def home_page(request):
     return render(request, 'pages/home.html', context)
 
 @login_required
-@user_passes_test(lambda u: u.profile.role == 'ADM')
+@user_passes_test(is_admin)
 def create_announcement(request):
     """Create a new announcement."""
     if request.method == 'POST':
@@ -42,15 +43,13 @@ def announcement_list(request):
         is_published=True,
         publish_date__lte=timezone.now()
     ).order_by('-publish_date')
-    is_admin = request.user.profile.role == 'ADM' if hasattr(request.user, 'profile') else False
-    
     return render(request, 'pages/announcement_list.html', {
         'announcements': announcements,
-        'is_admin': is_admin
+        'is_admin': request.user.is_admin
     })
 
 @login_required
-@user_passes_test(lambda u: u.profile.role == 'ADM')
+@user_passes_test(is_admin)
 def toggle_announcement(request, announcement_id):
     """Toggle announcement published status."""
     announcement = get_object_or_404(Announcement, id=announcement_id)
@@ -0,0 +1,77 @@
+// Member picker for users.widgets.MemberAutocompleteWidget. Delegated from
+// document, so rows added to a page later work without extra setup.
+(function() {
+    const MIN_LENGTH = 2;
+    const DELAY_MS = 200;
+    const timers = new WeakMap();
+
+    function parts(input) {
+        const root = input.closest('[data-member-autocomplete]');
+        return {
+            root: root,
+            value: root.querySelector('[data-member-value]'),
+            results: root.querySelector('[data-member-results]'),
+        };
+    }
+
+    function close(results) {
+        results.classList.remove('show');
+        results.replaceChildren();
+    }
+
+    function show(input, members) {
+        const { value, results } = parts(input);
+        results.replaceChildren();
+        if (!members.length) {
+            const empty = document.createElement('span');
+            empty.className = 'dropdown-item-text text-muted';
+            empty.textContent = 'No matching members';
+            results.appendChild(empty);
+        }
+        members.forEach(function(member) {
+            const item = document.createElement('button');
+            item.type = 'button';
+            item.className = 'dropdown-item';
+            item.textContent = member.label;
+            item.addEventListener('mousedown', function(e) {
+                e.preventDefault();  // Keep focus so blur doesn't close the list first
+                value.value = member.id;
+                input.value = member.label;
+                close(results);
+            });
+            results.appendChild(item);
+        });
+        results.classList.add('show');
+    }
+
+    function search(input) {
+        const { root, results } = parts(input);
+        const query = input.value.trim();
+        if (query.length < MIN_LENGTH) {
+            close(results);
+            return;
+        }
+        const url = new URL(root.dataset.lookupUrl, window.location.origin);
+        url.searchParams.set('q', query);
+        fetch(url, { headers: { 'X-Requested-With': 'XMLHttpRequest' } })
+            .then(function(response) { return response.ok ? response.json() : { results: [] }; })
+            .then(function(data) {
+                if (input.value.trim() === query) {
+                    show(input, data.results);
+                }
+            });
+    }
+
+    document.addEventListener('input', function(e) {
+        const input = e.target.closest('[data-member-search]');
+        if (!input) return;
+        parts(input).value.value = '';  // Typing discards the previous choice
+        clearTimeout(timers.get(input));
+        timers.set(input, setTimeout(function() { search(input); }, DELAY_MS));
+    });
+
+    document.addEventListener('focusout', function(e) {
+        const input = e.target.closest('[data-member-search]');
+        if (input) close(parts(input).results);
+    });
+})();
@@ -1,6 +1,10 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import Profile, User
+from django.utils import timezone
+from FC92_Club.admin_tools import EstimatedCountPaginator, export_as_csv
+from finances import allocation, ledger
+from .models import Invitation, OutboundEmail, Profile, User
+from .provisioning import provision_profile
 
 # Define an inline admin descriptor for Profile model
 # which acts a bit like a singleton
@@ -15,6 +19,8 @@ class CustomUserAdmin(BaseUserAdmin):
     inlines = (ProfileInline,)
     list_display = ('username', 'email', 'first_name', 'middle_name', 'last_name', 'is_staff', 'get_role')
     list_select_related = ('profile',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     fieldsets = BaseUserAdmin.fieldsets + (
         ('Additional Info', {'fields': ('middle_name',)}),
     )
@@ -26,6 +32,11 @@ class CustomUserAdmin(BaseUserAdmin):
         return instance.profile.get_role_display()
     get_role.short_description = 'Role'
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if not change:
+            provision_profile(obj)  # The add form saves the user directly, not via create_user
+
     def get_inline_instances(self, request, obj=None):
         if not obj:
             return list()
@@ -34,5 +45,77 @@ class CustomUserAdmin(BaseUserAdmin):
 # Register the custom User model with our CustomUserAdmin
 admin.site.register(User, CustomUserAdmin)
 
-# Optional: Register Profile directly if needed, but editing via User is often better
-# admin.site.register(Profile)
+
+@admin.action(description="Recalculate balances and allocations")
+def recalculate_balances(modeladmin, request, queryset):
+    member_ids = set(queryset.values_list('pk', flat=True))
+    ledger.refresh_members(member_ids)
+    allocation.reallocate_members(member_ids)
+    modeladmin.message_user(request, f"Recalculated {len(member_ids)} member(s).")
+
+
+# Registered mainly as the search behind the member autocomplete on Due/Payment
+@admin.register(Profile)
+class ProfileAdmin(admin.ModelAdmin):
+    list_display = ('user', 'role', 'status', 'phone_number')
+    list_select_related = ('user',)
+    list_filter = ('role', 'status')
+    # Prefix searches, so the database isn't asked for a substring match on every row
+    search_fields = ('^user__username', '^user__first_name', '^user__last_name', '^user__email')
+    ordering = ('user__username',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = (export_as_csv, recalculate_balances)
+    export_fields = (
+        ('ID', 'pk'),
+        ('Username', 'user__username'),
+        ('First Name', 'user__first_name'),
+        ('Last Name', 'user__last_name'),
+        ('Email', 'user__email'),
+        ('Role', 'role'),
+        ('Status', 'status'),
+        ('Phone', 'phone_number'),
+    )
+
+    def has_add_permission(self, request):
+        return False  # Profiles come with their user
+
+
+@admin.action(description="Send again now")
+def retry_emails(modeladmin, request, queryset):
+    updated = queryset.exclude(status=OutboundEmail.SENT).update(
+        status=OutboundEmail.PENDING, attempts=0, next_attempt_at=timezone.now(),
+    )
+    modeladmin.message_user(request, f"{updated} email(s) queued again.")
+
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('to_email', 'subject', 'status', 'attempts', 'next_attempt_at', 'sent_at', 'created_at')
+    list_filter = ('status',)
+    search_fields = ('=to_email',)
+    readonly_fields = ('attempts', 'last_error', 'sent_at', 'created_at')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = (retry_emails,)
+
+
+@admin.action(description="Revoke selected invitations")
+def revoke_invitations(modeladmin, request, queryset):
+    updated = queryset.filter(status=Invitation.PENDING).update(status=Invitation.REVOKED)
+    modeladmin.message_user(request, f"{updated} invitation(s) revoked.")
+
+
+@admin.register(Invitation)
+class InvitationAdmin(admin.ModelAdmin):
+    list_display = ('profile', 'status', 'sent_at', 'expires_at', 'accepted_at', 'created_by')
+    list_select_related = ('profile__user', 'created_by')
+    list_filter = ('status',)
+    search_fields = ('=profile__user__email',)
+    readonly_fields = ('profile', 'token_hash', 'sent_at', 'expires_at', 'accepted_at', 'created_by')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = (revoke_invitations,)
+
+    def has_add_permission(self, request):
+        return False  # Issued from the member pages, which email the token
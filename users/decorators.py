@@ -3,21 +3,20 @@ from django.core.exceptions import PermissionDenied
 from django.shortcuts import redirect
 from django.urls import reverse
 from functools import wraps
+from .roles import role_for
 
 def admin_required(function):
     @wraps(function)
     def wrap(request, *args, **kwargs):
-        if request.user.is_authenticated and hasattr(request.user, 'profile'):
-            if request.user.profile.role == 'ADM':
-                return function(request, *args, **kwargs)
+        if role_for(request.user).is_admin:
+            return function(request, *args, **kwargs)
         raise PermissionDenied
     return wrap
 
 def financial_secretary_required(function):
     @wraps(function)
     def wrap(request, *args, **kwargs):
-        if request.user.is_authenticated and hasattr(request.user, 'profile'):
-            if request.user.profile.role in ['FS', 'ADM']:  # Allow both FS and Admin
-                return function(request, *args, **kwargs)
+        if role_for(request.user).code in ['FS', 'ADM']:  # Allow both FS and Admin
+            return function(request, *args, **kwargs)
         raise PermissionDenied
     return wrap
\ No newline at end of file
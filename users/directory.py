@@ -0,0 +1,93 @@
+# users/directory.py
+"""
+Member directory search with keyset pagination.
+
+Each word of the query must appear somewhere in the member's first, middle
+or last name, email, city or phone number. A word is matched as the UNION of
+two id subqueries, one per table, so each side is answered by its own
+indexes: on PostgreSQL the pg_trgm GIN indexes on UPPER(column::text) added
+by migration 0007, which serve the UPPER(...) LIKE '%word%' that icontains
+compiles to. SQLite has no infix index and scans instead, which is fine at
+its scale.
+
+Pages are ordered on (last_name, first_name, user id) and the next page
+starts strictly after the last row shown, walking users_user_directory_idx;
+cursors are opaque base64 strings.
+"""
+import json
+
+from django.db.models import Q
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+from .lookup import normalize
+from .models import Profile, User
+
+DIRECTORY_PAGE_SIZE = 50
+ORDERING = ('user__last_name', 'user__first_name', 'user_id')
+
+# Searched with icontains; trigram-indexed on PostgreSQL
+USER_SEARCH_FIELDS = ('first_name', 'middle_name', 'last_name', 'email')
+PROFILE_SEARCH_FIELDS = ('city', 'phone_number')
+
+
+def encode_cursor(profile):
+    values = [profile.user.last_name, profile.user.first_name, profile.user_id]
+    return urlsafe_base64_encode(json.dumps(values).encode('utf-8'))
+
+
+def decode_cursor(cursor):
+    """Return (last_name, first_name, user_id); raises ValueError if the cursor is malformed."""
+    try:
+        last_name, first_name, user_id = json.loads(urlsafe_base64_decode(cursor))
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError("Invalid cursor.") from e
+    if not (isinstance(last_name, str) and isinstance(first_name, str) and isinstance(user_id, int)):
+        raise ValueError("Invalid cursor.")
+    return last_name, first_name, user_id
+
+
+def _matching_profile_ids(word):
+    """Ids of profiles with `word` in any search field, as one UNION subquery."""
+    user_match, profile_match = Q(), Q()
+    for field in USER_SEARCH_FIELDS:
+        user_match |= Q(**{f'{field}__icontains': word})
+    for field in PROFILE_SEARCH_FIELDS:
+        profile_match |= Q(**{f'{field}__icontains': word})
+    by_user = User.objects.filter(user_match).order_by().values('profile')
+    by_profile = Profile.objects.filter(profile_match).order_by().values('pk')
+    return by_user.union(by_profile)
+
+
+def directory_profiles(query='', role='', status='', overdue=False):
+    """Non-superuser profiles matching the search and filters, with balances, in directory order."""
+    profiles = Profile.objects.select_related('user') \
+        .filter(user__is_superuser=False) \
+        .with_balances()
+    for word in normalize(query).split():
+        profiles = profiles.filter(pk__in=_matching_profile_ids(word))
+    if role:
+        profiles = profiles.filter(role=role)
+    if status:
+        profiles = profiles.filter(status=status)
+    if overdue:
+        profiles = profiles.filter(ledger_balance__balance__gt=0)
+    return profiles.order_by(*ORDERING)
+
+
+def directory_page(profiles, cursor=None, page_size=DIRECTORY_PAGE_SIZE):
+    """
+    Return (rows, next_cursor) for the page of `profiles` after `cursor`.
+    next_cursor is None on the last page.
+    """
+    if cursor:
+        last_name, first_name, user_id = decode_cursor(cursor)
+        profiles = profiles.filter(
+            Q(user__last_name__gt=last_name)
+            | Q(user__last_name=last_name, user__first_name__gt=first_name)
+            | Q(user__last_name=last_name, user__first_name=first_name, user_id__gt=user_id)
+        )
+    rows = list(profiles[:page_size + 1])
+    if len(rows) <= page_size:
+        return rows, None
+    rows = rows[:page_size]
+    return rows, encode_cursor(rows[-1])
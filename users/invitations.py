@@ -0,0 +1,170 @@
+# users/invitations.py
+"""
+Member invitations.
+
+issue() / issue_many() create Invitation rows and return the plaintext
+tokens to put in the emailed links; only their SHA-256 is stored, under a
+unique index, so find_pending() is a single index lookup and the table
+alone can't be used to accept an invitation. Issuing revokes the member's
+earlier pending invitations, which is all "resend" needs; revoke() just
+revokes.
+
+sweep() is the sweep_invitations command: it marks pending invitations
+past expires_at as EXPIRED, when asked deletes invited accounts that were
+never activated and never got any ledger entries, and deletes finished
+invitations that ran out more than PURGE_AFTER ago. Each step works through
+BATCH_SIZE ids per statement.
+"""
+import hashlib
+import secrets
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import Invitation, User
+
+INVITATION_TTL = timedelta(days=7)
+PURGE_AFTER = timedelta(days=90)
+BATCH_SIZE = 1000
+
+
+def hash_token(token):
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def issue_many(profiles, created_by=None, now=None):
+    """
+    Invite every profile in `profiles` (saved, with pks), revoking their
+    earlier pending invitations. Returns [(invitation, token), ...] in the
+    same order, from two statements however many profiles there are.
+    """
+    now = now or timezone.now()
+    tokens = [secrets.token_urlsafe(32) for _ in profiles]
+    invitations = [
+        Invitation(profile=profile, token_hash=hash_token(token), sent_at=now, expires_at=now + INVITATION_TTL, created_by=created_by)
+        for profile, token in zip(profiles, tokens)
+    ]
+    with transaction.atomic():
+        Invitation.objects.filter(profile__in=[profile.pk for profile in profiles], status=Invitation.PENDING) \
+            .update(status=Invitation.REVOKED)
+        Invitation.objects.bulk_create(invitations, batch_size=BATCH_SIZE)
+    return list(zip(invitations, tokens))
+
+
+def issue(profile, created_by=None):
+    """Invite one member (revoking earlier invitations); returns (invitation, token)."""
+    return issue_many([profile], created_by)[0]
+
+
+def revoke(profile):
+    """Revoke the member's pending invitations; returns how many there were."""
+    return Invitation.objects.filter(profile=profile, status=Invitation.PENDING).update(status=Invitation.REVOKED)
+
+
+def find_pending(token, now=None):
+    """The unexpired pending Invitation for `token`, with its profile and user, or None."""
+    now = now or timezone.now()
+    return Invitation.objects.select_related('profile__user') \
+        .filter(token_hash=hash_token(token or ''), status=Invitation.PENDING, expires_at__gt=now) \
+        .first()
+
+
+def accept(invitation, now=None):
+    """
+    Mark `invitation` used, so its token stops working. A single conditional
+    UPDATE claims it only while it is still pending and unexpired; returns
+    False if a concurrent accept (or a revoke, or expiry) got there first.
+    """
+    now = now or timezone.now()
+    claimed = Invitation.objects \
+        .filter(pk=invitation.pk, status=Invitation.PENDING, expires_at__gt=now) \
+        .update(status=Invitation.ACCEPTED, accepted_at=now)
+    if claimed:
+        invitation.status, invitation.accepted_at = Invitation.ACCEPTED, now
+    return claimed == 1
+
+
+def can_reinvite(user):
+    """
+    True for an invitee who has never activated their account. Accepting an
+    invitation resets the username and password, so members who have logged
+    in or set a password (even if since deactivated) can't be re-invited.
+    """
+    return not user.is_active and user.last_login is None and not user.has_usable_password()
+
+
+def invitation_email(user, link, site_url):
+    """Outbox message (see users.outbox.enqueue_many) inviting `user` to follow `link`."""
+    return {
+        'to_email': user.email,
+        'subject': 'Welcome to FC92 Club',
+        'body': render_to_string('users/email/invitation_email.txt', {
+            'first_name': user.first_name,
+            'last_name': user.last_name,
+            'email': user.email,
+            'invitation_link': link,
+            'site_url': site_url,
+        }),
+    }
+
+
+def _in_batches(queryset, action, batch_size):
+    """Apply `action` to the rows of `queryset` BATCH_SIZE ids at a time; returns the rows affected."""
+    done = 0
+    while True:
+        ids = list(queryset.order_by().values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return done
+        done += action(queryset.model.objects.filter(pk__in=ids))
+
+
+def expire_stale(now=None, batch_size=BATCH_SIZE):
+    now = now or timezone.now()
+    stale = Invitation.objects.filter(status=Invitation.PENDING, expires_at__lte=now)
+    return _in_batches(stale, lambda batch: batch.update(status=Invitation.EXPIRED), batch_size)
+
+
+def purge_finished(now=None, batch_size=BATCH_SIZE):
+    now = now or timezone.now()
+    finished = Invitation.objects.exclude(status=Invitation.PENDING).filter(expires_at__lt=now - PURGE_AFTER)
+    return _in_batches(finished, lambda batch: batch.delete()[0], batch_size)
+
+
+def never_activated_users(now=None):
+    """
+    Inactive users who never logged in, were invited, have no invitation
+    pending or expired within PURGE_AFTER, and have no dues or payments.
+    """
+    from finances.models import Due, Payment  # finances.models imports users.models
+
+    now = now or timezone.now()
+    invitations = Invitation.objects.filter(profile__user=OuterRef('pk'))
+    return User.objects.filter(is_active=False, is_superuser=False, last_login__isnull=True) \
+        .filter(Exists(invitations)) \
+        .exclude(Exists(invitations.filter(status=Invitation.PENDING))) \
+        .exclude(Exists(invitations.filter(expires_at__gte=now - PURGE_AFTER))) \
+        .exclude(Exists(Due.objects.filter(member__user=OuterRef('pk')))) \
+        .exclude(Exists(Payment.objects.filter(member__user=OuterRef('pk'))))
+
+
+def purge_never_activated(now=None, batch_size=BATCH_SIZE):
+    """Delete never_activated_users() (with their profiles and invitations); returns the user count."""
+    def delete_users(batch):
+        count = batch.count()
+        batch.delete()
+        return count
+    return _in_batches(never_activated_users(now), delete_users, batch_size)
+
+
+def sweep(delete_users=False, now=None, batch_size=BATCH_SIZE):
+    """Run every sweep step; returns counts keyed 'expired', 'purged' and 'users_deleted'."""
+    now = now or timezone.now()
+    counts = {'expired': expire_stale(now, batch_size), 'users_deleted': 0}
+    if delete_users:
+        # Before purging: a user's old invitations are what mark them as invited
+        counts['users_deleted'] = purge_never_activated(now, batch_size)
+    counts['purged'] = purge_finished(now, batch_size)
+    return counts
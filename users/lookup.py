@@ -0,0 +1,157 @@
+# users/lookup.py
+"""
+Member lookup for autocomplete pickers.
+
+Every word of the query must be a prefix of the member's username, first
+name, last name, email or phone number. Each prefix is matched as a range
+(LOWER(col) >= 'ab' AND LOWER(col) < 'ac') so it is answered by the
+lowercase expression indexes on User and the phone index on Profile, on
+SQLite and PostgreSQL alike, instead of scanning the member table.
+
+Results are cached per normalised query in the MEMBER_LOOKUP_CACHE_ALIAS
+cache. A cached result that was not cut off at the limit already holds every
+match for that prefix, so a longer query typed after it is answered by
+filtering the cached rows in Python. Saving or deleting a User or Profile
+bumps a generation number that is part of every cache key, which retires all
+cached results at once in every process sharing that cache. Results also
+expire after MEMBER_LOOKUP_CACHE_TIMEOUT seconds, which is as long as a
+process with its own cache can go on showing a member as they were.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Q
+from django.db.models.functions import Lower
+
+from .models import Profile, User
+
+LOOKUP_LIMIT = 20
+LOOKUP_MIN_LENGTH = 2
+GENERATION_KEY = 'member_lookup:generation'
+INACTIVE_STATUSES = [code for code, _ in Profile.STATUS_CHOICES if code != 'ACT']
+
+# (annotation, expression) pairs on User searched for every query word
+SEARCH_FIELDS = (
+    ('username_lower', Lower('username')),
+    ('first_name_lower', Lower('first_name')),
+    ('last_name_lower', Lower('last_name')),
+    ('email_lower', Lower('email')),
+)
+
+
+def normalize(query):
+    return ' '.join((query or '').lower().split())
+
+
+def member_label(first_name, last_name, username):
+    name = f"{first_name} {last_name}".strip()
+    return f"{name} ({username})" if name else username
+
+
+def _prefix_range(field, prefix):
+    """Q for `field` starting with `prefix`, written as a range an index can serve."""
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return Q(**{f'{field}__gte': prefix, f'{field}__lt': upper})
+
+
+def _search(words, limit):
+    """(results, complete) for the query words; complete is False when more than `limit` rows matched."""
+    # Written as an exclusion so the planner starts from the name indexes, not from every active profile
+    queryset = Profile.objects.exclude(status__in=INACTIVE_STATUSES)
+    for word in words:
+        # Matched on the user table itself so each range can use its own index
+        name_match = Q()
+        for name, _ in SEARCH_FIELDS:
+            name_match |= _prefix_range(name, word)
+        users = User.objects.annotate(**dict(SEARCH_FIELDS)).filter(name_match).values('pk')
+        condition = Q(user_id__in=users)
+        if word.lstrip('+').isdigit():
+            condition |= _prefix_range('phone_number', word)
+        queryset = queryset.filter(condition)
+    rows = list(queryset.order_by('user__username').values_list(
+        'pk', 'user__first_name', 'user__last_name', 'user__username', 'user__email', 'phone_number',
+    )[:limit + 1])
+    results = [
+        {
+            'id': pk,
+            'label': member_label(first_name, last_name, username),
+            'terms': [value.lower() for value in (username, first_name, last_name, email, phone) if value],
+        }
+        for pk, first_name, last_name, username, email, phone in rows[:limit]
+    ]
+    # Under some database collations a range can admit a near miss ('a-bz' for 'ab')
+    return [result for result in results if _matches(result, words)], len(rows) <= limit
+
+
+def search_members(query, limit=LOOKUP_LIMIT):
+    """
+    Active members matching every word of `query`, ordered by username, as
+    dicts with id, label and terms (the lowercased searchable values).
+    """
+    return _search(normalize(query).split(), limit)[0]
+
+
+def _matches(result, words):
+    return all(any(term.startswith(word) for term in result['terms']) for word in words)
+
+
+def _cache():
+    return caches[getattr(settings, 'MEMBER_LOOKUP_CACHE_ALIAS', 'default')]
+
+
+def _cache_timeout():
+    return getattr(settings, 'MEMBER_LOOKUP_CACHE_TIMEOUT', 30)
+
+
+def _cache_key(generation, query):
+    digest = hashlib.md5(query.encode('utf-8')).hexdigest()
+    return f'member_lookup:{generation}:{digest}'
+
+
+def lookup_members(query, limit=LOOKUP_LIMIT):
+    """Cached search_members(); returns [{'id', 'label'}, ...] for the JSON endpoint."""
+    query = normalize(query)
+    if len(query) < LOOKUP_MIN_LENGTH:
+        return []
+    cache = _cache()
+    generation = cache.get_or_set(GENERATION_KEY, 1, None)
+
+    results = None
+    for end in range(len(query), LOOKUP_MIN_LENGTH - 1, -1):
+        cached = cache.get(_cache_key(generation, query[:end]))
+        if cached is None:
+            continue
+        cached_results, complete = cached
+        if end == len(query):
+            results = cached_results
+        elif complete:
+            results = [result for result in cached_results if _matches(result, query.split())]
+            cache.set(_cache_key(generation, query), (results, True), _cache_timeout())
+        break
+
+    if results is None:
+        results, complete = _search(query.split(), limit)
+        cache.set(_cache_key(generation, query), (results, complete), _cache_timeout())
+    return [{'id': result['id'], 'label': result['label']} for result in results[:limit]]
+
+
+def member_labels(ids):
+    """{profile id: label} for the active members among `ids`, in one query."""
+    ids = {int(pk) for pk in ids if str(pk).isdigit()}
+    if not ids:
+        return {}
+    rows = (
+        Profile.objects.filter(status='ACT', pk__in=ids).order_by()
+        .values_list('pk', 'user__first_name', 'user__last_name', 'user__username')
+    )
+    return {pk: member_label(first_name, last_name, username) for pk, first_name, last_name, username in rows}
+
+
+def invalidate_lookup_cache():
+    """Retire every cached lookup result (called when a User or Profile changes)."""
+    cache = _cache()
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 1, None)
@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users import outbox
+
+
+class Command(BaseCommand):
+    help = (
+        "Deliver queued OutboundEmail messages in batches over one mail connection. "
+        "Runs until nothing is due (e.g. every minute from cron), or keeps polling with --loop."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=outbox.BATCH_SIZE, help='Messages claimed per batch.')
+        parser.add_argument('--rate', type=float, help='Send at most this many messages per second.')
+        parser.add_argument('--max-attempts', type=int, default=outbox.MAX_ATTEMPTS, help='Give up on a message after this many failures.')
+        parser.add_argument('--loop', action='store_true', help='Keep running, polling for new mail.')
+        parser.add_argument('--interval', type=float, default=10, help='Seconds between polls with --loop.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1 or options['max_attempts'] < 1:
+            raise CommandError("--batch-size and --max-attempts must be at least 1.")
+        if options['rate'] is not None and options['rate'] <= 0:
+            raise CommandError("--rate must be positive.")
+
+        totals = {'sent': 0, 'retrying': 0, 'failed': 0}
+        while True:
+            counts = outbox.send_pending(options['batch_size'], options['rate'], options['max_attempts'])
+            for key in totals:
+                totals[key] += counts[key]
+            if any(counts.values()):
+                self.stdout.write(f"Sent {counts['sent']}, {counts['retrying']} to retry, {counts['failed']} failed.")
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        style = self.style.WARNING if totals['failed'] else self.style.SUCCESS
+        self.stdout.write(style(f"Outbox done: {totals['sent']} sent, {totals['retrying']} to retry, {totals['failed']} failed."))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from users import invitations
+
+
+class Command(BaseCommand):
+    help = (
+        "Expire pending invitations past their expiry date and purge finished invitations "
+        f"that ran out more than {invitations.PURGE_AFTER.days} days ago, in batches. "
+        "With --delete-users, also delete invited accounts that never activated and have no dues or payments."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=invitations.BATCH_SIZE, help='Rows changed per statement.')
+        parser.add_argument('--delete-users', action='store_true', help='Delete never-activated invited accounts.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+        counts = invitations.sweep(delete_users=options['delete_users'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Expired {counts['expired']} invitation(s), purged {counts['purged']}, "
+            f"deleted {counts['users_deleted']} never-activated user(s)."
+        ))
@@ -0,0 +1,166 @@
+# users/member_import.py
+"""
+Member CSV import.
+
+The file is decoded and parsed as a stream, and every row is validated
+before anything is written: required fields, role, email format and
+length, and duplicates within the file. Emails already in use are then found with one
+IN query per BATCH_SIZE rows against the lowercase email/username indexes.
+Valid rows are written in chunks through users.provisioning, each chunk
+being one User INSERT and one Profile INSERT. New users get an unusable
+password, so no password is hashed; they set one when they accept their
+invitation. Rows that can't be
+imported come back as (row, email, error) for the downloadable report.
+"""
+import codecs
+import csv
+from dataclasses import dataclass, field
+
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.db.models.functions import Lower
+
+from .invitations import invitation_email, issue_many
+from .models import Profile, User
+from .outbox import enqueue_many
+from .provisioning import bulk_create_users
+
+REQUIRED_COLUMNS = ('email', 'first_name', 'last_name', 'role')
+# The email doubles as the username, so it must fit both columns
+MAX_EMAIL_LENGTH = min(User._meta.get_field('username').max_length, User._meta.get_field('email').max_length)
+BATCH_SIZE = 1000
+REPORT_HEADER = ['Row', 'Email', 'Error']
+
+
+@dataclass
+class MemberRow:
+    row_number: int
+    email: str
+    first_name: str
+    last_name: str
+    role: str
+
+
+@dataclass
+class ImportResult:
+    created: int = 0
+    invited: int = 0
+    errors: list = field(default_factory=list)  # (row_number, email, message)
+
+
+def read_member_rows(uploaded_file):
+    """
+    Yield (row_number, {column: value}) from a member CSV, keys lowercased and
+    values stripped. Raises ValueError if a required column is missing.
+    """
+    reader = csv.DictReader(codecs.getreader('utf-8-sig')(uploaded_file, errors='replace'))
+    headers = [name.strip().lower() for name in reader.fieldnames or []]
+    missing = [name for name in REQUIRED_COLUMNS if name not in headers]
+    if missing:
+        raise ValueError(
+            f"CSV file is missing or has incorrectly named required headers: {', '.join(missing)}. "
+            f"Headers must be {', '.join(REQUIRED_COLUMNS)} (case-insensitive). Found: {', '.join(reader.fieldnames or [])}"
+        )
+    for row_number, row in enumerate(reader, start=2):
+        yield row_number, {(key or '').strip().lower(): (value or '').strip() for key, value in row.items() if key}
+
+
+def _existing_emails(emails, batch_size=BATCH_SIZE):
+    """The lowercased addresses among `emails` already used as a user's email or username."""
+    existing = set()
+    emails = sorted(emails)
+    for start in range(0, len(emails), batch_size):
+        chunk = emails[start:start + batch_size]
+        users = User.objects.annotate(email_lower=Lower('email'), username_lower=Lower('username'))
+        existing.update(value.lower() for value in users.filter(email_lower__in=chunk).values_list('email', flat=True))
+        existing.update(value.lower() for value in users.filter(username_lower__in=chunk).values_list('username', flat=True))
+    return existing
+
+
+def validate_rows(rows):
+    """Split parsed rows into (MemberRows to create, [(row_number, email, error), ...])."""
+    roles = dict(Profile.ROLES)
+    valid, errors, seen = [], [], set()
+    for row_number, row in rows:
+        email = row.get('email', '')
+        first_name, last_name = row.get('first_name', ''), row.get('last_name', '')
+        role = row.get('role', '').upper()
+        if not (email and first_name and last_name and role):
+            errors.append((row_number, email, "Missing essential data (email, first_name, last_name, role)."))
+            continue
+        if role not in roles:
+            errors.append((row_number, email, f"Invalid role '{row.get('role')}'. Must be one of {', '.join(roles)}."))
+            continue
+        try:
+            validate_email(email)
+        except ValidationError:
+            errors.append((row_number, email, "Invalid email address."))
+            continue
+        if len(email) > MAX_EMAIL_LENGTH:
+            errors.append((row_number, email, f"Email address is longer than {MAX_EMAIL_LENGTH} characters."))
+            continue
+        if email.lower() in seen:
+            errors.append((row_number, email, "Email appears more than once in the file."))
+            continue
+        seen.add(email.lower())
+        valid.append(MemberRow(row_number, email, first_name, last_name, role))
+
+    existing = _existing_emails(seen)
+    if existing:
+        errors.extend(
+            (row.row_number, row.email, f"User with email {row.email} already exists.")
+            for row in valid if row.email.lower() in existing
+        )
+        valid = [row for row in valid if row.email.lower() not in existing]
+    errors.sort()
+    return valid, errors
+
+
+def _create_chunk(rows, send_invite, invitation_url, site_url, created_by):
+    """Insert one chunk of members (and invite them) in a single transaction."""
+    users = [
+        User(
+            username=row.email, email=row.email, first_name=row.first_name, last_name=row.last_name,
+            password=make_password(None),  # Unusable; set when the invitation is accepted
+            is_active=not send_invite,  # Invited members are activated by accepting
+        )
+        for row in rows
+    ]
+    with transaction.atomic():
+        profiles = bulk_create_users(users, [{'role': row.role} for row in rows])
+
+        if send_invite:
+            enqueue_many(
+                invitation_email(user, invitation_url(token), site_url)
+                for user, (_, token) in zip(users, issue_many(profiles, created_by=created_by))
+            )
+
+
+def import_members(uploaded_file, send_invite=False, invitation_url=None, site_url='', created_by=None, batch_size=BATCH_SIZE):
+    """
+    Validate and import a member CSV. `invitation_url(token)` builds the
+    absolute invitation link when `send_invite` is set; `created_by` is
+    recorded on the invitations. Raises ValueError for an unusable file;
+    row problems are returned in ImportResult.errors.
+    """
+    valid, errors = validate_rows(read_member_rows(uploaded_file))
+    result = ImportResult(errors=errors)
+    for start in range(0, len(valid), batch_size):
+        chunk = valid[start:start + batch_size]
+        try:
+            _create_chunk(chunk, send_invite, invitation_url, site_url, created_by)
+        except Exception as e:  # e.g. an address registered since validation; keep the other chunks
+            result.errors.extend((row.row_number, row.email, f"Not imported: {e}") for row in chunk)
+            continue
+        result.created += len(chunk)
+        result.invited += len(chunk) if send_invite else 0
+    result.errors.sort()
+    return result
+
+
+def report_rows(errors):
+    """Yield the error report as CSV rows, header first."""
+    yield REPORT_HEADER
+    yield from ([row_number, email, message] for row_number, email, message in errors)
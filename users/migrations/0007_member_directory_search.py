@@ -0,0 +1,47 @@
+# Generated by Django 5.2 on 2026-10-18 13:08
+
+from django.db import migrations, models
+
+# Trigram indexes for the member directory's icontains search (users.directory),
+# built on the UPPER(column::text) expression PostgreSQL's icontains compiles to.
+TRIGRAM_INDEXES = [
+    ('users_user_first_trgm_idx', 'users_user', 'first_name'),
+    ('users_user_middle_trgm_idx', 'users_user', 'middle_name'),
+    ('users_user_last_trgm_idx', 'users_user', 'last_name'),
+    ('users_user_email_trgm_idx', 'users_user', 'email'),
+    ('users_profile_city_trgm_idx', 'users_profile', 'city'),
+    ('users_profile_phone_trgm_idx', 'users_profile', 'phone_number'),
+]
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return  # Other databases search without an index
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, table, column in TRIGRAM_INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin ((UPPER({column}::text)) gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _, _ in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0006_outbound_email'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['last_name', 'first_name', 'id'], name='users_user_directory_idx'),
+        ),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
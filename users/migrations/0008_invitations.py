@@ -0,0 +1,80 @@
+# Generated by Django 5.2 on 2026-10-18 13:10
+
+import hashlib
+from datetime import timedelta
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def move_pending_tokens(apps, schema_editor):
+    """Carry outstanding Profile tokens over as hashed invitations, so emailed links keep working."""
+    Profile = apps.get_model('users', 'Profile')
+    Invitation = apps.get_model('users', 'Invitation')
+    pending = Profile.objects.filter(invitation_token__isnull=False, invitation_sent_at__isnull=False) \
+        .values_list('pk', 'invitation_token', 'invitation_sent_at')
+    Invitation.objects.bulk_create(
+        [
+            Invitation(
+                profile_id=pk,
+                token_hash=hashlib.sha256(token.encode('utf-8')).hexdigest(),
+                sent_at=sent_at,
+                expires_at=sent_at + timedelta(days=7),
+            )
+            for pk, token, sent_at in pending.iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_member_directory_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Invitation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token_hash', models.CharField(max_length=64, unique=True)),
+                ('status', models.CharField(choices=[('P', 'Pending'), ('A', 'Accepted'), ('R', 'Revoked'), ('E', 'Expired')], default='P', max_length=1)),
+                ('sent_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('expires_at', models.DateTimeField()),
+                ('accepted_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-sent_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='invitation',
+            name='created_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='invitation',
+            name='profile',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='invitations', to='users.profile'),
+        ),
+        migrations.AddIndex(
+            model_name='invitation',
+            index=models.Index(condition=models.Q(('status', 'P')), fields=['expires_at', 'id'], name='users_invite_pending_idx'),
+        ),
+        migrations.RunPython(move_pending_tokens, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='profile',
+            name='users_profile_invitation_idx',
+        ),
+        migrations.RemoveField(
+            model_name='profile',
+            name='invitation_sent_at',
+        ),
+        migrations.RemoveField(
+            model_name='profile',
+            name='invitation_token',
+        ),
+    ]
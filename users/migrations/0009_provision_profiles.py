@@ -0,0 +1,29 @@
+# Generated by Django 5.2 on 2026-10-18 13:14
+
+import users.models
+from django.db import migrations
+
+
+def create_missing_profiles(apps, schema_editor):
+    """Profiles used to be created by signals; give any user that slipped through one now."""
+    User = apps.get_model('users', 'User')
+    Profile = apps.get_model('users', 'Profile')
+    missing = User.objects.filter(profile__isnull=True).values_list('pk', flat=True)
+    Profile.objects.bulk_create([Profile(user_id=pk) for pk in missing.iterator()], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_invitations'),
+    ]
+
+    operations = [
+        migrations.AlterModelManagers(
+            name='user',
+            managers=[
+                ('objects', users.models.UserManager()),
+            ],
+        ),
+        migrations.RunPython(create_missing_profiles, migrations.RunPython.noop),
+    ]
@@ -1,20 +1,17 @@
 from django.contrib.auth.mixins import UserPassesTestMixin
 from django.core.exceptions import PermissionDenied
+from .roles import role_for
 
 class AdminRequiredMixin(UserPassesTestMixin):
     def test_func(self):
-        if self.request.user.is_authenticated and hasattr(self.request.user, 'profile'):
-            return self.request.user.profile.role == 'ADM'
-        return False
+        return role_for(self.request.user).is_admin
 
     def handle_no_permission(self):
         raise PermissionDenied("You must be an administrator to access this page.")
 
 class FinancialSecretaryRequiredMixin(UserPassesTestMixin):
     def test_func(self):
-        if self.request.user.is_authenticated and hasattr(self.request.user, 'profile'):
-            return self.request.user.profile.role in ['FS', 'ADM']
-        return False
+        return role_for(self.request.user).code in ['FS', 'ADM']
 
     def handle_no_permission(self):
         raise PermissionDenied("You must be a financial secretary to access this page.")
\ No newline at end of file
@@ -1,10 +1,32 @@
+from datetime import date
+from decimal import Decimal
+from asgiref.sync import sync_to_async
 from django.db import models
-from django.contrib.auth.models import AbstractUser
-from django.db.models.signals import post_save
-from django.dispatch import receiver
+from django.db.models import F, Value, DecimalField, ExpressionWrapper, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, Lower
+from django.contrib.auth.models import AbstractUser, UserManager as BaseUserManager
+from django.db import transaction
 from django.utils import timezone
+from django.utils.functional import cached_property
 from django_countries.fields import CountryField
 
+from .roles import Role
+
+
+class UserManager(BaseUserManager):
+    def _create_user(self, username, email, password, role=None, **extra_fields):
+        """Create the user and their Profile (with `role`, if given) in one transaction."""
+        from .provisioning import provision_profile  # provisioning imports this module
+
+        with transaction.atomic(using=self._db):
+            user = super()._create_user(username, email, password, **extra_fields)
+            provision_profile(user, **({'role': role} if role else {}))
+        return user
+
+    async def _acreate_user(self, username, email, password, role=None, **extra_fields):
+        """See _create_user(); acreate_user() and acreate_superuser() get a Profile too."""
+        return await sync_to_async(self._create_user)(username, email, password, role=role, **extra_fields)
+
 
 class User(AbstractUser):
     middle_name = models.CharField(max_length=30, blank=True)
@@ -24,7 +46,9 @@ class User(AbstractUser):
         help_text='Specific permissions for this user.',
         verbose_name='user permissions',
     )
-    
+
+    objects = UserManager()
+
     def get_full_name(self):
         """Return the full name including middle name if available."""
         name_parts = [self.first_name]
@@ -37,31 +61,123 @@ class User(AbstractUser):
         """Return the short name for the user."""
         return self.first_name
 
+    @cached_property
+    def role(self):
+        """
+        This user's Role (see users.roles), cached on the instance. Reads the
+        profile, which ProfileBackend has already joined for request.user.
+        """
+        profile = getattr(self, 'profile', None)
+        return Role(profile.role if profile else '', self.is_superuser)
+
     @property
     def is_financial_secretary(self):
         """Check if user is a financial secretary."""
-        return hasattr(self, 'profile') and self.profile.is_financial_secretary
+        return self.role.is_financial_secretary
 
     @property
     def is_admin(self):
         """Check if user is an admin."""
-        return hasattr(self, 'profile') and self.profile.is_admin
+        return self.role.is_admin
 
     def has_perm(self, perm, obj=None):
         """Override to check admin status."""
-        if self.is_admin or self.is_superuser:
+        if self.role.has_all_perms:
             return True
         return super().has_perm(perm, obj)
 
     def has_module_perms(self, app_label):
         """Override to check admin status."""
-        if self.is_admin or self.is_superuser:
+        if self.role.has_all_perms:
             return True
         return super().has_module_perms(app_label)
 
     class Meta:
         verbose_name = 'user'
         verbose_name_plural = 'users'
+        # Prefix ranges in users.lookup
+        indexes = [
+            models.Index(Lower('username'), name='users_user_username_lower_idx'),
+            models.Index(Lower('first_name'), name='users_user_first_lower_idx'),
+            models.Index(Lower('last_name'), name='users_user_last_lower_idx'),
+            models.Index(Lower('email'), name='users_user_email_lower_idx'),
+            # Member directory order and keyset pagination (users.directory)
+            models.Index(fields=['last_name', 'first_name', 'id'], name='users_user_directory_idx'),
+        ]
+
+def _member_total_subquery(profile_model, related_name, amount_field, date_field, snapshot_field, period_end):
+    """
+    Coalesced total of one member's rows of a reverse FK: their closing figure
+    from the latest ledger snapshot plus SUM(amount_field) over rows dated
+    after it. `period_end` is an expression giving the snapshot date.
+    """
+    related_model = profile_model._meta.get_field(related_name).related_model
+    snapshot_model = profile_model._meta.get_field('ledger_snapshots').related_model
+    zero = Value(Decimal('0.00'))
+
+    recent = related_model.objects.filter(member=OuterRef('pk'), **{f'{date_field}__gt': period_end}) \
+        .order_by() \
+        .values('member') \
+        .annotate(total=Sum(amount_field)) \
+        .values('total')
+    closing = snapshot_model.objects.filter(member=OuterRef('pk'), period_end=period_end) \
+        .values(snapshot_field)[:1]
+    return ExpressionWrapper(
+        Coalesce(Subquery(closing, output_field=DecimalField()), zero, output_field=DecimalField())
+        + Coalesce(Subquery(recent, output_field=DecimalField()), zero, output_field=DecimalField()),
+        output_field=DecimalField(),
+    )
+
+
+class ProfileQuerySet(models.QuerySet):
+    def with_balances(self):
+        """
+        Annotate total_dues, total_payments and balance (dues - payments) from
+        the finances MemberBalance table, one row per member. Members with no
+        dues or payments yet have no balance row and read as zero. The table
+        is only as current as finances.ledger keeps it; after raw SQL writes
+        or loaddata, run rebuild_balances or use with_financials().
+        """
+        zero = Value(Decimal('0.00'))
+        return self.annotate(
+            total_dues=Coalesce(F('ledger_balance__total_dues'), zero, output_field=DecimalField()),
+            total_payments=Coalesce(F('ledger_balance__total_payments'), zero, output_field=DecimalField()),
+            balance=Coalesce(F('ledger_balance__balance'), zero, output_field=DecimalField()),
+        )
+
+    def with_financials(self):
+        """
+        Annotate total_dues, total_payments and balance (dues - payments)
+        computed live from the Due and Payment rows.
+
+        Each total is its own correlated subquery, so dues and payments are
+        never joined together: there is no dues x payments fan-out and no need
+        for Sum(..., distinct=True), which drops dues that share an amount.
+        Once periods have been closed, only entries after the latest closing
+        snapshot are summed.
+        """
+        from finances.models import ClosedPeriod  # finances.models imports this module
+
+        period_end = Coalesce(
+            Subquery(ClosedPeriod.objects.order_by('-period_end').values('period_end')[:1]),
+            Value(date.min),
+            output_field=models.DateField(),
+        )
+        return self.annotate(
+            total_dues=_member_total_subquery(self.model, 'dues', 'amount_due', 'due_date', 'closing_dues', period_end),
+            total_payments=_member_total_subquery(self.model, 'payments', 'amount_paid', 'payment_date', 'closing_payments', period_end),
+        ).annotate(
+            balance=F('total_dues') - F('total_payments'),
+        )
+
+    def owing(self):
+        """Members whose balance is above zero (uses the balance index)."""
+        return self.filter(ledger_balance__balance__gt=0)
+
+    def settled(self):
+        """Members with nothing owed, including those with no ledger entries at all."""
+        return self.filter(models.Q(ledger_balance__balance__lte=0) | models.Q(ledger_balance__isnull=True))
+
 
 class Profile(models.Model):
         # filepath: c:\Django Project\FC92_Club\FC92_Club\users\models.py
@@ -89,8 +205,8 @@ class Profile(models.Model):
     address = models.TextField(blank=True, null=True)
     city = models.CharField(max_length=100, blank=True, null=True)
     country = CountryField(blank=True, null=True)
-    invitation_token = models.CharField(max_length=32, blank=True, null=True)
-    invitation_sent_at = models.DateTimeField(blank=True, null=True)
+
+    objects = ProfileQuerySet.as_manager()
 
     def __str__(self):
         return f"{self.user.get_full_name()} ({self.get_role_display()})"
@@ -110,14 +226,87 @@ class Profile(models.Model):
 
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
+        if Profile.user.is_cached(self):
+            self.user.__dict__.pop('role', None)  # Rebuilt from this profile on next use
 
     class Meta:
         ordering = ['user__last_name', 'user__first_name']
+        indexes = [
+            models.Index(fields=['status'], name='users_profile_status_idx'),
+            models.Index(fields=['phone_number'], name='users_profile_phone_idx'),
+        ]
+
+class OutboundEmail(models.Model):
+    """
+    An email waiting in the outbox. Views enqueue these instead of talking to
+    SMTP inside the request; the send_outbox command delivers them in batches
+    (see users.outbox). Bodies are blanked once sent, as some carry
+    credentials.
+    """
+    PENDING = 'P'
+    SENT = 'S'
+    FAILED = 'F'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    )
+
+    to_email = models.EmailField()
+    subject = models.CharField(max_length=255)
+    body = models.TextField(blank=True)
+    html_body = models.TextField(blank=True)
+    from_email = models.CharField(max_length=255, blank=True)  # Blank: DEFAULT_FROM_EMAIL at send time
+    status = models.CharField(max_length=1, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # The worker's "what is due now" scan only ever looks at pending mail
+            models.Index(fields=['next_attempt_at', 'id'], condition=models.Q(status='P'), name='users_outbox_due_idx'),
+        ]
 
-# Signal to create or update Profile when User is created/saved
-@receiver(post_save, sender=User)
-def create_or_update_user_profile(sender, instance, created, **kwargs):
-    if created:
-        Profile.objects.create(user=instance)
-    else:
-        instance.profile.save()
+    def __str__(self):
+        return f"{self.subject} to {self.to_email} ({self.get_status_display()})"
+
+class Invitation(models.Model):
+    """
+    An invitation for a member to set up their account. Only the SHA-256 of
+    the emailed token is stored, under a unique index, so the accept link is
+    one index lookup and a leaked table can't be used to accept anything
+    (see users.invitations). Issuing a new invitation revokes the member's
+    earlier ones; sweep_invitations expires and purges old rows.
+    """
+    PENDING = 'P'
+    ACCEPTED = 'A'
+    REVOKED = 'R'
+    EXPIRED = 'E'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (ACCEPTED, 'Accepted'),
+        (REVOKED, 'Revoked'),
+        (EXPIRED, 'Expired'),
+    )
+
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='invitations')
+    token_hash = models.CharField(max_length=64, unique=True)
+    status = models.CharField(max_length=1, choices=STATUS_CHOICES, default=PENDING)
+    sent_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField()
+    accepted_at = models.DateTimeField(blank=True, null=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True, related_name='+')
+
+    class Meta:
+        ordering = ['-sent_at']
+        indexes = [
+            # The sweeper's "what has run out" scan only ever looks at pending invitations
+            models.Index(fields=['expires_at', 'id'], condition=models.Q(status='P'), name='users_invite_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"Invitation for {self.profile_id} ({self.get_status_display()})"
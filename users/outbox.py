@@ -0,0 +1,126 @@
+# users/outbox.py
+"""
+Outbound email queue.
+
+Views call enqueue() / enqueue_many() and return at once; send_pending()
+(the send_outbox command) delivers what is due in batches over one reused
+mail connection, optionally rate limited. A failed message is retried with
+exponential backoff and marked FAILED, with its last error, after
+MAX_ATTEMPTS.
+
+Claiming a batch pushes its next_attempt_at forward by a lease (under
+SELECT ... FOR UPDATE SKIP LOCKED on PostgreSQL), so several workers can run
+without sending a message twice, and a worker that dies mid-batch only
+delays its messages until the lease runs out. The lease is CLAIM_LEASE
+plus the time the rate limit needs for the whole batch, so a slow batch
+is never re-claimed by another worker while it is still being sent.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+BATCH_SIZE = 100
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = timedelta(minutes=5)
+BACKOFF_MAX = timedelta(hours=6)
+CLAIM_LEASE = timedelta(minutes=10)
+
+
+def enqueue(to_email, subject, body, html_body='', from_email=''):
+    """Queue one email for the send_outbox worker."""
+    return OutboundEmail.objects.create(
+        to_email=to_email, subject=subject, body=body, html_body=html_body, from_email=from_email,
+    )
+
+
+def enqueue_many(messages):
+    """Queue dicts of OutboundEmail fields (to_email, subject, body, ...) with one INSERT."""
+    return OutboundEmail.objects.bulk_create([OutboundEmail(**message) for message in messages], batch_size=500)
+
+
+def backoff(attempts):
+    """Delay before retrying a message that has failed `attempts` times."""
+    return min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+
+
+def claim_lease(batch_size, rate=None):
+    """How long a worker holds a batch: CLAIM_LEASE plus `batch_size` sends at `rate` per second."""
+    return CLAIM_LEASE + (timedelta(seconds=batch_size / rate) if rate else timedelta(0))
+
+
+def claim_batch(batch_size=BATCH_SIZE, now=None, lease=CLAIM_LEASE):
+    """Lease up to `batch_size` due messages to this worker for `lease` and return them, oldest first."""
+    now = now or timezone.now()
+    with transaction.atomic():
+        ids = list(
+            OutboundEmail.objects.select_for_update(skip_locked=True)
+            .filter(status=OutboundEmail.PENDING, next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        OutboundEmail.objects.filter(pk__in=ids).update(next_attempt_at=now + lease)
+    return list(OutboundEmail.objects.filter(pk__in=ids).order_by('next_attempt_at', 'id'))
+
+
+def _message(email, connection):
+    message = EmailMultiAlternatives(
+        email.subject, email.body, email.from_email or settings.DEFAULT_FROM_EMAIL, [email.to_email],
+        connection=connection,
+    )
+    if email.html_body:
+        message.attach_alternative(email.html_body, 'text/html')
+    return message
+
+
+def send_pending(batch_size=BATCH_SIZE, rate=None, max_attempts=MAX_ATTEMPTS, connection=None, sleep=time.sleep):
+    """
+    Send one batch of due messages over a single connection, at most `rate`
+    per second when given. Returns {'sent', 'retrying', 'failed'} counts;
+    all zero when nothing was due.
+    """
+    counts = {'sent': 0, 'retrying': 0, 'failed': 0}
+    emails = claim_batch(batch_size, lease=claim_lease(batch_size, rate))
+    if not emails:
+        return counts
+
+    connection = connection or get_connection()
+    interval = 1 / rate if rate else 0
+    next_send = time.monotonic()
+    try:
+        for email in emails:
+            if interval:
+                sleep(max(0, next_send - time.monotonic()))
+                next_send = time.monotonic() + interval
+            email.attempts += 1
+            try:
+                connection.open()  # No-op while the connection is up
+                if not connection.send_messages([_message(email, connection)]):
+                    raise RuntimeError("The mail backend did not accept the message.")
+            except Exception as error:
+                email.last_error = str(error)
+                if email.attempts >= max_attempts:
+                    email.status = OutboundEmail.FAILED
+                    counts['failed'] += 1
+                else:
+                    email.next_attempt_at = timezone.now() + backoff(email.attempts)
+                    counts['retrying'] += 1
+                # The connection itself may be what failed; give the next message a fresh one
+                connection.close()
+            else:
+                email.status = OutboundEmail.SENT
+                email.sent_at = timezone.now()
+                email.last_error = ''
+                email.body = email.html_body = ''
+                counts['sent'] += 1
+    finally:
+        connection.close()
+        OutboundEmail.objects.bulk_update(
+            emails, ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at', 'body', 'html_body'],
+        )
+    return counts
@@ -0,0 +1,66 @@
+# users/provisioning.py
+"""
+Profile provisioning.
+
+Every User has one Profile, and this module is the only thing that creates
+them; there is no post_save signal, so saving a user (a login stamping
+last_login, a password change, accepting an invitation) costs just that
+user's own UPDATE.
+
+- User.objects.create_user() / create_superuser() and their async
+  versions call provision_profile() in the same transaction as the user
+  INSERT (see UserManager).
+- The admin's add-user form calls provision_profile() from save_model().
+- bulk_create_users() inserts users and their profiles with one INSERT per
+  table per batch.
+- ensure_profiles() backfills users created some other way, such as a raw
+  INSERT or loaddata.
+"""
+from django.db import transaction
+
+from .lookup import invalidate_lookup_cache
+from .models import Profile, User
+
+BATCH_SIZE = 1000
+
+
+def provision_profile(user, **fields):
+    """Create the Profile of the saved `user`, with `fields` (e.g. role) as its values."""
+    return Profile.objects.using(user._state.db).create(user=user, **fields)
+
+
+def _read_back_pks(objects, model, key, key_field):
+    """Backends that can't return ids from a bulk insert: look them up by a unique field."""
+    if all(obj.pk for obj in objects):
+        return
+    ids = dict(model.objects.filter(**{f'{key_field}__in': [key(obj) for obj in objects]}).values_list(key_field, 'pk'))
+    for obj in objects:
+        obj.pk = ids[key(obj)]
+
+
+def bulk_create_users(users, profile_fields=None, batch_size=BATCH_SIZE):
+    """
+    Insert the unsaved `users` and a Profile for each, taking the profile's
+    values from the matching dict in `profile_fields`. One User and one
+    Profile INSERT per `batch_size` users, in a single transaction. Returns
+    the saved profiles in order.
+    """
+    profile_fields = profile_fields or [{} for _ in users]
+    with transaction.atomic():
+        User.objects.bulk_create(users, batch_size=batch_size)
+        _read_back_pks(users, User, lambda user: user.username, 'username')
+        profiles = [Profile(user=user, **fields) for user, fields in zip(users, profile_fields)]
+        Profile.objects.bulk_create(profiles, batch_size=batch_size)
+        _read_back_pks(profiles, Profile, lambda profile: profile.user_id, 'user_id')
+    invalidate_lookup_cache()  # Bulk inserts skip the signal that does this
+    return profiles
+
+
+def ensure_profiles(users=None):
+    """Create the missing Profile of each user in `users` (default: all users); returns how many."""
+    users = User.objects.all() if users is None else users
+    missing = list(users.filter(profile__isnull=True).values_list('pk', flat=True))
+    Profile.objects.bulk_create([Profile(user_id=pk) for pk in missing], batch_size=BATCH_SIZE)
+    if missing:
+        invalidate_lookup_cache()
+    return len(missing)
@@ -0,0 +1,59 @@
+# users/roles.py
+"""
+Per-request role resolution.
+
+users.backends.ProfileBackend loads the signed-in user together with their
+profile in the one query AuthenticationMiddleware makes per request.
+User.role turns that profile into a Role and caches it on the user object,
+which Django caches on the request, so every permission check after that
+(the decorators, mixins, has_perm and the user_passes_test helpers below)
+is answered without touching the database.
+"""
+from dataclasses import dataclass
+
+ADMIN = 'ADM'
+FINANCIAL_SECRETARY = 'FS'
+MEMBER = 'MEM'
+
+
+@dataclass(frozen=True)
+class Role:
+    code: str = ''  # Empty for anonymous users and users without a profile
+    is_superuser: bool = False
+
+    @property
+    def is_admin(self):
+        return self.code == ADMIN
+
+    @property
+    def is_financial_secretary(self):
+        return self.code == FINANCIAL_SECRETARY
+
+    @property
+    def can_manage_members(self):
+        """Financial secretaries, admins and superusers run the member and finance pages."""
+        return self.code in (FINANCIAL_SECRETARY, ADMIN) or self.is_superuser
+
+    @property
+    def has_all_perms(self):
+        return self.is_admin or self.is_superuser
+
+
+NO_ROLE = Role()
+
+
+def role_for(user):
+    """The Role of `user`; NO_ROLE for anonymous users."""
+    if not user.is_authenticated:
+        return NO_ROLE
+    return getattr(user, 'role', NO_ROLE)
+
+
+# --- user_passes_test helpers ---
+
+def is_admin(user):
+    return role_for(user).is_admin
+
+
+def is_financial_secretary_or_admin(user):
+    return role_for(user).can_manage_members
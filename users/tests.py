@@ -1,3 +1,552 @@
-from django.test import TestCase
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from smtplib import SMTPRecipientsRefused
+from unittest import mock
 
-# Create your tests here.
+from django.core import mail
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from finances.models import Due, Payment
+from finances.reports import ReportSummary, report_profiles
+from . import outbox
+from .directory import directory_page, directory_profiles
+from .lookup import GENERATION_KEY, lookup_members
+from . import invitations
+from .models import Invitation, OutboundEmail, Profile, User
+from .provisioning import bulk_create_users, ensure_profiles
+
+
+class MemberLookupCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('ada', 'ada@example.com', 'pass', first_name='Ada', last_name='Obi')
+
+    def setUp(self):
+        self.cache = caches['member_lookup']
+        self.cache.clear()
+
+    def labels(self, query):
+        return [result['label'] for result in lookup_members(query)]
+
+    def test_a_change_retires_cached_results(self):
+        self.assertEqual(self.labels('ad'), ['Ada Obi (ada)'])
+        self.user.first_name = 'Adaeze'
+        self.user.save()
+        self.assertEqual(self.labels('ad'), ['Adaeze Obi (ada)'])
+
+    def test_logging_in_keeps_cached_results(self):
+        self.labels('ad')
+        generation = self.cache.get(GENERATION_KEY)
+        self.assertTrue(self.client.login(username='ada', password='pass'))
+        self.assertEqual(self.cache.get(GENERATION_KEY), generation)
+
+    @override_settings(MEMBER_LOOKUP_CACHE_TIMEOUT=30)
+    def test_changes_made_elsewhere_show_once_results_expire(self):
+        # An update the signal never sees stands in for a write by another worker
+        self.labels('ad')
+        User.objects.filter(pk=self.user.pk).update(first_name='Adaeze')
+        self.assertEqual(self.labels('ad'), ['Ada Obi (ada)'])
+        later = timezone.now().timestamp() + 31
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=later):
+            self.assertEqual(self.labels('ad'), ['Adaeze Obi (ada)'])
+
+
+class FinancialReportSummaryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.secretary = User.objects.create_user('secretary', 'secretary@example.com', 'pass')
+        cls.secretary.profile.role = 'FS'
+        cls.secretary.profile.save()
+        cls.members = [
+            User.objects.create_user(f'member{n}', f'member{n}@example.com', 'pass').profile
+            for n in range(3)
+        ]
+        # Two dues with the same amount must both count
+        for profile in cls.members:
+            Due.objects.create(member=profile, amount_due=Decimal('10.00'), description='Levy', due_date=date(2025, 1, 1))
+            Due.objects.create(member=profile, amount_due=Decimal('10.00'), description='Levy 2', due_date=date(2025, 2, 1))
+        Payment.objects.create(member=cls.members[0], amount_paid=Decimal('20.00'), payment_date=date(2025, 2, 2))
+
+    def test_summary_is_one_query(self):
+        with self.assertNumQueries(1):
+            summary = ReportSummary.for_profiles(report_profiles())
+
+        # The secretary has no dues, so counts as up to date
+        self.assertEqual(summary.total_members, 4)
+        self.assertEqual(summary.up_to_date_count, 2)
+        self.assertEqual(summary.overdue_count, 2)
+        self.assertEqual(summary.total_dues, Decimal('60.00'))
+        self.assertEqual(summary.total_payments, Decimal('20.00'))
+        self.assertEqual(summary.total_balance, Decimal('40.00'))
+
+    def test_with_financials_is_one_query_however_many_members(self):
+        with self.assertNumQueries(1):
+            few = {profile.pk: profile.balance for profile in Profile.objects.with_financials()}
+        self.assertEqual(few[self.members[0].pk], Decimal('0.00'))
+        self.assertEqual(few[self.members[1].pk], Decimal('20.00'))
+
+        for n in range(3, 23):
+            profile = User.objects.create_user(f'member{n}', f'member{n}@example.com').profile
+            Due.objects.create(member=profile, amount_due=Decimal('5.00'), description='Levy', due_date=date(2025, 1, 1))
+            Payment.objects.create(member=profile, amount_paid=Decimal('2.00'), payment_date=date(2025, 1, 2))
+        with self.assertNumQueries(1):
+            many = {profile.pk: profile.balance for profile in Profile.objects.with_financials()}
+        self.assertEqual(len(many), 24)
+        self.assertEqual(many[profile.pk], Decimal('3.00'))
+
+    def test_report_query_count_does_not_grow_with_members(self):
+        self.client.force_login(self.secretary)
+        url = reverse('users:financial_report')
+
+        with CaptureQueriesContext(connection) as before:
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+        for n in range(3, 10):
+            profile = User.objects.create_user(f'member{n}', f'member{n}@example.com', 'pass').profile
+            Due.objects.create(member=profile, amount_due=Decimal('5.00'), description='Levy', due_date=date(2025, 1, 1))
+
+        with CaptureQueriesContext(connection) as after:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total_members'], 11)
+        self.assertEqual(len(after), len(before))
+
+    def test_csv_summary_matches_page(self):
+        self.client.force_login(self.secretary)
+        response = self.client.get(reverse('users:financial_report'), {'download': 1})
+        content = b''.join(response.streaming_content).decode()
+
+        self.assertIn('Total Dues:,60.00', content)
+        self.assertIn('Up to Date Members:,2/4', content)
+
+
+class BouncingBackend(EmailBackend):
+    """locmem backend that refuses any recipient containing 'bounce'."""
+
+    def send_messages(self, messages):
+        for message in messages:
+            if any('bounce' in address for address in message.to):
+                raise SMTPRecipientsRefused({message.to[0]: (550, b'No such user')})
+        return super().send_messages(messages)
+
+
+class OutboxTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.secretary = User.objects.create_user('secretary', 'secretary@example.com', 'pass')
+        cls.secretary.profile.role = 'FS'
+        cls.secretary.profile.save()
+
+    def test_invites_are_queued_not_sent(self):
+        self.client.force_login(self.secretary)
+        self.client.post(reverse('users:send_bulk_invites'), {'emails': 'a@example.com\nb@example.com\nc@example.com'})
+
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(
+            sorted(OutboundEmail.objects.filter(status=OutboundEmail.PENDING).values_list('to_email', flat=True)),
+            ['a@example.com', 'b@example.com', 'c@example.com'],
+        )
+
+    def test_batch_is_sent_over_one_connection(self):
+        for n in range(5):
+            outbox.enqueue(f'member{n}@example.com', 'Hello', 'Body', html_body='<p>Body</p>')
+
+        with mock.patch('users.outbox.get_connection', wraps=outbox.get_connection) as get_connection:
+            counts = outbox.send_pending()
+
+        get_connection.assert_called_once()
+        self.assertEqual(counts, {'sent': 5, 'retrying': 0, 'failed': 0})
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(mail.outbox[0].alternatives[0][1], 'text/html')
+        # Sent bodies are dropped, as some carry credentials
+        self.assertFalse(OutboundEmail.objects.exclude(body='').exists())
+
+    def test_failures_back_off_then_give_up(self):
+        outbox.enqueue('good@example.com', 'Hello', 'Body')
+        bad = outbox.enqueue('bounce@example.com', 'Hello', 'Body')
+
+        counts = outbox.send_pending(connection=BouncingBackend())
+        self.assertEqual(counts, {'sent': 1, 'retrying': 1, 'failed': 0})
+        bad.refresh_from_db()
+        self.assertEqual((bad.status, bad.attempts), (OutboundEmail.PENDING, 1))
+        self.assertIn('No such user', bad.last_error)
+        self.assertGreater(bad.next_attempt_at, timezone.now() + outbox.BACKOFF_BASE - timedelta(seconds=5))
+
+        # Not due again until the backoff has passed
+        self.assertEqual(outbox.send_pending(connection=BouncingBackend()), {'sent': 0, 'retrying': 0, 'failed': 0})
+
+        OutboundEmail.objects.filter(pk=bad.pk).update(next_attempt_at=timezone.now())
+        counts = outbox.send_pending(max_attempts=2, connection=BouncingBackend())
+        self.assertEqual(counts, {'sent': 0, 'retrying': 0, 'failed': 1})
+        bad.refresh_from_db()
+        self.assertEqual((bad.status, bad.attempts), (OutboundEmail.FAILED, 2))
+
+    def test_rate_limit(self):
+        for n in range(3):
+            outbox.enqueue(f'member{n}@example.com', 'Hello', 'Body')
+        pauses = []
+        outbox.send_pending(rate=10, sleep=pauses.append)
+        self.assertEqual(len(pauses), 3)
+        self.assertTrue(all(0.05 < pause <= 0.1 for pause in pauses[1:]))
+
+    def test_slow_batches_stay_leased_until_sent(self):
+        for n in range(3):
+            outbox.enqueue(f'member{n}@example.com', 'Hello', 'Body')
+        rate = 0.001  # Three sends take 3000s, well past CLAIM_LEASE
+        reclaimed = []
+
+        def another_worker_polls(pause):
+            # Just before the batch would be finished at this rate
+            later = timezone.now() + timedelta(seconds=3 / rate - 1)
+            reclaimed.extend(outbox.claim_batch(now=later))
+
+        outbox.send_pending(rate=rate, sleep=another_worker_polls)
+        self.assertEqual(reclaimed, [])
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(outbox.claim_lease(100, 0.1), outbox.CLAIM_LEASE + timedelta(seconds=1000))
+
+    def test_command_drains_the_outbox_in_batches(self):
+        for n in range(5):
+            outbox.enqueue(f'member{n}@example.com', 'Hello', 'Body')
+        call_command('send_outbox', '--batch-size', '2', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertFalse(OutboundEmail.objects.filter(status=OutboundEmail.PENDING).exists())
+
+
+class MemberImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.secretary = User.objects.create_user('secretary', 'secretary@example.com', 'pass')
+        cls.secretary.profile.role = 'FS'
+        cls.secretary.profile.save()
+
+    def upload(self, rows, send_invite=True):
+        lines = ['Email,First_Name,Last_Name,Role'] + rows
+        csv_file = SimpleUploadedFile('members.csv', '\n'.join(lines).encode('utf-8-sig'), content_type='text/csv')
+        data = {'csv_file': csv_file}
+        if send_invite:
+            data['send_invite'] = 'on'
+        self.client.force_login(self.secretary)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('users:bulk_upload_members'), data)
+        return queries
+
+    def test_import_creates_members_with_unusable_passwords(self):
+        self.upload(['ada@example.com,Ada,Lovelace,mem', 'alan@example.com,Alan,Turing,FS'])
+
+        ada = User.objects.select_related('profile').get(email='ada@example.com')
+        self.assertFalse(ada.has_usable_password())
+        self.assertFalse(ada.is_active)
+        self.assertEqual(ada.profile.role, 'MEM')
+        self.assertEqual(ada.profile.invitations.get().status, Invitation.PENDING)
+        self.assertEqual(User.objects.get(email='alan@example.com').profile.role, 'FS')
+        self.assertEqual(OutboundEmail.objects.filter(to_email__in=['ada@example.com', 'alan@example.com']).count(), 2)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        small = self.upload([f'small{n}@example.com,Small,Member{n},MEM' for n in range(3)])
+        large = self.upload([f'large{n}@example.com,Large,Member{n},MEM' for n in range(60)])
+
+        self.assertEqual(User.objects.filter(email__startswith='large').count(), 60)
+        self.assertEqual(len(large), len(small))
+
+    def test_error_report(self):
+        self.upload([
+            'new@example.com,New,Member,MEM',
+            'SECRETARY@example.com,Taken,Address,MEM',
+            'new@example.com,Same,Again,MEM',
+            'not-an-email,Bad,Address,MEM',
+            'other@example.com,Bad,Role,BOSS',
+            ',No,Email,MEM',
+        ])
+        self.assertTrue(User.objects.filter(email='new@example.com').exists())
+        self.assertEqual(User.objects.count(), 2)
+
+        response = self.client.get(reverse('users:member_import_report'))
+        report = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(report[0], 'Row,Email,Error')
+        self.assertEqual([line.split(',')[0] for line in report[1:]], ['3', '4', '5', '6', '7'])
+        self.assertIn('already exists', report[1])
+        self.assertIn('more than once', report[2])
+
+    def test_over_long_email_is_reported_on_its_own_row(self):
+        long_email = f"{'a' * 60}@{'b' * 60}.{'c' * 60}.example.com"  # Valid, but longer than a username
+        self.upload(['one@example.com,One,Member,MEM', f'{long_email},Long,Address,MEM', 'two@example.com,Two,Member,MEM'])
+        self.assertEqual(User.objects.filter(email__in=['one@example.com', 'two@example.com']).count(), 2)
+
+        response = self.client.get(reverse('users:member_import_report'))
+        report = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(report), 2)
+        self.assertTrue(report[1].startswith(f'3,{long_email},Email address is longer than 150'))
+
+
+class RoleResolutionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.secretary = User.objects.create_user('secretary', 'secretary@example.com', 'pass')
+        cls.secretary.profile.role = 'FS'
+        cls.secretary.profile.save()
+        cls.chair = User.objects.create_user('chair', 'chair@example.com', 'pass')
+        cls.chair.profile.role = 'ADM'
+        cls.chair.profile.save()
+        cls.member = User.objects.create_user('member', 'member@example.com', 'pass')
+
+    def test_user_and_profile_load_in_one_query(self):
+        self.client.force_login(self.secretary)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('users:member_management'))
+        self.assertEqual(response.status_code, 200)
+
+        user_queries = [query['sql'] for query in queries if 'FROM "users_user"' in query['sql']]
+        self.assertEqual(len(user_queries), 1)
+        self.assertIn('"users_profile"', user_queries[0])
+        self.assertFalse([query for query in queries if 'FROM "users_profile"' in query['sql']])
+
+    def test_role_checks(self):
+        dashboard = reverse('finances:financial_dashboard')
+        for user, allowed in ((self.secretary, True), (self.chair, True), (self.member, False)):
+            self.client.force_login(user)
+            self.assertEqual(self.client.get(dashboard).status_code == 200, allowed, user.username)
+
+        self.client.force_login(self.chair)
+        self.assertEqual(self.client.get(reverse('pages:create_announcement')).status_code, 200)
+        self.client.force_login(self.secretary)
+        self.assertNotEqual(self.client.get(reverse('pages:create_announcement')).status_code, 200)
+
+    def test_saving_the_profile_refreshes_the_cached_role(self):
+        user = User.objects.select_related('profile').get(pk=self.member.pk)
+        self.assertFalse(user.has_perm('finances.add_payment'))
+
+        user.profile.role = 'ADM'
+        user.profile.save()
+        with self.assertNumQueries(0):
+            self.assertTrue(user.is_admin)
+            self.assertTrue(user.has_perm('finances.add_payment'))
+
+
+class MemberDirectoryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.secretary = User.objects.create_user('secretary', 'secretary@example.com', 'pass', first_name='Sade', last_name='Bello')
+        cls.secretary.profile.role = 'FS'
+        cls.secretary.profile.save()
+        for n, (first, last) in enumerate([('Ada', 'Okafor'), ('Ade', 'Okafor'), ('Bola', 'Adeyemi'), ('Chidi', 'Eze'), ('Ngozi', 'Okafor')]):
+            user = User.objects.create_user(f'member{n}', f'member{n}@example.com', 'pass', first_name=first, last_name=last)
+            user.profile.city = 'Enugu' if n % 2 else 'Lagos'
+            user.profile.phone_number = f'080300000{n}'
+            user.profile.save()
+        middle = User.objects.get(username='member3')
+        middle.middle_name = 'Kelechi'
+        middle.save()
+        Due.objects.create(member=User.objects.get(username='member4').profile, amount_due=Decimal('10.00'), description='Levy', due_date=date(2025, 1, 1))
+
+    def names(self, profiles):
+        return [profile.user.first_name for profile in profiles]
+
+    def test_search_spans_names_email_city_and_phone(self):
+        self.assertEqual(self.names(directory_profiles('okafor')), ['Ada', 'Ade', 'Ngozi'])
+        self.assertEqual(self.names(directory_profiles('okafor enugu')), ['Ade'])
+        self.assertEqual(self.names(directory_profiles('kelechi')), ['Chidi'])
+        self.assertEqual(self.names(directory_profiles('member2@')), ['Bola'])
+        self.assertEqual(self.names(directory_profiles('0803000004')), ['Ngozi'])
+        # Anywhere in a field, any case: Adeyemi, Sade, Ade
+        self.assertEqual(self.names(directory_profiles('ADE')), ['Bola', 'Sade', 'Ade'])
+
+    def test_filters(self):
+        self.assertEqual(self.names(directory_profiles(role='FS')), ['Sade'])
+        self.assertEqual(self.names(directory_profiles(overdue=True)), ['Ngozi'])
+        self.assertEqual(len(directory_profiles(status='SUS')), 0)
+
+    def test_keyset_pages_cover_every_member_once(self):
+        profiles = directory_profiles()
+        seen, cursor = [], None
+        while True:
+            with self.assertNumQueries(1):
+                rows, cursor = directory_page(profiles, cursor, page_size=2)
+            seen += self.names(rows)
+            if cursor is None:
+                break
+        self.assertEqual(seen, ['Bola', 'Sade', 'Chidi', 'Ada', 'Ade', 'Ngozi'])
+
+    def test_view(self):
+        self.client.force_login(self.secretary)
+        url = reverse('users:member_list')
+        response = self.client.get(url, {'q': 'okafor', 'cursor': 'garbage'})
+        self.assertEqual(self.names(response.context['profiles']), ['Ada', 'Ade', 'Ngozi'])
+        self.assertIsNone(response.context['next_cursor'])
+
+
+class InvitationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.secretary = User.objects.create_user('secretary', 'secretary@example.com', 'pass')
+        cls.secretary.profile.role = 'FS'
+        cls.secretary.profile.save()
+        cls.invitee = User.objects.create_user('invitee@example.com', 'invitee@example.com', is_active=False)
+
+    def accept(self, token):
+        return self.client.post(reverse('users:accept_invitation', args=[token]), {
+            'username': 'invitee', 'email': 'invitee@example.com', 'first_name': 'In', 'last_name': 'Vitee',
+            'password': 'a-long-passphrase', 'password_confirm': 'a-long-passphrase',
+        })
+
+    def test_only_the_hash_is_stored_and_the_token_works_once(self):
+        invitation, token = invitations.issue(self.invitee.profile)
+        self.assertNotEqual(invitation.token_hash, token)
+        self.assertFalse(Invitation.objects.filter(token_hash=token).exists())
+
+        self.assertEqual(self.accept(token).status_code, 302)
+        self.invitee.refresh_from_db()
+        self.assertTrue(self.invitee.is_active)
+        self.assertTrue(self.invitee.check_password('a-long-passphrase'))
+        self.assertEqual(Invitation.objects.get(pk=invitation.pk).status, Invitation.ACCEPTED)
+
+        self.client.logout()
+        self.assertIsNone(invitations.find_pending(token))
+
+    def test_concurrent_accepts_change_the_user_once(self):
+        _, token = invitations.issue(self.invitee.profile)
+        stale = invitations.find_pending(token)  # What a second request read before the first committed
+        self.assertEqual(self.accept(token).status_code, 302)
+        self.client.logout()
+
+        with mock.patch.object(invitations, 'find_pending', return_value=stale):
+            response = self.client.post(reverse('users:accept_invitation', args=[token]), {
+                'username': 'intruder', 'email': 'invitee@example.com', 'first_name': 'In', 'last_name': 'Truder',
+                'password': 'another-passphrase', 'password_confirm': 'another-passphrase',
+            })
+        self.assertRedirects(response, reverse('login'), fetch_redirect_response=False)
+        self.invitee.refresh_from_db()
+        self.assertEqual(self.invitee.username, 'invitee')
+        self.assertTrue(self.invitee.check_password('a-long-passphrase'))
+        self.assertFalse(invitations.accept(stale))
+
+    def test_bulk_invites_leave_no_users_behind_when_queueing_fails(self):
+        self.client.force_login(self.secretary)
+        with mock.patch('users.views.enqueue_many', side_effect=RuntimeError('outbox down')):
+            self.client.post(reverse('users:send_bulk_invites'), {'emails': 'a@example.com\nsecretary@example.com\nb@example.com'})
+        self.assertFalse(User.objects.filter(email__in=['a@example.com', 'b@example.com']).exists())
+        self.assertFalse(Invitation.objects.exists())
+
+        self.client.post(reverse('users:send_bulk_invites'), {'emails': 'a@example.com\nsecretary@example.com\nb@example.com'})
+        invited = Invitation.objects.filter(status=Invitation.PENDING).values_list('profile__user__email', flat=True)
+        self.assertEqual(sorted(invited), ['a@example.com', 'b@example.com'])
+
+    def test_only_never_activated_members_can_be_reinvited(self):
+        self.client.force_login(self.secretary)
+        deactivated = User.objects.create_user('former', 'former@example.com', 'pass', is_active=False)
+        logged_in = User.objects.create_user('lapsed@example.com', 'lapsed@example.com', is_active=False)
+        User.objects.filter(pk=logged_in.pk).update(last_login=timezone.now())
+
+        for user in (deactivated, logged_in):
+            self.client.post(reverse('users:resend_invitation', args=[user.pk]))
+            self.assertFalse(Invitation.objects.filter(profile__user=user).exists())
+        self.client.post(reverse('users:resend_invitation', args=[self.invitee.pk]))
+        self.assertTrue(Invitation.objects.filter(profile__user=self.invitee, status=Invitation.PENDING).exists())
+
+    def test_resend_replaces_and_revoke_cancels(self):
+        _, first = invitations.issue(self.invitee.profile)
+        self.client.force_login(self.secretary)
+        self.client.post(reverse('users:resend_invitation', args=[self.invitee.pk]))
+
+        self.assertIsNone(invitations.find_pending(first))
+        self.assertEqual(OutboundEmail.objects.filter(to_email='invitee@example.com').count(), 1)
+        pending = Invitation.objects.get(profile=self.invitee.profile, status=Invitation.PENDING)
+
+        self.client.post(reverse('users:revoke_invitation', args=[self.invitee.pk]))
+        pending.refresh_from_db()
+        self.assertEqual(pending.status, Invitation.REVOKED)
+
+    def test_expired_tokens_are_refused(self):
+        invitation, token = invitations.issue(self.invitee.profile)
+        Invitation.objects.filter(pk=invitation.pk).update(expires_at=timezone.now() - timedelta(minutes=1))
+        self.assertIsNone(invitations.find_pending(token))
+        self.accept(token)
+        self.invitee.refresh_from_db()
+        self.assertFalse(self.invitee.is_active)
+
+    def test_sweep(self):
+        long_ago = timezone.now() - invitations.PURGE_AFTER - timedelta(days=1)
+        stale_user = User.objects.create_user('stale@example.com', 'stale@example.com', is_active=False)
+        owing_user = User.objects.create_user('owing@example.com', 'owing@example.com', is_active=False)
+        Due.objects.create(member=owing_user.profile, amount_due=Decimal('5.00'), description='Levy', due_date=date(2025, 1, 1))
+        for user in (stale_user, owing_user):
+            invitation, _ = invitations.issue(user.profile)
+            Invitation.objects.filter(pk=invitation.pk).update(expires_at=long_ago)
+        current, _ = invitations.issue(self.invitee.profile)
+
+        call_command('sweep_invitations', '--batch-size', '1', '--delete-users', stdout=StringIO())
+
+        self.assertFalse(User.objects.filter(pk=stale_user.pk).exists())
+        # Members with ledger entries are kept; their old invitation is purged
+        self.assertTrue(User.objects.filter(pk=owing_user.pk).exists())
+        self.assertFalse(Invitation.objects.filter(profile=owing_user.profile).exists())
+        self.assertEqual(Invitation.objects.get(pk=current.pk).status, Invitation.PENDING)
+
+
+def statements(queries):
+    """(verb, table) of each captured query, leaving out savepoints."""
+    result = []
+    for query in queries:
+        sql = query['sql']
+        if 'SAVEPOINT' in sql:
+            continue
+        table = sql.split('"')[1] if sql.startswith(('INSERT', 'UPDATE')) else sql.split(' FROM "')[1].split('"')[0]
+        result.append((sql.split()[0], table))
+    return result
+
+
+class ProvisioningTests(TestCase):
+    def test_create_user_inserts_user_and_profile_only(self):
+        with CaptureQueriesContext(connection) as queries:
+            user = User.objects.create_user('ada', 'ada@example.com', 'pass', role='FS')
+        self.assertEqual(statements(queries), [('INSERT', 'users_user'), ('INSERT', 'users_profile')])
+        with self.assertNumQueries(0):
+            self.assertEqual(user.profile.role, 'FS')
+
+    async def test_async_creation_provisions_the_profile(self):
+        user = await User.objects.acreate_user('ada', 'ada@example.com', 'pass', role='FS')
+        admin = await User.objects.acreate_superuser('root', 'root@example.com', 'pass')
+        self.assertEqual(user.profile.role, 'FS')
+        self.assertTrue(await Profile.objects.filter(user=admin).aexists())
+
+    def test_user_update_is_one_statement(self):
+        user = User.objects.create_user('ada', 'ada@example.com', 'pass')
+        user = User.objects.get(pk=user.pk)
+        user.first_name = 'Ada'
+        with CaptureQueriesContext(connection) as queries:
+            user.save()
+        self.assertEqual(statements(queries), [('UPDATE', 'users_user')])
+
+    def test_login_touches_the_user_row_twice(self):
+        User.objects.create_user('ada', 'ada@example.com', 'pass')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('login'), {'username': 'ada', 'password': 'pass'})
+        user_statements = [statement for statement in statements(queries) if statement[1].startswith('users_')]
+        # authenticate() reads the user; login() stamps last_login; no profile queries
+        self.assertEqual(user_statements, [('SELECT', 'users_user'), ('UPDATE', 'users_user')])
+
+    def test_bulk_creation_is_two_inserts(self):
+        with CaptureQueriesContext(connection) as queries:
+            profiles = bulk_create_users(
+                [User(username=f'member{n}', email=f'member{n}@example.com') for n in range(50)],
+                [{'role': 'MEM', 'city': 'Lagos'} for _ in range(50)],
+            )
+        self.assertEqual(statements(queries), [('INSERT', 'users_user'), ('INSERT', 'users_profile')])
+        self.assertEqual(len({profile.pk for profile in profiles}), 50)
+        self.assertEqual(Profile.objects.filter(city='Lagos', user__username__startswith='member').count(), 50)
+
+    def test_ensure_profiles_backfills(self):
+        user = User(username='raw', email='raw@example.com')
+        user.save()  # Saved directly, bypassing create_user
+        self.assertEqual(ensure_profiles(), 1)
+        self.assertEqual(ensure_profiles(), 0)
+        self.assertTrue(Profile.objects.filter(user=user).exists())
@@ -19,7 +19,9 @@ urlpatterns = [
     path('admin/members/<int:user_id>/delete/', views.delete_member, name='delete_member'),
     path('admin/members/management/', views.member_management, name='member_management'),
     path('admin/members/add/', views.add_single_member, name='add_single_member'),
+    path('admin/members/lookup/', views.member_lookup, name='member_lookup'),  # JSON: autocomplete
     path('admin/members/bulk-upload/', views.bulk_upload_members, name='bulk_upload_members'),
+    path('admin/members/bulk-upload/report/', views.member_import_report, name='member_import_report'),
     path('admin/members/send-invites/', views.send_bulk_invites, name='send_bulk_invites'),
     path('admin/members/financial-report/', views.financial_report, name='financial_report'),
 
@@ -28,4 +30,6 @@ urlpatterns = [
 
     # Invitation URLs
     path('accept-invitation/<str:token>/', views.accept_invitation, name='accept_invitation'),
+    path('admin/members/<int:user_id>/invitation/resend/', views.resend_invitation, name='resend_invitation'),
+    path('admin/members/<int:user_id>/invitation/revoke/', views.revoke_invitation, name='revoke_invitation'),
 ]
\ No newline at end of file
@@ -3,28 +3,25 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
-from django.core.mail import send_mail
-from django.conf import settings
 from django.template.loader import render_to_string
-from django.utils.crypto import get_random_string
 from django.db import transaction
-import csv
-from io import StringIO
 import logging  # Add logging
 from .forms import ProfileUpdateForm, AdminProfileUpdateForm, ProfileCompletionForm, MemberInvitationForm, BulkMemberInvitationForm
 from .models import Profile, User
-from finances.models import Payment, Due
-from django.db.models import Sum, F, DecimalField
-from django.db.models.functions import Coalesce
-from decimal import Decimal
+from .directory import directory_page, directory_profiles
+from .lookup import lookup_members
+from .member_import import import_members, report_rows
+from .outbox import enqueue, enqueue_many
+from . import invitations
+from finances.history import history_context
+from finances.reports import ReportSummary, report_profiles, financial_report_rows, stream_csv
 from django.utils import timezone
-from datetime import timedelta
 from django.core.exceptions import PermissionDenied
 from django.views.decorators.csrf import csrf_protect
 from django.contrib.auth import get_user_model, login, authenticate
 from django.contrib.auth.hashers import make_password
 from django.utils.html import strip_tags
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from django.urls import reverse_lazy, reverse
 from django.views.generic import ListView, DetailView, UpdateView, CreateView, DeleteView
 from django.views.generic.edit import FormView
@@ -36,15 +33,12 @@ from django.contrib.auth.mixins import UserPassesTestMixin
 from django.views import View
 from .decorators import admin_required, financial_secretary_required
 from .mixins import AdminRequiredMixin, FinancialSecretaryRequiredMixin
+from .roles import is_admin, is_financial_secretary_or_admin
 
 logger = logging.getLogger(__name__)  # Add logger
 
 # --- Permission Helper Functions ---
-def is_admin(user):
-    return user.is_authenticated and user.is_admin
-
-def is_financial_secretary_or_admin(user):
-    return user.is_authenticated and (user.profile.role == 'FS' or user.profile.role == 'ADM' or user.is_superuser)
+# Answered from request.user.role, loaded with the user (see users.roles)
 
 # --- Member Views ---
 
@@ -54,33 +48,30 @@ def profile_view(request, username=None):
     if username:
         # Viewing another user's profile
         target_user = get_object_or_404(User, username=username)
-        if not (request.user.profile.role == 'ADM' or request.user == target_user):
+        if not (request.user.is_admin or request.user == target_user):
             raise PermissionDenied("You don't have permission to view this profile.")
-        user_profile = target_user.profile
         is_viewing_own_profile = False
     else:
         # Viewing own profile
-        user_profile = request.user.profile
+        target_user = request.user
         is_viewing_own_profile = True
 
-    # Calculate financial status
-    payments = Payment.objects.filter(member=user_profile)
-    dues = Due.objects.filter(member=user_profile)
+    # Profile and financial totals in one query
+    user_profile = Profile.objects.select_related('user').with_financials().get(user=target_user)
 
-    total_paid = payments.aggregate(total=Coalesce(Sum('amount_paid'), 0, output_field=DecimalField()))['total']
-    total_due = dues.aggregate(total=Coalesce(Sum('amount_due'), 0, output_field=DecimalField()))['total']
+    total_paid = user_profile.total_payments
+    total_due = user_profile.total_dues
     balance = total_paid - total_due  # Positive balance means overpaid, negative means owing
 
     context = {
         'profile': user_profile,
-        'payments': payments.order_by('-payment_date'),
-        'dues': dues.order_by('-due_date'),
         'total_paid': total_paid,
         'total_due': total_due,
         'balance': balance,
         'is_viewing_own_profile': is_viewing_own_profile,
-        'is_admin': request.user.profile.role == 'ADM'
+        'is_admin': request.user.is_admin
     }
+    context.update(history_context(user_profile))
     return render(request, 'users/profile_detail.html', context)
 
 @login_required
@@ -121,33 +112,43 @@ def profile_edit(request, username=None):
 
 @user_passes_test(is_financial_secretary_or_admin)
 def member_list(request):
-    """Admin/FS view to list all members with their financial balance."""
-    # First get all non-superuser profiles
-    profiles = Profile.objects.select_related('user') \
-        .exclude(user__is_superuser=True) \
-        .filter(user__is_superuser=False) \
-        .annotate(
-            total_dues=Coalesce(
-                Sum('dues__amount_due', distinct=True),
-                Decimal('0.00'),
-                output_field=DecimalField()
-            ),
-            total_payments=Coalesce(
-                Sum('payments__amount_paid', distinct=True),
-                Decimal('0.00'),
-                output_field=DecimalField()
-            )
-        ) \
-        .annotate(
-            balance=F('total_dues') - F('total_payments') # Dues - Payments (Positive = Owed)
-        ) \
-        .order_by('user__last_name', 'user__first_name')
+    """Admin/FS member directory: search, filters and keyset pages, with each member's balance."""
+    query = request.GET.get('q', '').strip()
+    role = request.GET.get('role', '') if request.GET.get('role') in dict(Profile.ROLES) else ''
+    status = request.GET.get('status', '') if request.GET.get('status') in dict(Profile.STATUS_CHOICES) else ''
+    overdue = request.GET.get('overdue') == '1'
+
+    # Balances come from the finances ledger table, so this is one row per member
+    profiles = directory_profiles(query, role=role, status=status, overdue=overdue)
+    try:
+        profiles, next_cursor = directory_page(profiles, cursor=request.GET.get('cursor') or None)
+    except ValueError:
+        messages.error(request, 'That page link is no longer valid; showing the first page.')
+        profiles, next_cursor = directory_page(profiles)
 
-    context = {'profiles': profiles}
+    filters = request.GET.copy()
+    filters.pop('cursor', None)
+    context = {
+        'profiles': profiles,
+        'next_cursor': next_cursor,
+        'is_first_page': not request.GET.get('cursor'),
+        'filter_query': filters.urlencode(),
+        'q': query,
+        'role': role,
+        'status': status,
+        'overdue': overdue,
+        'roles': Profile.ROLES,
+        'statuses': Profile.STATUS_CHOICES,
+    }
     return render(request, 'users/member_list_admin.html', context)
 
+@user_passes_test(is_financial_secretary_or_admin)
+def member_lookup(request):
+    """JSON list of active members matching ?q= for the autocomplete member picker."""
+    return JsonResponse({'results': lookup_members(request.GET.get('q', ''))})
+
 @login_required
-@user_passes_test(lambda u: u.profile.role == 'ADM')
+@user_passes_test(is_admin)
 def toggle_member_access(request, user_id):
     """Admin view to toggle User.is_active"""
     target_user = get_object_or_404(User, pk=user_id)
@@ -170,23 +171,19 @@ def toggle_member_access(request, user_id):
 @user_passes_test(is_financial_secretary_or_admin)
 def member_financial_detail(request, user_id):
     """FS/Admin view of a specific member's financial details"""
-    target_user = get_object_or_404(User, pk=user_id)
-    profile = target_user.profile
+    profile = get_object_or_404(Profile.objects.select_related('user').with_financials(), user_id=user_id)
 
-    payments = Payment.objects.filter(member=profile)
-    dues = Due.objects.filter(member=profile)
-    total_paid = payments.aggregate(total=Coalesce(Sum('amount_paid'), 0, output_field=DecimalField()))['total']
-    total_due = dues.aggregate(total=Coalesce(Sum('amount_due'), 0, output_field=DecimalField()))['total']
+    total_paid = profile.total_payments
+    total_due = profile.total_dues
     balance = total_paid - total_due
 
     context = {
         'member_profile': profile,
-        'payments': payments.order_by('-payment_date'),
-        'dues': dues.order_by('-due_date'),
         'total_paid': total_paid,
         'total_due': total_due,
         'balance': balance,
     }
+    context.update(history_context(profile))
     # Could use a different template from member's own view if needed
     return render(request, 'users/member_financial_detail_fs.html', context)
 
@@ -214,7 +211,10 @@ def update_member_status(request, profile_id):
 @csrf_protect
 def member_management(request):
     """Admin/FS view for managing members and sending invitations."""
-    return render(request, 'users/member_management.html')
+    report = request.session.get(MEMBER_IMPORT_REPORT_SESSION_KEY)
+    return render(request, 'users/member_management.html', {
+        'import_report': report if report and report['errors'] else None,
+    })
 
 @user_passes_test(is_financial_secretary_or_admin)
 @csrf_protect
@@ -249,77 +249,45 @@ def add_single_member(request):
                 return redirect('users:member_management')
 
             with transaction.atomic():
-                # Create user with temporary password
-                temp_password = get_random_string(12)
+                # No password until the invitation is accepted
                 user = User.objects.create_user(
                     username=email,
                     email=email,
-                    password=temp_password,
+                    password=None,
                     first_name=first_name,
                     last_name=last_name,
-                    is_active=True
+                    is_active=not send_invite,  # Invited members are activated by accepting
+                    role=role,  # Profile is created with the user (users.provisioning)
                 )
-
-                profile = user.profile # Get the profile created by the signal
-                profile.role = role # Set the role specified in the form
-
-                email_sent_successfully = False # Flag to track email status
-                email_error_message = None # Store specific email error
+                profile = user.profile
 
                 if send_invite:
-                    try:
-                        # Prepare email context
-                    
-                        profile.invitation_token = get_random_string(32)
-                        profile.invitation_sent_at = timezone.now()
-                        context = {
-                            'first_name': first_name,
-                            'last_name': last_name,
-                            'email': email,
-                            'invitation_link': request.build_absolute_uri(f'/users/accept-invitation/{profile.invitation_token}/'),
-                        '   site_url': request.build_absolute_uri('/')
-                        }
-                        # Render email body
-                        message = render_to_string('users/email/invitation_email.txt', context)
-                        # Attempt to send email
-                        send_mail(
-                            'Welcome to FC92 Club',
-                            message,
-                            settings.DEFAULT_FROM_EMAIL,
-                            [email],
-                            fail_silently=False,
-                        )
-                        email_sent_successfully = True # Mark as success if no exception
-
-                    except Exception as email_error: # Catch ANY exception during email process
-                        # Log the specific email error for debugging
-                        print(f"ERROR sending invitation email to {email}: {email_error}")
-                        # Optionally use logging module: import logging; logging.exception(f"ERROR sending invitation email to {email}")
-                        email_error_message = str(email_error) # Store error message for user feedback
-
-                profile.save() # Save the profile changes (role, token, sent_at)
+                    _, token = invitations.issue(profile, created_by=request.user)
+                    # Queued in the same transaction, so there's no invitation without its member
+                    enqueue(**invitations.invitation_email(
+                        user,
+                        request.build_absolute_uri(reverse('users:accept_invitation', args=[token])),
+                        request.build_absolute_uri('/'),
+                    ))
          # Display messages outside the transaction block
             messages.success(request, f'Member {first_name} {last_name} added successfully.')
             if send_invite:
-                if email_sent_successfully:
-                    messages.info(request, 'Invitation email sent.')
-                else:
-                    # Provide specific feedback if email failed
-                    messages.warning(request, f'Member added, but failed to send invitation email: {email_error_message or "Unknown error"}')
+                messages.info(request, 'Invitation email queued for sending.')
 
         except Exception as e: # Catch other potential errors (e.g., user creation)
-             # Avoid catching the email error again if it was already handled
-            if 'email_error' not in locals() or e is not email_error:
-                 messages.error(request, f'Error adding member: {str(e)}')
+            messages.error(request, f'Error adding member: {str(e)}')
 
 
     return redirect('users:member_management')
 
+MEMBER_IMPORT_REPORT_SESSION_KEY = 'users_member_import_report'
+
 #@login_required
 #@admin_required # Ensure only admins can access
 @user_passes_test(is_financial_secretary_or_admin)
 @csrf_protect
 def bulk_upload_members(request):
+    """Import members from a CSV file; rows that fail are kept for download as an error report."""
     if request.method == 'POST':
         csv_file = request.FILES.get('csv_file')
         send_invite = request.POST.get('send_invite') == 'on'
@@ -329,148 +297,51 @@ def bulk_upload_members(request):
             return redirect('users:member_management')
 
         try:
-            # Decode CSV file
-            # Try detecting BOM and using utf-8-sig
-            try:
-                data_set = csv_file.read().decode('utf-8-sig')
-            except UnicodeDecodeError:
-                csv_file.seek(0)  # Reset file pointer
-                data_set = csv_file.read().decode('utf-8')  # Fallback to utf-8
-
-            io_string = StringIO(data_set)
-            reader = csv.DictReader(io_string)
-
-            # --- Start Modification ---
-
-            # Normalize headers read from the file (lowercase, strip whitespace)
-            actual_headers = [h.strip().lower() for h in reader.fieldnames] if reader.fieldnames else []
-            logger.debug(f"Actual CSV headers (normalized): {actual_headers}")  # Log headers
-
-            required_headers = ['email', 'first_name', 'last_name', 'role']  # Keep these lowercase
-
-            # Check if all required headers (lowercase) are present in the normalized actual headers
-            missing_headers = [h for h in required_headers if h not in actual_headers]
-
-            if missing_headers:
-                # Report the missing headers based on the required list
-                messages.error(request, f"CSV file is missing or has incorrectly named required headers: {', '.join(missing_headers)}. Please ensure headers are exactly 'email', 'first_name', 'last_name', 'role' (case-insensitive). Found headers: {', '.join(reader.fieldnames or [])}")
-                return redirect('users:member_management')
-
-            # Process rows into a list of dicts with normalized keys for consistent access
-            processed_rows = []
-            for row in reader:
-                # Normalize keys and strip values in each row
-                normalized_row = {key.strip().lower(): value.strip() for key, value in row.items()}
-                processed_rows.append(normalized_row)
-
-            # --- End Modification ---
-
-            created_count = 0
-            skipped_count = 0
-            error_list = []
-
-            # Iterate through the processed rows with normalized keys
-            for row_num, row in enumerate(processed_rows, start=2):
-                # Access data using lowercase keys
-                email = row.get('email', '')
-                first_name = row.get('first_name', '')
-                last_name = row.get('last_name', '')
-                # Get original role value for error message if needed, but process normalized
-                original_role = row.get('role', '')
-                role = original_role.upper()  # Normalize role for comparison
-
-                # Basic validation for essential fields
-                if not email or not first_name or not last_name or not role:
-                    error_list.append(f"Row {row_num}: Missing essential data (email, first_name, last_name, role).")
-                    skipped_count += 1
-                    continue
-
-                if role not in dict(Profile.ROLES):  # Validate role
-                    error_list.append(f"Row {row_num}: Invalid role '{original_role}'. Must be one of {list(dict(Profile.ROLES).keys())}.")
-                    skipped_count += 1
-                    continue
-
-                if User.objects.filter(email=email).exists():
-                    error_list.append(f"Row {row_num}: User with email {email} already exists.")
-                    skipped_count += 1
-                    continue
-
-                try:
-                    with transaction.atomic():
-                        # Create user with temporary password
-                        temp_password = get_random_string(12)
-                        user = User.objects.create_user(
-                            username=email,  # Use email as initial username
-                            email=email,
-                            password=temp_password,
-                            first_name=first_name,
-                            last_name=last_name,
-                            is_active=not send_invite  # User needs to accept invite to activate
-                        )
-
-                        # Profile is created automatically by the signal
-                        # We just need to update the role
-                        profile = user.profile
-                        profile.role = role
-
-                        if send_invite:
-                            profile.invitation_token = get_random_string(32)
-                            profile.invitation_sent_at = timezone.now()
-                            profile.save()  # Save profile changes (role, token)
-
-                            # Send invitation email
-                            context = {
-                                'first_name': first_name,
-                                'last_name': last_name,
-                                'email': email,
-                                'invitation_link': request.build_absolute_uri(
-                                    reverse('users:accept_invitation', args=[profile.invitation_token])
-                                ),
-                                'site_url': request.build_absolute_uri('/')
-                            }
-                            message = render_to_string('users/email/invitation_email.txt', context)
-                            try:
-                                send_mail(
-                                    'Welcome to FC92 Club',
-                                    message,
-                                    settings.DEFAULT_FROM_EMAIL,
-                                    [email],
-                                    fail_silently=False,
-                                )
-                            except Exception as mail_error:
-                                # Log email error but continue processing other users
-                                logger.error(f"Failed to send invitation email to {email}: {mail_error}")
-                                error_list.append(f"Row {row_num}: User {email} created, but failed to send invitation email.")
-                                # Don't count as skipped, user was created
-                        else:
-                            profile.save()  # Save profile changes (role)
-
-                        created_count += 1
-
-                except Exception as e:
-                    error_list.append(f"Row {row_num}: Error processing {email}: {str(e)}")
-                    skipped_count += 1
-
-            # Display summary messages
-            if created_count > 0:
-                messages.success(request, f'{created_count} member(s) processed successfully.')
-            if skipped_count > 0:
-                messages.warning(request, f'{skipped_count} member(s) skipped due to errors.')
-            if error_list:
-                # Display specific errors (consider limiting the number shown)
-                for error in error_list[:10]:  # Show first 10 errors
-                    messages.error(request, error)
-                if len(error_list) > 10:
-                    messages.error(request, f"... and {len(error_list) - 10} more errors.")
-
+            result = import_members(
+                csv_file,
+                send_invite=send_invite,
+                invitation_url=lambda token: request.build_absolute_uri(reverse('users:accept_invitation', args=[token])),
+                site_url=request.build_absolute_uri('/'),
+                created_by=request.user,
+            )
+        except ValueError as e:
+            messages.error(request, str(e))
+            return redirect('users:member_management')
         except Exception as e:
             logger.error(f"Error processing CSV file: {e}", exc_info=True)  # Log full traceback
             messages.error(request, f'Error processing CSV file: {str(e)}')
+            return redirect('users:member_management')
 
-        return redirect('users:member_management')
+        request.session[MEMBER_IMPORT_REPORT_SESSION_KEY] = {
+            'file_name': csv_file.name,
+            'errors': result.errors,
+        }
+
+        # Display summary messages
+        if result.created:
+            messages.success(request, f'{result.created} member(s) processed successfully.')
+        if result.invited:
+            messages.info(request, f'{result.invited} invitation email(s) queued for sending.')
+        if result.errors:
+            messages.warning(request, f'{len(result.errors)} member(s) skipped due to errors. Download the error report for details.')
+            for row_number, email, error in result.errors[:10]:  # Show first 10 errors
+                messages.error(request, f"Row {row_number}: {error}")
+            if len(result.errors) > 10:
+                messages.error(request, f"... and {len(result.errors) - 10} more errors.")
 
     return redirect('users:member_management')
 
+@user_passes_test(is_financial_secretary_or_admin)
+def member_import_report(request):
+    """Download the per-row errors of the last member CSV import as CSV."""
+    report = request.session.get(MEMBER_IMPORT_REPORT_SESSION_KEY)
+    if not report:
+        messages.info(request, 'There is no member import report to download.')
+        return redirect('users:member_management')
+    response = StreamingHttpResponse(stream_csv(report_rows(report['errors'])), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="member_import_errors_{timezone.now():%Y-%m-%d}.csv"'
+    return response
+
 @user_passes_test(is_financial_secretary_or_admin)
 @csrf_protect
 def send_bulk_invites(request):
@@ -485,53 +356,42 @@ def send_bulk_invites(request):
             email_list = [email.strip() for email in emails.split('\n') if email.strip()]
             success_count = 0
             error_count = 0
-            
-            for email in email_list:
-                try:
-                    # Check if user already exists
-                    if User.objects.filter(email=email).exists():
-                        raise ValueError(f"User with email {email} already exists")
-                        
-                    # Create user with temporary password
-                    temp_password = get_random_string(12)
-                    user = User.objects.create_user(
-                        username=email,
-                        email=email,
-                        password=temp_password,
-                        is_active=True
-                    )
-                    
-                    profile = user.profile # Get the profile created by the signal
-                    profile.role = 'MEM' # Set the role specified in the form
-
-                    # Send invitation email
-                    profile.invitation_token = get_random_string(32)
-                    profile.invitation_sent_at = timezone.now()
-                    
-                    context = {
-                        'email': email,
-                        'invitation_link': request.build_absolute_uri(f'/users/accept-invitation/{profile.invitation_token}/'),
-                        'site_url': request.build_absolute_uri('/')
-                    }
-                    message = render_to_string('users/email/invitation_email.txt', context)
-                    send_mail(
-                        'Welcome to FC92 Club',
-                        message,
-                        settings.DEFAULT_FROM_EMAIL,
-                        [email],
-                        fail_silently=False,
+            profiles = []  # Invited together once every address is processed
+
+            # Users, invitations and emails commit together: an invitee is
+            # never left without an invitation to accept
+            with transaction.atomic():
+                for email in email_list:
+                    try:
+                        # Check if user already exists
+                        if User.objects.filter(email=email).exists():
+                            raise ValueError(f"User with email {email} already exists")
+
+                        # No password until the invitation is accepted
+                        user = User.objects.create_user(
+                            username=email,
+                            email=email,
+                            password=None,
+                            is_active=False
+                        )
+                        profiles.append(user.profile) # Created with the user, as a regular member
+
+                        success_count += 1
+                    except Exception as e:
+                        error_count += 1
+                        messages.error(request, f'Error sending invitation to {email}: {str(e)}')
+
+                site_url = request.build_absolute_uri('/')
+                enqueue_many(
+                    invitations.invitation_email(
+                        profile.user, request.build_absolute_uri(reverse('users:accept_invitation', args=[token])), site_url,
                     )
-                    profile.save() # Save the profile changes (role, token, sent_at)
-                    
-                    success_count += 1
-                except Exception as e:
-                    error_count += 1
-                    messages.error(request, f'Error sending invitation to {email}: {str(e)}')
-            
+                    for profile, (_, token) in zip(profiles, invitations.issue_many(profiles, created_by=request.user))
+                )
             if success_count > 0:
-                messages.success(request, f'Successfully sent {success_count} invitation(s).')
+                messages.success(request, f'Queued {success_count} invitation(s) for sending.')
             if error_count > 0:
-                messages.warning(request, f'Failed to send {error_count} invitation(s).')
+                messages.warning(request, f'Failed to invite {error_count} member(s).')
                 
         except Exception as e:
             messages.error(request, f'Error processing invitations: {str(e)}')
@@ -539,7 +399,7 @@ def send_bulk_invites(request):
     return redirect('users:member_management')
 
 @login_required
-@user_passes_test(lambda u: u.profile.role == 'ADM')
+@user_passes_test(is_admin)
 def delete_member(request, user_id):
     """Admin view to delete a member and their profile."""
     target_user = get_object_or_404(User, pk=user_id)
@@ -566,98 +426,36 @@ def financial_report(request):
     download = request.GET.get('download', False)
 
     # Get all profiles excluding admins and superusers
-    profiles = Profile.objects.filter(
-        user__is_superuser=False,
-        user__is_staff=False
-    ).select_related('user').annotate(
-        total_dues=Coalesce(
-            Sum('dues__amount_due', distinct=True),
-            Decimal('0.00'),
-            output_field=DecimalField()
-        ),
-        total_payments=Coalesce(
-            Sum('payments__amount_paid', distinct=True),
-            Decimal('0.00'),
-            output_field=DecimalField()
-        )
-    ).annotate(
-        balance=F('total_dues') - F('total_payments')
-    ).order_by('user__last_name', 'user__first_name')
-
-    # Apply filter if specified
-    if filter_status == 'up_to_date':
-        profiles = profiles.filter(balance__lte=0)  # Balance <= 0 means up to date
-    elif filter_status == 'overdue':
-        profiles = profiles.filter(balance__gt=0)  # Balance > 0 means overdue
+    profiles = report_profiles(filter_status)
 
-    # Calculate totals
-    total_dues = profiles.aggregate(total=Sum('total_dues'))['total'] or Decimal('0.00')
-    total_payments = profiles.aggregate(total=Sum('total_payments'))['total'] or Decimal('0.00')
-    total_balance = total_dues - total_payments
+    # Handle download request: stream the CSV row by row, summary included
+    if download:
+        response = StreamingHttpResponse(
+            stream_csv(financial_report_rows(profiles)),
+            content_type='text/csv'
+        )
+        response['Content-Disposition'] = 'attachment; filename="financial_report.csv"'
+        return response
 
-    # Calculate up to date members count
-    up_to_date_count = profiles.filter(balance__lte=0).count()
-    total_members = profiles.count()
+    # Totals and counts in a single query
+    summary = ReportSummary.for_profiles(profiles)
 
     context = {
         'profiles': profiles,
-        'total_dues': total_dues,
-        'total_payments': total_payments,
-        'total_balance': total_balance,
+        'total_dues': summary.total_dues,
+        'total_payments': summary.total_payments,
+        'total_balance': summary.total_balance,
         'is_financial_secretary': request.user.profile.role == 'financial_secretary',
-        'up_to_date_count': up_to_date_count,
-        'total_members': total_members,
+        'up_to_date_count': summary.up_to_date_count,
+        'overdue_count': summary.overdue_count,
+        'total_members': summary.total_members,
         'filter_status': filter_status,
     }
 
-    # Handle download request
-    if download:
-        import csv
-        from django.http import HttpResponse
-        from io import StringIO
-
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="financial_report.csv"'
-
-        csv_buffer = StringIO()
-        writer = csv.writer(csv_buffer)
-        
-        # Write header
-        writer.writerow([
-            'Member Name',
-            'Total Dues (₦)',
-            'Total Payments (₦)',
-            'Balance (₦)',
-            'Status',
-            'Financial Status'
-        ])
-
-        # Write data
-        for profile in profiles:
-            writer.writerow([
-                profile.user.get_full_name(),
-                profile.total_dues,
-                profile.total_payments,
-                profile.balance,
-                profile.get_status_display(),
-                'Up to Date' if profile.balance <= 0 else 'Overdue'
-            ])
-
-        # Write summary
-        writer.writerow([])
-        writer.writerow(['Summary'])
-        writer.writerow(['Total Dues:', total_dues])
-        writer.writerow(['Total Payments:', total_payments])
-        writer.writerow(['Total Balance:', total_balance])
-        writer.writerow(['Up to Date Members:', f'{up_to_date_count}/{total_members}'])
-
-        response.write(csv_buffer.getvalue())
-        return response
-
     return render(request, 'users/financial_report.html', context)
 
 @login_required
-@user_passes_test(lambda u: u.profile.role == 'ADM')
+@user_passes_test(is_admin)
 def admin_reset_password(request, user_id):
     User = get_user_model()
     user = get_object_or_404(User, id=user_id)
@@ -681,18 +479,8 @@ def admin_reset_password(request, user_id):
         })
         plain_message = strip_tags(html_message)
         
-        try:
-            send_mail(
-                subject,
-                plain_message,
-                settings.DEFAULT_FROM_EMAIL,
-                [user.email],
-                html_message=html_message,
-                fail_silently=False,
-            )
-            messages.success(request, f'Password has been reset for {user.username}. An email has been sent with the new password.')
-        except Exception as e:
-            messages.error(request, f'Password was reset but email could not be sent: {str(e)}')
+        enqueue(user.email, subject, plain_message, html_body=html_message)
+        messages.success(request, f'Password has been reset for {user.username}. An email with the new password has been queued.')
         
         return redirect('users:member_list')
     
@@ -701,68 +489,91 @@ def admin_reset_password(request, user_id):
 @csrf_protect
 def accept_invitation(request, token):
     """Handle user accepting an invitation and completing their profile."""
-    try:
-        # Get profile by token, ensure token isn't expired (7 days)
-        profile = get_object_or_404(
-            Profile,
-            invitation_token=token,
-            invitation_sent_at__gte=timezone.now() - timedelta(days=7)
+    # One lookup on the hashed token's unique index; used, revoked and expired tokens don't match
+    invitation = invitations.find_pending(token)
+    if invitation is None:
+        messages.error(request, 'Invalid or expired invitation token.')
+        return redirect('login')
+    profile = invitation.profile
+    user = profile.user
+
+    if request.method == 'POST':
+        form = ProfileCompletionForm(
+            request.POST,
+            instance=profile,
+            user_instance=user
         )
-        user = profile.user
-
-        # If user is already active, redirect to login
-        if user.is_active:
-            messages.info(request, 'This invitation has already been used.')
-            return redirect('users:login')
-
-        if request.method == 'POST':
-            form = ProfileCompletionForm(
-                request.POST,
-                instance=profile,
-                user_instance=user
-            )
-            if form.is_valid():
-                try:
-                    with transaction.atomic():
-                        # Update User data first
-                        user.username = form.cleaned_data['username']
-                        user.email = form.cleaned_data['email']
-                        user.first_name = form.cleaned_data['first_name']
-                        user.middle_name = form.cleaned_data.get('middle_name', '')
-                        user.last_name = form.cleaned_data['last_name']
-                        user.set_password(form.cleaned_data['password'])
-                        user.is_active = True
-                        user.save()
-
-                        # Update Profile data
-                        profile = form.save(commit=False)
-                        profile.invitation_token = None
-                        profile.invitation_sent_at = None
-                        profile.save()
-
-                        # Create a new session
-                        request.session.create()
-                        
-                        # Log the user in
-                        login(request, user)
-                        
-                        messages.success(request, 'Welcome! Your profile has been created successfully.')
-                        return redirect('users:dashboard')
-
-                except Exception as e:
-                    messages.error(request, f'Error updating profile: {str(e)}')
-            else:
-                for field, errors in form.errors.items():
-                    for error in errors:
-                        messages.error(request, f'{field}: {error}')
+        if form.is_valid():
+            try:
+                with transaction.atomic():
+                    # Claim the invitation first; a second submission of the
+                    # same link finds it already accepted and changes nothing
+                    if not invitations.accept(invitation):
+                        messages.error(request, 'This invitation has already been used or has expired.')
+                        return redirect('login')
+
+                    user.username = form.cleaned_data['username']
+                    user.email = form.cleaned_data['email']
+                    user.first_name = form.cleaned_data['first_name']
+                    user.middle_name = form.cleaned_data.get('middle_name', '')
+                    user.last_name = form.cleaned_data['last_name']
+                    user.set_password(form.cleaned_data['password'])
+                    user.is_active = True
+                    user.save()
+
+                    # Update Profile data
+                    form.save()
+
+                    # Create a new session
+                    request.session.create()
+
+                    # Log the user in
+                    login(request, user)
+
+                    messages.success(request, 'Welcome! Your profile has been created successfully.')
+                    return redirect('pages:home')
+
+            except Exception as e:
+                messages.error(request, f'Error updating profile: {str(e)}')
         else:
-            form = ProfileCompletionForm(instance=profile, user_instance=user)
+            for field, errors in form.errors.items():
+                for error in errors:
+                    messages.error(request, f'{field}: {error}')
+    else:
+        form = ProfileCompletionForm(instance=profile, user_instance=user)
 
-        return render(request, 'users/accept_invitation.html', {
-            'form': form,
-            'token': token,
-        })
+    return render(request, 'users/accept_invitation.html', {
+        'form': form,
+        'token': token,
+    })
 
-    except Profile.DoesNotExist:
-        messages.error(request, 'Invalid or expired invitation token.')
-        return redirect('users:login')
+@user_passes_test(is_financial_secretary_or_admin)
+@csrf_protect
+def resend_invitation(request, user_id):
+    """Send a member who hasn't activated their account a new invitation; the old link stops working."""
+    target_user = get_object_or_404(User.objects.select_related('profile'), pk=user_id)
+    if request.method == 'POST':
+        if not invitations.can_reinvite(target_user):
+            messages.error(request, f'{target_user.email} has already activated their account.')
+            return redirect('users:member_list')
+        with transaction.atomic():
+            _, token = invitations.issue(target_user.profile, created_by=request.user)
+            enqueue(**invitations.invitation_email(
+                target_user,
+                request.build_absolute_uri(reverse('users:accept_invitation', args=[token])),
+                request.build_absolute_uri('/'),
+            ))
+        messages.success(request, f'A new invitation to {target_user.email} has been queued.')
+    return redirect('users:member_list')
+
+@user_passes_test(is_financial_secretary_or_admin)
+@csrf_protect
+def revoke_invitation(request, user_id):
+    """Cancel a member's outstanding invitation links."""
+    target_user = get_object_or_404(User.objects.select_related('profile'), pk=user_id)
+    if request.method == 'POST':
+        if invitations.revoke(target_user.profile):
+            messages.success(request, f'The invitation for {target_user.email} has been revoked.')
+        else:
+            messages.info(request, f'{target_user.email} has no pending invitation.')
+    return redirect('users:member_list')
@@ -0,0 +1,32 @@
+# users/widgets.py
+from django import forms
+from django.urls import reverse_lazy
+
+from .lookup import member_labels
+
+
+class MemberAutocompleteWidget(forms.Widget):
+    """
+    Member picker backed by users:member_lookup. Renders a hidden input with
+    the profile id and a text box that searches as the user types, so the
+    page never lists the whole membership. `labels` ({id: label}) can be
+    filled in by a form that has already looked the members up; otherwise
+    the selected member's label is read when rendering.
+    """
+    template_name = 'users/widgets/member_autocomplete.html'
+
+    class Media:
+        js = ('js/member_autocomplete.js',)
+
+    def __init__(self, attrs=None, labels=None):
+        super().__init__({'class': 'form-control', **(attrs or {})})
+        self.labels = labels
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        label = ''
+        if value not in (None, ''):
+            labels = self.labels if self.labels is not None else member_labels([value])
+            label = labels.get(int(value), '') if str(value).isdigit() else ''
+        context['widget'].update({'label': label, 'lookup_url': reverse_lazy('users:member_lookup')})
+        return context